@@ -0,0 +1,49 @@
+'''
+	offline benchmarks of georipe on synthetic data, run as modules from the repository root; every
+	benchmark is one JSON object per line, which "-compare" reads back from an earlier run:
+
+	python3 -m benchmarks -out before.jsonl
+	python3 -m benchmarks -compare before.jsonl
+
+	python3 -m benchmarks.geoip     GeoLite2 import, IP lookups, range, area and LIKE searches, KML/HTML
+	python3 -m benchmarks.rwhois    RIR dumps import, IP lookups, range and text searches
+	python3 -m benchmarks.rpsl      RPSL parser throughput
+'''
+import os
+import sys
+import json
+import time
+import contextlib
+
+
+def best(fn, repeat=3):
+	'''(seconds of the fastest of repeat calls of fn, what the last one returned)'''
+	seconds = None
+	for _ in range(repeat):
+		started = time.perf_counter()
+		result = fn()
+		elapsed = time.perf_counter() - started
+		seconds = elapsed if seconds is None else min(seconds, elapsed)
+	return seconds, result
+
+
+@contextlib.contextmanager
+def quiet():
+	'''progress which updates print goes nowhere'''
+	stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+	try:
+		yield
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+
+def result(benchmark, seconds, **fields):
+	'''JSON object of a benchmark: its name and seconds first, then the other fields by name'''
+	return dict( [('benchmark', benchmark), ('seconds', round(seconds, 4))] + sorted( fields.items() ) )
+
+
+def emit(results, out=None):
+	for line in results:
+		( out or sys.stdout ).write( json.dumps(line) + '\n' )
+	( out or sys.stdout ).flush()
@@ -0,0 +1,76 @@
+'''
+	all benchmarks at one scale, one JSON object per line: the environment first, then every benchmark;
+	-compare puts the seconds of an earlier run next to those of this one on stderr
+'''
+import sys
+import json
+
+SUITES = ('rpsl', 'geoip', 'rwhois')
+
+
+def environment(scale, repeat):
+	import os
+	import sqlite3
+	import platform
+	from georipe.geoip import __version__
+	from benchmarks import result
+	return result( 'environment', 0, python=platform.python_version(), sqlite=sqlite3.sqlite_version, platform=platform.platform(),
+		cpus=os.cpu_count(), scale=scale, repeat=repeat, georipe=__version__ )
+
+
+def suite(name, scale, repeat):
+	'''results of the benchmarks of one module, scale 1 is 200000 networks'''
+	if name == 'rpsl':
+		from benchmarks import rpsl
+		return [ rpsl.run( int(200000 * scale) ) ]
+	elif name == 'geoip':
+		from benchmarks import geoip
+		return geoip.run( int(200000 * scale), max( 100, int(5000 * scale) ), repeat )
+	elif name == 'rwhois':
+		from benchmarks import rwhois
+		return rwhois.run( int(200000 * scale), repeat )
+
+
+def compare(before, after, out=sys.stderr):
+	'''seconds of the benchmarks of two runs and their ratio, those of other environments are flagged'''
+	old = dict( [(line['benchmark'], line) for line in before] )
+	if old.get('environment') and any( [old['environment'].get(key) != after[0].get(key) for key in ('python', 'sqlite', 'cpus', 'scale')] ):
+		out.write( "runs differ: %s\n" % ', '.join( ["%s %s -> %s" % ( key, old['environment'].get(key), after[0].get(key) ) for key in ('python', 'sqlite', 'cpus', 'scale') if old['environment'].get(key) != after[0].get(key)] ) )
+	out.write( "%-32s %10s %10s %8s\n" % ('benchmark', 'before', 'after', 'ratio') )
+	for line in after[1:]:
+		if line['benchmark'] not in old:
+			out.write( "%-32s %10s %10.4f\n" % ( line['benchmark'], '-', line['seconds'] ) )
+			continue
+		seconds = old[ line['benchmark'] ]['seconds']
+		ratio = "%.2f" % ( line['seconds'] / seconds ) if seconds else '-'
+		out.write( "%-32s %10.4f %10.4f %8s\n" % ( line['benchmark'], seconds, line['seconds'], ratio ) )
+	out.flush()
+
+
+def main(argv=None):
+	import argparse
+	from benchmarks import emit
+	arg_parser = argparse.ArgumentParser(prog="python3 -m benchmarks", description="georipe benchmarks on generated data, offline")
+	arg_parser.add_argument("-scale", dest="scale", type=float, default=1.0, help="size of the generated data, 1 is 200000 networks")
+	arg_parser.add_argument("-repeat", dest="repeat", type=int, default=3, help="runs of every search, the fastest counts")
+	arg_parser.add_argument("-only", dest="only", action="append", choices=SUITES, help="run these benchmarks only (rpsl/geoip/rwhois)")
+	arg_parser.add_argument("-out", dest="out", help="write the results to this file too")
+	arg_parser.add_argument("-compare", dest="compare", help="results of an earlier run to compare with")
+	args = arg_parser.parse_args(argv)
+
+	results = [ environment(args.scale, args.repeat) ]
+	emit(results)
+	for name in args.only or SUITES:
+		lines = suite(name, args.scale, args.repeat)
+		emit(lines)
+		results += lines
+	if args.out:
+		with open(args.out, 'w') as out:
+			emit(results, out)
+	if args.compare:
+		with open(args.compare) as f:
+			compare( [json.loads(line) for line in f if line.strip()], results )
+
+
+if __name__ == '__main__':
+	main()
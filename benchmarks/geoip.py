@@ -0,0 +1,97 @@
+'''
+	geoip on generated GeoLite2 archives (benchmarks.geolite): -update, single and batch -ip searches,
+	-networks, -square and -circle, LIKE searches and the KML/HTML export of their results
+'''
+import os
+import random
+import tempfile
+import importlib.util
+
+ITEMS = ['network', 'asn', 'org', 'continent', 'country', 'city', 'lat', 'long']
+
+
+def ips(sql, table, count, seed=23):
+	'''count random IPv4 addresses between the first and the last network of table, most of them in one'''
+	rnd = random.Random(seed)
+	first, last = sql.execute("SELECT MIN(ip_begin), MAX(ip_end) FROM %s WHERE typeof(ip_begin) = 'integer'" % table).fetchone()
+	return [ '%d.%d.%d.%d' % ( ip >> 24, ip >> 16 & 255, ip >> 8 & 255, ip & 255 ) for ip in [rnd.randint(first, last) for _ in range(count)] ]
+
+
+def run(blocks=200000, cities=5000, repeat=3, seed=23):
+	'''results of every geoip benchmark on a database of "blocks" networks'''
+	from georipe.geoip import GeoIP, save_kml, save_html
+	from benchmarks import best, quiet, result
+	from benchmarks import geolite
+	results = []
+	with tempfile.TemporaryDirectory() as tmp:
+		city_zip, asn_zip = os.path.join(tmp, 'GeoLite2-City-CSV.zip'), os.path.join(tmp, 'GeoLite2-ASN-CSV.zip')
+		places = geolite.write_city_zip(city_zip, blocks, cities, asn_zip, seed)
+		geo = GeoIP( os.path.join(tmp, 'geoip.db') ).open()
+		def update():
+			with quiet(), tempfile.NamedTemporaryFile() as tmpfile:
+				return geo.update(tmpfile, url=city_zip, asn_url=asn_zip)
+		seconds, updated = best(update, 1)
+		if not updated:
+			raise Exception("geoip import of the generated archives failed")
+		rows = geo.count()
+		results.append( result( 'geoip_import', seconds, blocks=blocks, rows=rows, zip_bytes=os.path.getsize(city_zip) + os.path.getsize(asn_zip), rows_per_second=round(rows / seconds) ) )
+
+		single = ips(geo.sql, 'geoip', 200, seed)
+		seconds, found = best( lambda: [geo.search( ITEMS, {'ipaddr': [ip]} ) for ip in single], repeat )
+		results.append( result( 'geoip_ip_single', seconds, ips=len(single), rows=sum( [len(rows) for rows in found] ), us_per_ip=round(seconds / len(single) * 1e6, 1) ) )
+
+		batch = ips(geo.sql, 'geoip', geo.ip_batch_threshold - 1, seed + 1)
+		seconds, found = best( lambda: geo.search( ITEMS, {'ipaddr': batch} ), repeat )
+		results.append( result( 'geoip_ip_batch_planner', seconds, ips=len(batch), rows=len(found), us_per_ip=round(seconds / len(batch) * 1e6, 1) ) )
+
+		batch = ips(geo.sql, 'geoip', 10000, seed + 2)
+		def lookup():
+			# loading the NetworkIndex is part of the first batch of every process
+			geo.network_index = None
+			return geo.search( ITEMS, {'ipaddr': batch} )
+		seconds, found = best(lookup, repeat)
+		results.append( result( 'geoip_ip_batch_index', seconds, ips=len(batch), rows=len(found), us_per_ip=round(seconds / len(batch) * 1e6, 1) ) )
+
+		seconds, found = best( lambda: geo.search( ITEMS, {'networks': ['1.0.0.0/8']} ), repeat )
+		results.append( result( 'geoip_networks', seconds, network='1.0.0.0/8', rows=len(found) ) )
+
+		# around the city most blocks are in
+		geoname_id, code, continent, iso, country, city, lat, lon = places[geolite.COUNTRIES]
+		square = '%.4f,%.4f,%.4f,%.4f' % ( lat - 2, lon - 2, lat + 2, lon + 2 )
+		seconds, found = best( lambda: geo.search( ITEMS, {'square': [square]} ), repeat )
+		results.append( result( 'geoip_square', seconds, square=square, rows=len(found), spatial_index=geo.has_spatial_index() ) )
+		circle = '%.4f,%.4f,%d' % ( lat, lon, 200 )
+		seconds, area = best( lambda: geo.search( ITEMS, {'circle': [circle]} ), repeat )
+		results.append( result( 'geoip_circle', seconds, circle=circle, rows=len(area), spatial_index=geo.has_spatial_index() ) )
+
+		for name,attr,val in ( ('city', 'city', city), ('country', 'country', country), ('prefix', 'city', 'city1%'), ('org', 'org', '%Hosting%') ):
+			seconds, found = best( lambda: geo.search( ITEMS, {attr: [val]} ), repeat )
+			results.append( result( 'geoip_like_%s' % name, seconds, pattern=val, rows=len(found) ) )
+
+		geo.search( ITEMS, {'circle': [circle]} )
+		path = os.path.join(tmp, 'circle.kml')
+		seconds, _ = best( lambda: save_kml(area, path, geo.squares, geo.circles), repeat )
+		results.append( result( 'geoip_kml', seconds, rows=len(area), bytes=os.path.getsize(path) ) )
+		if importlib.util.find_spec('folium') is None:
+			results.append( result( 'geoip_html', 0, rows=len(area), skipped="folium is not installed" ) )
+		else:
+			path = os.path.join(tmp, 'circle.html')
+			seconds, _ = best( lambda: save_html(area, ITEMS, path, geo.squares, geo.circles), repeat )
+			results.append( result( 'geoip_html', seconds, rows=len(area), bytes=os.path.getsize(path) ) )
+		geo.close()
+	return results
+
+
+def main(argv=None):
+	import argparse
+	from benchmarks import emit
+	arg_parser = argparse.ArgumentParser(description="geoip benchmarks on generated GeoLite2 archives")
+	arg_parser.add_argument("-blocks", dest="blocks", type=int, default=200000, help="networks in the generated City archive")
+	arg_parser.add_argument("-cities", dest="cities", type=int, default=5000, help="cities of the generated locations")
+	arg_parser.add_argument("-repeat", dest="repeat", type=int, default=3, help="runs of every search, the fastest counts")
+	args = arg_parser.parse_args(argv)
+	emit( run(args.blocks, args.cities, args.repeat) )
+
+
+if __name__ == '__main__':
+	main()
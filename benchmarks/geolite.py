@@ -0,0 +1,107 @@
+'''
+	deterministic GeoLite2-format archives: a City zip (Locations-en, Blocks-IPv4, Blocks-IPv6) and an
+	ASN zip (Blocks-IPv4, Blocks-IPv6) with the columns and member names geoip -update reads. Cities
+	gather around the centers of their countries and a few of them hold most blocks, as in the real data;
+	the same seed gives the same bytes
+'''
+import io
+import csv
+import random
+import zipfile
+
+LOCATIONS_HEADER = ['geoname_id', 'locale_code', 'continent_code', 'continent_name', 'country_iso_code', 'country_name', 'subdivision_1_iso_code', 'subdivision_1_name', 'subdivision_2_iso_code', 'subdivision_2_name', 'city_name', 'metro_code', 'time_zone', 'is_in_european_union']
+BLOCKS_HEADER = ['network', 'geoname_id', 'registered_country_geoname_id', 'represented_country_geoname_id', 'is_anonymous_proxy', 'is_satellite_provider', 'postal_code', 'latitude', 'longitude', 'accuracy_radius']
+ASN_HEADER = ['network', 'autonomous_system_number', 'autonomous_system_organization']
+CONTINENTS = [('EU', 'Europe'), ('AS', 'Asia'), ('NA', 'North America'), ('SA', 'South America'), ('AF', 'Africa'), ('OC', 'Oceania')]
+COUNTRIES = 60
+# fixed member times: the archives do not change from one run to the next
+DATE_TIME = (2019, 12, 24, 0, 0, 0)
+
+
+def locations(cities, seed=23):
+	'''(geoname_id, continent code, continent, country code, country, city, lat, long) of countries and their cities'''
+	rnd = random.Random(seed)
+	places = []
+	centers = []
+	for n in range(COUNTRIES):
+		code, continent = CONTINENTS[ n % len(CONTINENTS) ]
+		lat, lon = round( rnd.uniform(-50, 65), 4 ), round( rnd.uniform(-170, 170), 4 )
+		centers.append( (code, continent, 'C%02d' % n, 'country%d' % n, lat, lon) )
+		# the country itself, for blocks without a city
+		places.append( ( len(places) + 1, code, continent, 'C%02d' % n, 'country%d' % n, '', lat, lon ) )
+	for n in range(cities):
+		code, continent, iso, country, lat, lon = centers[ min( int( rnd.expovariate(0.1) ), COUNTRIES - 1 ) ]
+		places.append( ( len(places) + 1, code, continent, iso, country, 'city%d' % n, round( lat + rnd.gauss(0, 2), 4 ), round( lon + rnd.gauss(0, 2), 4 ) ) )
+	return places
+
+
+def blocks(count, places, ipv6_share=0.1, seed=23):
+	'''(network, geoname_id or None) of count sorted blocks, IPv4 then IPv6, most of them in a few places'''
+	rnd = random.Random(seed)
+	ipv4 = count - int(count * ipv6_share)
+	# Zipf-like weights: the first places hold most blocks
+	weights = [1.0 / n for n in range( 1, len(places) + 1 )]
+	total = 0.0
+	cum_weights = []
+	for weight in weights:
+		total += weight
+		cum_weights.append(total)
+	ip = 1 << 24
+	for n in range(ipv4):
+		prefix = rnd.choice( [24, 24, 24, 23, 22, 21, 20, 25, 26, 28] )
+		size = 1 << (32 - prefix)
+		ip = (ip + size - 1) & ~(size - 1)
+		place = rnd.choices( places, cum_weights=cum_weights )[0][0] if rnd.random() > 0.02 else None
+		yield '%d.%d.%d.%d/%d' % ( ip >> 24, ip >> 16 & 255, ip >> 8 & 255, ip & 255, prefix ), place
+		ip += size * rnd.choice( [1, 1, 1, 2, 4] )
+	for n in range(count - ipv4):
+		place = rnd.choices( places, cum_weights=cum_weights )[0][0]
+		yield '2001:%x:%x::/48' % ( 0x100 + n // 65536, n % 65536 ), place
+
+
+def member(archive, name):
+	'''text writer of a new member of a zip archive'''
+	info = zipfile.ZipInfo(name, date_time=DATE_TIME)
+	info.compress_type = zipfile.ZIP_DEFLATED
+	return io.TextIOWrapper( archive.open(info, 'w'), encoding='utf-8', newline='' )
+
+
+def write_city_zip(path, count, cities=5000, asn_path=None, seed=23):
+	'''GeoLite2-City-CSV zip of count blocks, and the ASN zip of about two thirds of them at asn_path'''
+	places = locations(cities, seed)
+	coordinates = dict( [(place[0], place[6:]) for place in places] )
+	rnd = random.Random(seed + 1)
+	asns = []
+	with zipfile.ZipFile(path, 'w') as archive:
+		with member(archive, 'GeoLite2-City-CSV_20191224/GeoLite2-City-Locations-en.csv') as f:
+			out = csv.writer(f)
+			out.writerow(LOCATIONS_HEADER)
+			for geoname_id,code,continent,iso,country,city,lat,lon in places:
+				out.writerow( [geoname_id, 'en', code, continent, iso, country, '', '', '', '', city, '', '', 0] )
+		# one member is written at a time: the IPv4 blocks come first
+		f = out = family = None
+		try:
+			for network,place in blocks(count, places, seed=seed):
+				if family != ( 'IPv6' if network.find(':') != -1 else 'IPv4' ):
+					if f:
+						f.close()
+					family = 'IPv6' if network.find(':') != -1 else 'IPv4'
+					f = member( archive, 'GeoLite2-City-CSV_20191224/GeoLite2-City-Blocks-%s.csv' % family )
+					out = csv.writer(f)
+					out.writerow(BLOCKS_HEADER)
+				lat, lon = coordinates[place] if place else ('', '')
+				out.writerow( [network, place or '', place or '', '', 0, 0, '', lat, lon, 100] )
+				if asn_path and rnd.random() < 0.66:
+					number = 64512 + int( rnd.expovariate(0.002) ) % 1000
+					asns.append( (network, number, 'ORG-%d %s' % ( number, rnd.choice( ['Telecom', 'Networks', 'Hosting', 'Cloud', 'Broadband'] ) )) )
+		finally:
+			if f:
+				f.close()
+	if asn_path:
+		with zipfile.ZipFile(asn_path, 'w') as archive:
+			for family in ('IPv4', 'IPv6'):
+				with member( archive, 'GeoLite2-ASN-CSV_20191224/GeoLite2-ASN-Blocks-%s.csv' % family ) as f:
+					out = csv.writer(f)
+					out.writerow(ASN_HEADER)
+					out.writerows( [asn for asn in asns if ( asn[0].find(':') != -1 ) == ( family == 'IPv6' )] )
+	return places
@@ -0,0 +1,99 @@
+'''
+	throughput of the -update pipeline (georipe.pipeline) on a synthetic RIPE-like gzip dump: inetnum ranges which
+	split into several CIDRs, inet6num, multi-line descr, continuation lines and the person,
+	mntner and route objects a real dump is mostly made of
+'''
+import io
+import os
+import gzip
+import random
+import tempfile
+
+WORDS = ['telecom', 'network', 'broadband', 'cable', 'university', 'hospital', 'bank', 'ministry', 'services', 'digital', 'city', 'regional', 'mobile', 'data', 'center', 'llc', 'ltd', 'gmbh', 'ooo', 'sa']
+
+
+def words(rnd, n):
+	return ' '.join( [rnd.choice(WORDS) for _ in range(n)] )
+
+
+def ipv4(number):
+	return '%d.%d.%d.%d' % ( number >> 24, number >> 16 & 255, number >> 8 & 255, number & 255 )
+
+
+def write_dump(path, objects, seed=18):
+	'''gzip RPSL dump with "objects" inetnum/inet6num objects among about as many other objects'''
+	rnd = random.Random(seed)
+	ip = 1 << 24
+	# no file name nor time in the gzip header: the same seed gives the same bytes
+	with open(path, 'wb') as raw, gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=1, mtime=0) as packed, io.TextIOWrapper(packed) as dump:
+		dump.write('%\n% The objects are in RPSL format.\n%\n\n')
+		for n in range(objects):
+			kind = rnd.random()
+			if kind < 0.9:
+				# mostly single CIDRs, some ranges spanning several
+				size = rnd.choice( [256, 256, 512, 1024, 4096, 768, 1280, 2560] )
+				dump.write( 'inetnum:        %s - %s\n' % ( ipv4(ip), ipv4(ip + size - 1) ) )
+				ip += size + rnd.choice( [0, 0, 256, 1024] )
+			else:
+				dump.write( 'inet6num:       2001:%x:%x::/48\n' % ( n >> 16, n & 0xffff ) )
+			netname = 'NON-RIPE-NCC-MANAGED-ADDRESS-BLOCK' if n % 1000 == 999 else '%s-NET-%d' % ( rnd.choice(WORDS).upper(), n )
+			dump.write( 'netname:        %s\n' % netname )
+			for _ in range( rnd.randint(1, 3) ):
+				dump.write( 'descr:          %s\n' % words(rnd, rnd.randint(2, 6)) )
+			dump.write( 'country:        %s\n' % rnd.choice( ['RU', 'DE', 'NL', 'FR', 'GB', 'IT', 'UA', 'PL'] ) )
+			dump.write( 'admin-c:        DUMY-RIPE\ntech-c:         DUMY-RIPE\nstatus:         ASSIGNED PA\n' )
+			dump.write( 'remarks:        %s\n                continued %s\n' % ( words(rnd, 8), words(rnd, 4) ) )
+			dump.write( 'mnt-by:         MNT-%d\ncreated:        2019-01-01T00:00:00Z\nlast-modified:  2020-01-01T00:00:00Z\nsource:         RIPE\n\n' % n )
+			if rnd.random() < 0.5:
+				dump.write( 'person:         %s\naddress:        %s\nphone:          +7 495 %07d\nnic-hdl:        P%d-RIPE\nsource:         RIPE\n\n' % ( words(rnd, 2), words(rnd, 4), n, n ) )
+			if rnd.random() < 0.5:
+				dump.write( 'route:          %s/24\norigin:         AS%d\nmnt-by:         MNT-%d\nsource:         RIPE\n\n' % ( ipv4(ip & ~255), 64512 + n % 1000, n ) )
+	return path
+
+
+def bench(path):
+	'''seconds and rows of importing the dump at path as the RIPE one into a fresh database, as -update does'''
+	from georipe import pipeline
+	from georipe.rwhois import RIRDatabase, REGISTRIES
+	from benchmarks import best, quiet
+	url, keys, fields = REGISTRIES['ripe'][0]
+	with tempfile.TemporaryDirectory() as tmp:
+		rir = RIRDatabase( os.path.join(tmp, 'rir.db') ).open()
+		rir.check_db()
+		def parse():
+			with quiet():
+				# a local path is read where it is
+				return pipeline.run( rir, [('ripe', path, keys, fields)] )
+		seconds, stats = best(parse, 1)
+		if stats['ripe']['errors']:
+			raise Exception( "import of %s failed: %s" % ( path, '; '.join(stats['ripe']['errors']) ) )
+		rows, = rir.sql.execute("SELECT COUNT(*) FROM networks").fetchone()
+		rir.close()
+	return seconds, rows
+
+
+def run(objects=200000, dump=None):
+	'''result of parsing a generated dump of objects, or the gzip dump at "dump"'''
+	from benchmarks import result
+	with tempfile.TemporaryDirectory() as tmp:
+		path = dump or write_dump( os.path.join(tmp, 'ripe.db.gz'), objects )
+		size = os.path.getsize(path)
+		with gzip.open(path, 'rb') as packed:
+			unpacked = sum( [len(chunk) for chunk in iter( lambda: packed.read(1 << 20), b'' )] )
+		seconds, rows = bench(path)
+	return result( 'rpsl_parse', seconds, objects=objects if not dump else None, rows=rows,
+		gzip_bytes=size, bytes=unpacked, rows_per_second=round(rows / seconds), mb_per_second=round(unpacked / seconds / 1e6, 1) )
+
+
+def main(argv=None):
+	import argparse
+	from benchmarks import emit
+	arg_parser = argparse.ArgumentParser(description="RPSL dump import throughput")
+	arg_parser.add_argument("-objects", dest="objects", type=int, default=200000, help="inetnum/inet6num objects in the dump")
+	arg_parser.add_argument("-dump", dest="dump", help="gzip dump to import instead of a generated one")
+	args = arg_parser.parse_args(argv)
+	emit( [run(args.objects, args.dump)] )
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,88 @@
+'''
+	rwhois on generated RPSL dumps (benchmarks.rpsl) of every registry, read from a mirror directory:
+	-update and -incremental, single and batch -ip searches, -chain, -inetnum, -inetnums and text searches
+'''
+import os
+import tempfile
+
+ITEMS = ['inetnum', 'netname', 'descr', 'country', 'source']
+
+
+def write_mirror(path, objects, seed=18):
+	'''directory of dumps named as those of REGISTRIES, about "objects" inetnum/inet6num objects in all'''
+	from georipe.rwhois import REGISTRIES
+	from benchmarks.rpsl import write_dump
+	urls = [url for registry in sorted(REGISTRIES) for url,keys,fields in REGISTRIES[registry]]
+	os.makedirs(path, exist_ok=True)
+	for n,url in enumerate(urls):
+		# other seeds: the registries overlap without repeating each other
+		write_dump( os.path.join( path, url.rsplit('/', 1)[-1] ), objects // len(urls), seed + n )
+	return path
+
+
+def run(objects=200000, repeat=3, seed=18):
+	'''results of every rwhois benchmark on a database imported from dumps of "objects" objects'''
+	from georipe.rwhois import RIRDatabase
+	from benchmarks import best, quiet, result
+	from benchmarks.geoip import ips
+	results = []
+	with tempfile.TemporaryDirectory() as tmp:
+		mirror = write_mirror( os.path.join(tmp, 'mirror'), objects, seed )
+		rir = RIRDatabase( os.path.join(tmp, 'rir.db') ).open()
+		for name,incremental in ( ('rwhois_import', False), ('rwhois_import_incremental', True) ):
+			def update():
+				with quiet():
+					return rir.update(mirror=mirror, incremental=incremental)
+			seconds, stats = best(update, 1)
+			errors = [error for stat in stats.values() for error in stat['errors']]
+			if errors:
+				raise Exception( "rwhois import of the generated dumps failed: %s" % '; '.join(errors) )
+			rows = sum( rir.counts().values() )
+			fields = dict( [(key, sum( [stat.get(key, 0) for stat in stats.values()] )) for key in ('bytes', 'networks', 'added', 'changed', 'removed')] )
+			if not incremental:
+				del fields['added'], fields['changed'], fields['removed']
+			results.append( result( name, seconds, objects=objects, rows=rows, rows_per_second=round(rows / seconds), **fields ) )
+
+		single = ips(rir.sql, 'networks', 200, seed)
+		seconds, found = best( lambda: [rir.search( ITEMS, {'ipaddr': [ip]} ) for ip in single], repeat )
+		results.append( result( 'rwhois_ip_single', seconds, ips=len(single), rows=sum( [len(rows) for rows in found] ), us_per_ip=round(seconds / len(single) * 1e6, 1) ) )
+
+		batch = ips(rir.sql, 'networks', rir.ip_batch_threshold - 1, seed + 1)
+		seconds, found = best( lambda: rir.search( ITEMS, {'ipaddr': batch} ), repeat )
+		results.append( result( 'rwhois_ip_batch_planner', seconds, ips=len(batch), rows=len(found), us_per_ip=round(seconds / len(batch) * 1e6, 1) ) )
+
+		# enough IPs for one sweep over all networks (ip_batch)
+		batch = ips( rir.sql, 'networks', max( rir.ip_batch_threshold, rir.size() // 2 ), seed + 2 )
+		seconds, found = best( lambda: rir.search( ITEMS, {'ipaddr': batch} ), repeat )
+		results.append( result( 'rwhois_ip_batch_sweep', seconds, ips=len(batch), rows=len(found), us_per_ip=round(seconds / len(batch) * 1e6, 1), sweep=rir.ip_batch( {'ipaddr': batch} ) ) )
+
+		chained = ips(rir.sql, 'networks', 1000, seed + 3)
+		seconds, found = best( lambda: rir.chains(ITEMS, chained), repeat )
+		results.append( result( 'rwhois_chain', seconds, ips=len(chained), rows=sum( [len(rows) for ip,rows in found] ) ) )
+
+		networks = ['%s.0/24' % ip.rsplit('.', 1)[0] for ip in single[:100]]
+		seconds, found = best( lambda: [rir.search( ITEMS, {'inetnum': [network]} ) for network in networks], repeat )
+		results.append( result( 'rwhois_inetnum', seconds, networks=len(networks), rows=sum( [len(rows) for rows in found] ) ) )
+
+		seconds, found = best( lambda: rir.search( ITEMS, {'inetnums': ['1.0.0.0/8']} ), repeat )
+		results.append( result( 'rwhois_inetnums', seconds, network='1.0.0.0/8', rows=len(found) ) )
+
+		for name,params in ( ('descr', {'descr': ['%hospital%']}), ('netname', {'netname': ['te%']}), ('netname_country', {'netname': ['%bank%'], 'country': ['DE']}) ):
+			seconds, found = best( lambda: rir.search(ITEMS, params), repeat )
+			results.append( result( 'rwhois_like_%s' % name, seconds, params=params, rows=len(found), text_index=rir.has_text_index() ) )
+		rir.close()
+	return results
+
+
+def main(argv=None):
+	import argparse
+	from benchmarks import emit
+	arg_parser = argparse.ArgumentParser(description="rwhois benchmarks on generated RPSL dumps")
+	arg_parser.add_argument("-objects", dest="objects", type=int, default=200000, help="inetnum/inet6num objects in the dumps of all registries")
+	arg_parser.add_argument("-repeat", dest="repeat", type=int, default=3, help="runs of every search, the fastest counts")
+	args = arg_parser.parse_args(argv)
+	emit( run(args.objects, args.repeat) )
+
+
+if __name__ == '__main__':
+	main()
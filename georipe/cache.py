@@ -0,0 +1,147 @@
+'''
+	results of searches kept for the next time the same search runs against the same contents of a
+	database: every update stamps the database with a new generation (stamp(), PRAGMA user_version)
+	and results are found by it, so those of the contents before are never used again, and age out
+'''
+import os
+import sys
+
+RESULT_CACHE = os.path.join( os.path.expanduser('~'), '.cache', 'georipe', 'results.db' )
+# bytes of results on disk
+CACHE_SIZE = 256 * 1000 * 1000
+# rows of results in memory, larger results are not cached
+CACHE_ROWS = 1000000
+
+
+def stamp(db):
+	'''a new generation of the database: results cached for the others are not found any more'''
+	import random
+	# random rather than counted: a database made again from nothing does not start from a used one
+	db.execute( "PRAGMA user_version=%d" % random.SystemRandom().randrange(1, 1 << 31) )
+
+
+def generation(db):
+	'''generation stamp of a database, 0 for one updated before there were stamps (not cached)'''
+	return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+class ResultCache:
+	'''
+		the last results in memory, and with a path, on disk as well, up to "size" bytes there;
+		the least recently used go first
+	'''
+
+	def __init__(self, path=None, size=CACHE_SIZE, rows=CACHE_ROWS):
+		from collections import OrderedDict
+		self.path = path
+		self.size = size
+		self.max_rows = rows
+		# key -> (items, rows, extra), the most recently used last
+		self.lru = OrderedDict()
+		self.count = 0
+		self.db = None
+
+	def open(self):
+		import sqlite3
+		if self.db is None:
+			os.makedirs( os.path.dirname( os.path.abspath(self.path) ), exist_ok=True )
+			self.db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+			self.db.execute("CREATE TABLE IF NOT EXISTS results(key TEXT PRIMARY KEY, value BLOB, size INT, used REAL)")
+		return self.db
+
+	def close(self):
+		if self.db:
+			self.db.close()
+		self.db = None
+
+	def key(self, path, generation, search, items, params):
+		'''key of a search of items by params, None for a database without a generation stamp'''
+		import json
+		import hashlib
+		if not generation:
+			return None
+		text = json.dumps( [os.path.abspath(path), generation, search, list(items), [[attr, vals] for attr,vals in params.items()]] )
+		return hashlib.sha1( text.encode() ).hexdigest()
+
+	def get(self, key):
+		'''(rows, extra) of a search, None when it is not cached'''
+		import time
+		from georipe import planner
+		if key in self.lru:
+			self.lru.move_to_end(key)
+			items, rows, extra = self.lru[key]
+			return list(rows), extra
+		if not self.path:
+			return None
+		try:
+			db = self.open()
+			found = db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+			if not found:
+				return None
+			items, rows, extra = self.load( found[0] )
+			db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+			db.commit()
+		except Exception as e:
+			# a cache which cannot be read is empty, the search runs
+			sys.stderr.write( "result cache %s: %s\n" % ( self.path, e ) )
+			return None
+		Row = planner.record(items)
+		rows = [Row(row) for row in rows]
+		self.remember(key, items, rows, extra)
+		return list(rows), extra
+
+	def put(self, key, items, rows, extra=None):
+		import sqlite3
+		import time
+		if len(rows) > self.max_rows:
+			return
+		self.remember(key, items, rows, extra)
+		if not self.path:
+			return
+		try:
+			value = self.dump(items, rows, extra)
+			if len(value) > self.size:
+				return
+			db = self.open()
+			db.execute( "INSERT OR REPLACE INTO results VALUES(?,?,?,?)", (key, value, len(value), time.time()) )
+			# the most recently used results which fit in "size", the others go
+			db.execute( "DELETE FROM results WHERE key IN (SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY used DESC) AS kept FROM results) WHERE kept > ?)", (self.size,) )
+			db.commit()
+		except sqlite3.Error as e:
+			sys.stderr.write( "result cache %s: %s\n" % ( self.path, e ) )
+
+	def remember(self, key, items, rows, extra):
+		if key in self.lru:
+			self.count -= len( self.lru.pop(key)[1] )
+		# a copy: the list given back to the caller may change
+		self.lru[key] = ( tuple(items), list(rows), extra )
+		self.count += len(rows)
+		while self.count > self.max_rows:
+			self.count -= len( self.lru.popitem(last=False)[1][1] )
+
+	def filling(self, key, items, rows, extra=None):
+		'''rows of a search as they come, cached once they are all read unless there are too many'''
+		kept = []
+		try:
+			for row in rows:
+				if kept is not None:
+					kept.append(row)
+					if len(kept) > self.max_rows:
+						kept = None
+				yield row
+		finally:
+			# a search generator drops its temp tables once closed
+			if hasattr(rows, 'close'):
+				rows.close()
+		if kept is not None:
+			self.put(key, items, kept, extra)
+
+	def dump(self, items, rows, extra):
+		import zlib
+		import marshal
+		return zlib.compress( marshal.dumps( ( tuple(items), [tuple(row) for row in rows], extra ) ), 1 )
+
+	def load(self, value):
+		import zlib
+		import marshal
+		return marshal.loads( zlib.decompress(value) )
@@ -1,63 +1,80 @@
 #!/usr/bin/python3
-import csv
-import sqlite3
-import argparse
 import sys,os
-import itertools
-from shutil import copyfile
+import math
+from georipe import planner, stats, ipv6, profile, cache
 
 __version__ = '2.0.1'
 GEOIP_DB = os.path.join( os.path.dirname(__file__), 'geoip.db' )
-
-try:
-	db = sqlite3.connect(GEOIP_DB)
-except:
-	print("permission denied to open %s" % GEOIP_DB)
-	exit()
-
-db.text_factory = str
-sql = db.cursor()
-
-items = ['network']
-squares = []
-circles = []
-
-arg_parser = argparse.ArgumentParser()
-arg_parser.add_argument("-update", dest='update', nargs='?', const='', help='update local database from remote ZIP-archive')
-arg_parser.add_argument("-info", dest='info', action="store_true", help='show total amount netblocks')
-
-arg_parser.add_argument('-ip', dest="ipaddr", action="append", help='search network by IP')
-arg_parser.add_argument('-network', dest="network", action="append", help='search network by CIDR (parent)')
-arg_parser.add_argument('-networks', dest="networks", action="append", help='search networks by CIDR (nested)')
-arg_parser.add_argument('-asn', dest="asn", action="append", help='search network by ASN')
-arg_parser.add_argument('-org', dest="org", action="append", help='search networks by ASN organization')
-arg_parser.add_argument('-city', dest="city", action="append", help='search networks in city')
-arg_parser.add_argument('-country', dest="country", action="append", help='search networks in country')
-arg_parser.add_argument('-continent', dest="continent", action="append", help='search networks on the continent')
-arg_parser.add_argument('-square', dest="lat_long_lat_long", action="append", help='search networks in square area (lat,long,lat,long)')
-arg_parser.add_argument('-circle', dest="lat_long_km", action="append", help='search networks in circle area (lat,long,km)')
-
-arg_parser.add_argument("-resolve-rwhois", dest="resolve_ripe", action="store_true", help="rwhois db resolve netname (faster)")
-arg_parser.add_argument("-resolve-whois", dest="resolve_whois", action="store_true", help="whois resolve netname (slower)")
-
-arg_parser.add_argument("-kml", dest="save_to_kml", help="save coordinates of netblocks as KML")
-arg_parser.add_argument("-html", dest="save_to_html", help="save coordinates of netblocks as HTML")
-arg_parser.add_argument("-version", dest="version", action="store_true", help="show version")
-
-arg_parser.add_argument("items", nargs='*', default=['network', 'continent', 'country', 'city', 'lat', 'long'], help="one or more: network,asn,org,continent,country,city,lat,long")
-
-def check_db():
-	try:
-		sql.execute("select 1 from geoip limit 1")
-		return True
-	except:
-		return False
-
-def show_db_info():
-	count, = sql.execute('SELECT COUNT(network) FROM geoip')
-	print(count[0])
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+IP_BATCH_THRESHOLD = 256
+INDEXED_PARAMS = ('ipaddr', 'network', 'networks')
+AREA_PARAMS = ('square', 'circle')
+# columns of geoip: the items a search returns, and the other parameters it takes, as the options of build_parser()
+COLUMNS = ('ip_begin', 'ip_end', 'network', 'asn', 'org', 'continent', 'country', 'city', 'lat', 'long')
+PARAMS = INDEXED_PARAMS + AREA_PARAMS + ('asn', 'org', 'city', 'country', 'continent')
+
+default_db = None
+
+def build_parser():
+	import argparse
+	from georipe import output
+	arg_parser = argparse.ArgumentParser()
+	arg_parser.add_argument("-update", dest='update', nargs='?', const='', help='update local database from remote ZIP-archive')
+	arg_parser.add_argument("-lang", dest='lang', default='en', help='language of imported names (ja/zh-CN/fr/ru/en/pt-BR/de/es)')
+	arg_parser.add_argument("-info", dest='info', action="store_true", help='show total amount netblocks')
+	arg_parser.add_argument("-export-snapshot", dest='export_snapshot', nargs='?', const='', help='write the database as a memory-mapped snapshot file for -snapshot')
+	arg_parser.add_argument("-snapshot", dest='snapshot', nargs='?', const='', help='answer -ip searches from a snapshot file without opening the database')
+
+	arg_parser.add_argument('-ip', dest="ipaddr", action="append", help='search network by IP')
+	arg_parser.add_argument('-network', dest="network", action="append", help='search network by CIDR (parent)')
+	arg_parser.add_argument('-networks', dest="networks", action="append", help='search networks by CIDR (nested)')
+	arg_parser.add_argument('-asn', dest="asn", action="append", help='search network by ASN')
+	arg_parser.add_argument('-org', dest="org", action="append", help='search networks by ASN organization')
+	arg_parser.add_argument('-city', dest="city", action="append", help='search networks in city')
+	arg_parser.add_argument('-country', dest="country", action="append", help='search networks in country')
+	arg_parser.add_argument('-continent', dest="continent", action="append", help='search networks on the continent')
+	arg_parser.add_argument('-square', dest="lat_long_lat_long", action="append", help='search networks in square area (lat,long,lat,long)')
+	arg_parser.add_argument('-circle', dest="lat_long_km", action="append", help='search networks in circle area (lat,long,km)')
+
+	arg_parser.add_argument("-resolve-rwhois", dest="resolve_ripe", action="store_true", help="rwhois db resolve netname (faster)")
+	arg_parser.add_argument("-resolve-whois", dest="resolve_whois", action="store_true", help="whois resolve netname (slower)")
+	arg_parser.add_argument("-whois-workers", dest="whois_workers", type=int, default=8, help="parallel whois lookups")
+	arg_parser.add_argument("-whois-rate", dest="whois_rate", type=float, default=1.0, help="whois queries per second for every registry")
+	arg_parser.add_argument("-whois-cache", dest="whois_cache", default=os.path.join( '~', '.cache', 'georipe', 'whois.db' ), help="whois cache file ('' disables it)")
+	arg_parser.add_argument("-whois-ttl", dest="whois_ttl", type=float, default=7, help="days a cached whois answer stays valid")
+	arg_parser.add_argument("-whois-server", dest="whois_server", help="query this whois server (host[:port]) instead of the registries")
+
+	arg_parser.add_argument("-server", dest="server", help="query a running 'georipe serve' at this socket path or localhost:port")
+
+	arg_parser.add_argument("-stats-only", dest="stats_only", action="store_true", help="print only the summary row, counted without fetching the rows")
+	arg_parser.add_argument("-group-by", dest="group_by", type=lambda v: v.split(','), help="networks and IPs per value of these comma separated items, e.g. country")
+	arg_parser.add_argument("-format", dest="format", choices=output.FORMATS, default='table', help="table (default) or stream rows as tsv/csv/jsonl with the summary on stderr")
+	arg_parser.add_argument("-grid", dest="save_to_grid", help="save networks and IPs per lat/long cell as .csv, .geojson or .html heatmap")
+	arg_parser.add_argument("-grid-size", dest="grid_size", type=float, default=1.0, help="grid cell size in degrees (default 1)")
+	arg_parser.add_argument("-kml", dest="save_to_kml", help="save coordinates of netblocks as KML to this file ('-' for stdout)")
+	arg_parser.add_argument("-html", dest="save_to_html", help="save coordinates of netblocks as HTML")
+	arg_parser.add_argument("-cache", dest="cache", action="store_true", help="reuse results of the same searches run before against the same database, kept in the -cache-file")
+	arg_parser.add_argument("-cache-file", dest="cache_file", default=cache.RESULT_CACHE, help="file of the -cache results (default ~/.cache/georipe/results.db)")
+	arg_parser.add_argument("-cache-size", dest="cache_size", type=float, default=256, help="MB of results the -cache file keeps (default 256)")
+	arg_parser.add_argument("-profile", dest="profile", action="store_true", help="report time and rows of every stage, SQL statements and their query plans on stderr")
+	arg_parser.add_argument("-profile-out", dest="profile_out", default='', help="write that report as JSON to this file instead")
+	arg_parser.add_argument("-version", dest="version", action="store_true", help="show version")
+
+	arg_parser.add_argument("items", nargs='*', default=['network', 'continent', 'country', 'city', 'lat', 'long'], help="one or more: network,asn,org,continent,country,city,lat,long")
+	return arg_parser
+
+def haversine(lat1, lon1, lat2, lon2):
+	if lat1 in (None,'') or lon1 in (None,''):
+		return None
+	lat1, lon1, lat2, lon2 = map( math.radians, (lat1, lon1, lat2, lon2) )
+	a = math.sin( (lat2-lat1)/2 )**2 + math.cos(lat1) * math.cos(lat2) * math.sin( (lon2-lon1)/2 )**2
+	return 2 * EARTH_RADIUS_KM * math.asin( min(1.0, math.sqrt(a)) )
 
 def cidr_to_min_max(cidr):
+	if cidr.find(':') != -1:
+		return ipv6.cidr_to_min_max(cidr)
 	if len( cidr.split('/') ) == 2:
 		ip_begin,mask = cidr.split('/')
 	else:
@@ -69,189 +86,61 @@ def cidr_to_min_max(cidr):
 	_max = _min + mask
 	return _min,_max
 
-def update(tmpfile, url=None):
-	import urllib.request
-	from zipfile import ZipFile
-	from io import StringIO
-
-	DB_ASN = "http://web.archive.org/web/20191227183143/https://geolite.maxmind.com/download/geoip/database/GeoLite2-ASN-CSV.zip"
-	DB_COUNTRY = "http://web.archive.org/web/20191227183011/https://geolite.maxmind.com/download/geoip/database/GeoLite2-Country-CSV.zip"
-	DB_CITY = "http://web.archive.org/web/20191227182816if_/https://geolite.maxmind.com/download/geoip/database/GeoLite2-City-CSV.zip"
-
-	def download(uri,target):
-		print(uri)
-		resp = urllib.request.urlopen(uri)
-		size = int( resp.headers.get('content-length') or resp.headers.get('x-archive-orig-content-length') or 0 )
-		downloaded = 0
-		while True:
-			data = resp.read(4096)
-			if not data:
-				break
-			target.write(data)
-			downloaded += len(data)
-			if size:
-				done = int(50 * downloaded / size)
-				sys.stdout.write( "\r[%s%s] %d/%d bytes" % ( '=' * done, ' ' * (50-done), downloaded, size ) )
-			else:
-				sys.stdout.write( "\r%d bytes" % downloaded )
-			sys.stdout.flush()
-
-	if url and os.path.isfile(url):
-		copyfile(url, tmpfile.name)
-	else:
-		download(uri=url or DB_CITY, target=tmpfile)
-	print( '\nunpacking...' )
-	z = ZipFile( tmpfile )
-	lang = input("select language (ja/zh-CN/fr/ru/en/pt-BR/de/es): ")
-	db_blocks = ''
-	db_locations = ''
-	for compressed_filepath in z.namelist():
-		if compressed_filepath.find('GeoLite2-City-Blocks-IPv4.csv') != -1:
-			db_blocks = z.read(compressed_filepath).decode()
-		elif compressed_filepath.find('GeoLite2-City-Locations-%s.csv' % lang) != -1:
-			db_locations = z.read(compressed_filepath).decode()
-	if not db_blocks:
-		print( "'GeoLite2-City-Blocks-IPv4.csv' not found in %s" % DB_CITY )
-		return False
-	elif not db_locations:
-		print( "'GeoLite2-City-Locations-%s.csv' not found in %s" % (lang,DB_CITY) )
-		return False
-	z.close()
-
-	print( 'importing...' )
-	sql.execute("DROP TABLE IF EXISTS geoip")
-	sql.execute("CREATE TABLE geoip(ip_begin INT, ip_end INT, network TEXT, asn TEXT, org TEXT, continent TEXT, country TEXT, city TEXT, lat FLOAT, long FLOAT)")
-	locations = {}
-	
-	for location in csv.DictReader(StringIO(db_locations)):
-		locations.update( { 
-			location['geoname_id'] : {
-				'continent': location['continent_name'].lower(),
-				'country': location['country_name'].lower(),
-				'city': location['city_name'].lower()
-			}
-		} )
-
-	n = 0
-	for block in csv.DictReader(StringIO(db_blocks)):
-		location = locations.get( block['geoname_id'] )
-		if location:
-			continent = location['continent']
-			country = location['country']
-			city = location['city']
-		else:
-			continent = country = city = ''
-		#net = netaddr.IPNetwork( block['network'] )  slow!!!
-		net = cidr_to_min_max( block['network'] )
-		sql.execute(
-			"INSERT INTO geoip(ip_begin,ip_end,network,continent,country,city,lat,long) VALUES(?,?,?,?,?,?,?,?)",
-			( str(min(net)), str(max(net)), block['network'], continent, country, city, block['latitude'], block['longitude'] )
+def find_ranges(ip_begin, ip_end, keys):
+	'''position of the range in sorted ip_begin/ip_end arrays containing each key, -1 where there is none'''
+	import numpy
+	pos = numpy.searchsorted(ip_begin, keys, side='right') - 1
+	found = pos >= 0
+	pos[~found] = 0
+	found &= keys <= ip_end[pos]
+	return numpy.where(found, pos, -1)
+
+class NetworkIndex:
+	'''
+		geoip table loaded once as sorted ip_begin/ip_end arrays for batch IP lookups,
+		IPv4 as integers and IPv6 as 16-byte keys, which numpy compares like SQLite
+	'''
+
+	def __init__(self, sql):
+		self.ipv4 = self.load(sql, 'integer', 'u4')
+		self.ipv6 = self.load(sql, 'blob', 'S%d' % ipv6.KEY_BYTES)
+
+	def load(self, sql, kind, dtype):
+		import numpy
+		count, = sql.execute("SELECT COUNT(*) FROM geoip WHERE typeof(ip_begin) = ?", (kind,)).fetchone()
+		ranges = numpy.fromiter(
+			sql.execute("SELECT ip_begin, ip_end, rowid FROM geoip WHERE typeof(ip_begin) = ? ORDER BY ip_begin", (kind,)),
+			dtype=[('ip_begin', dtype), ('ip_end', dtype), ('rowid', 'i8')],
+			count=count
 		)
-		if n % 25000 == 0:
-			sys.stdout.write("\r%d networks" % n)
-			sys.stdout.flush()
-		n += 1
-	sql.execute("CREATE INDEX ip_begin_index ON geoip(ip_begin)")
-	sql.execute("CREATE INDEX ip_end_index on geoip(ip_end)")
-	sql.execute("CREATE INDEX network_index ON geoip(network)")
-	db.commit()
-	sys.stdout.write("\r%d networks\n" % n)
-	sys.stdout.flush()
-
-	try:
-		tmpfile.truncate()
-		download(uri=DB_ASN, target=tmpfile)
-		print( '\nunpacking...' )
-		z = ZipFile( tmpfile )
-		db_asn = ''
-		for compressed_filepath in z.namelist():
-			if compressed_filepath.find('GeoLite2-ASN-Blocks-IPv4.csv') != -1:
-				db_asn = z.read(compressed_filepath)
-		if not db_asn:
-			print( "'GeoLite2-ASN-Blocks-IPv4.csv' not found in %s" % DB_ASN )
-			return False
-		print( 'importing...' )
-		n = 1
-		for asn in csv.DictReader( BytesIO(db_asn) ):
-			net = asn['network']
-			num = asn['autonomous_system_number']
-			org = asn['autonomous_system_organization']
-			sql.execute( "UPDATE geoip SET asn=?, org=? WHERE network = ?", (num,org,net) )
-			if n % 25000 == 0:
-				sys.stdout.write("\r%d ASNs" % n)
-				sys.stdout.flush()
-			n += 1
-	except Exception as e:
-		print(str(e))
-
-	db.commit()
-	sys.stdout.write("\r%d ASNs\n" % n)
-	sys.stdout.flush()
-	
-
-def do_search(items, params):
-	global squares, circles
-	statement = []
-	args = []
-	def _sign(l):
-		l = l.upper()
-		for piece,sign in list({'N':1, 'S':-1, 'E': 1, 'W': -1}.items()):
-			if l.find(piece) != -1:
-				return float( l.replace(piece,'') ) * sign
-		return float(l)
-	def _check_square(from_latitude,from_longitude,to_latitude,to_longitude):
-		if from_latitude > to_latitude:
-			from_latitude,to_latitude = to_latitude,from_latitude
-		if from_longitude > to_longitude:
-			from_longitude,to_longitude = to_longitude,from_longitude
-		return from_latitude,from_longitude,to_latitude,to_longitude
-
-	for attr,val in list(params.items()):
-		if attr == 'square':
-			(from_latitude,from_longitude,to_latitude,to_longitude) = _check_square( *list(map( _sign, val.split(',') ) ))
-			statement.append( "(lat >= ? AND lat <= ? AND long >= ? AND long <= ?)" )
-			args.extend( [from_latitude, to_latitude, from_longitude, to_longitude] )
-			squares.append( [from_latitude, from_longitude, to_latitude, to_longitude] )
-		elif attr == 'circle':
-			lat, lon, radius_km = val.split(',')
-			lat, lon = list(map( _sign, [lat, lon] ))
-			radius = float(radius_km) * ( 1.0 / 110.574 )
-			#radius = float(radius_km) * ( 1.0 / ( 111.320*math.cos(lat) ) )
-			statement.append( "( ( (lat - ?)*(lat - ?) + (long - ?)*(long - ?) ) < ? )" )
-			args.extend( [lat, lat, lon, lon, radius*radius] )
-			circles.append( [lat, lon, radius, float(radius_km)] )
-		elif attr == 'ipaddr':
-			ip, ip = cidr_to_min_max(val)
-			statement.append( "(network = (SELECT network FROM geoip WHERE ? BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )" )
-			args.append( ip )
-		elif attr == 'network':
-			_min, _max = cidr_to_min_max( val )
-			statement.append( "(network in (SELECT network FROM geoip WHERE ? BETWEEN ip_begin AND ip_end AND ? BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )" )
-			args.extend( [_min, _max] )
-		elif attr == 'networks':
-			_min, _max = cidr_to_min_max( val )
-			statement.append( "(network in (SELECT network FROM geoip WHERE ip_begin BETWEEN ? AND ? AND ip_end BETWEEN ? AND ?) )" )
-			args.extend( [_min, _max, _min, _max] )
-		elif attr.find('no_') != -1:
-			statement.append( "(%s NOT LIKE ?)" % attr[3:] )
-			args.append( val )
-		else:
-			statement.append( "(%s LIKE ?)" % attr )
-			args.append( val )
-
-	results = []
-	query = ( "SELECT %s FROM geoip WHERE " % ','.join(items) ) + ' AND '.join(statement)
-	for result in sql.execute( query, args ):
-		results.append( dict( list(zip(items,result)) ) )
-	return results
-
-def search(items, params):
-	results = []
-	for attrs in itertools.product( *list(params.values()) ):
-		results += do_search( items, dict( list(zip(list(params.keys()), attrs)) ) )
-	return results
-
-def geo_search(args):
+		return numpy.ascontiguousarray(ranges['ip_begin']), numpy.ascontiguousarray(ranges['ip_end']), numpy.ascontiguousarray(ranges['rowid'])
+
+	def find(self, ips):
+		'''rowid of the network containing each IP (integer or IPv6 key), -1 where there is none'''
+		import numpy
+		ips = numpy.array(ips, dtype=object)
+		is_ipv6 = numpy.array( [isinstance(ip, bytes) for ip in ips.tolist()], dtype=bool )
+		rowids = numpy.full( len(ips), -1, dtype='i8' )
+		for (ip_begin, ip_end, rowid),where in ( (self.ipv4, ~is_ipv6), (self.ipv6, is_ipv6) ):
+			if not len(ip_begin) or not where.any():
+				continue
+			pos = find_ranges( ip_begin, ip_end, ips[where].astype(ip_begin.dtype) )
+			rowids[where] = numpy.where(pos >= 0, rowid[pos], -1)
+		return rowids
+
+	def lookup(self, sql, items, ips):
+		Row = planner.record(items)
+		rowids = self.find(ips)
+		rows = {}
+		wanted = [int(r) for r in set(rowids.tolist()) if r != -1]
+		for i in range(0, len(wanted), 500):
+			chunk = wanted[i:i+500]
+			query = "SELECT rowid,%s FROM geoip WHERE rowid IN (%s)" % ( ','.join(items), ','.join('?'*len(chunk)) )
+			for result in sql.execute( query, chunk ):
+				rows[result[0]] = Row( result[1:] )
+		return [rows[r] for r in rowids.tolist() if r != -1]
+
+def read_params(args):
 	params = {}
 	for attr,vals in list(args.items()):
 		params[attr] = []
@@ -272,115 +161,450 @@ def geo_search(args):
 				break
 			else:
 				params[attr].append(val)
-	return search(items, params)
-
-def resolve_whois(netblocks):
-	from ipwhois import IPWhois
-	for netblock in netblocks:
+	return params
+
+class GeoIP:
+	'''
+		geoip database behind its own connection, opened by open() and released by close();
+		use one instance per thread
+	'''
+
+	def __init__(self, path=GEOIP_DB, readonly=False, cache=None):
+		self.path = path
+		self.readonly = readonly
+		# georipe.cache.ResultCache of search(), iter_search() and do_search()
+		self.cache = cache
+		self.db = None
+		self.sql = None
+		# file_id() of the file the connection reads
+		self.inode = None
+		self.squares = []
+		self.circles = []
+		self.network_index = None
+		self.spatial_index = None
+		self.ip_batch_threshold = IP_BATCH_THRESHOLD
+
+	def open(self):
+		import sqlite3
+		from georipe import shadow
+		# before the file is opened: a replacement in between only costs one more open (reopen())
+		self.inode = shadow.file_id(self.path)
+		if self.readonly:
+			self.db = sqlite3.connect('file:%s?mode=ro' % self.path, uri=True, check_same_thread=False)
+		else:
+			self.db = sqlite3.connect(self.path, check_same_thread=False)
+			# a new database
+			self.inode = self.inode or shadow.file_id(self.path)
+		self.db.text_factory = str
+		self.db.create_function("haversine", 4, haversine)
+		ipv6.register(self.db)
+		profile.attach(self.db)
+		self.sql = self.db.cursor()
+		return self
+
+	def close(self):
+		if self.db:
+			self.db.close()
+		self.db = self.sql = None
+
+	def reopen(self):
+		'''
+			opens the database again if an update in another process or instance replaced its file (georipe.shadow):
+			the connection would go on reading the old one; searches call it first
+		'''
+		from georipe import shadow
+		if self.db and shadow.file_id(self.path) != self.inode:
+			self.close()
+			self.open()
+			self.network_index = self.spatial_index = None
+
+	def __enter__(self):
+		return self.open()
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def check_db(self):
 		try:
-			netname = IPWhois( netblock['network'].split('/')[0] ).lookup_whois()['nets'][0]['name']
-			netblock['netname'] = netname[:20]+'..' if len(netname) > 20 else netname
+			self.sql.execute("select 1 from geoip limit 1")
+			return True
 		except:
-			pass
+			return False
 
-def resolve_ripe(netblocks):
-	import rwhois
-	for netblock in netblocks:
-		if netblock.get('network'):
-			results = rwhois.do_search( ["netname"], { "inetnum": netblock['network'] } )
-			netname = results[0]['netname'] if results and results[0].get('netname') else ''
-			if netname:
-				netblock['netname'] = netname[:20]+'..' if len(netname) > 20 else netname
-
-def save_kml(netblocks, outfile):
-	from pykml.factory import KML_ElementMaker as KML
-	from lxml import etree
-	import math
-
-	def kml(name, lat,lon):
-		return KML.Placemark( 
-			KML.name(name),
-			KML.Point( 
-				KML.coordinates( "%(long).04f,%(lat).04f" % { 'lat': lat, 'long': lon } )
-				) 
-			) 
-
-	def draw_square(from_latitude, from_longitude, to_latitude, to_longitude):
-		return KML.Placemark(
-			KML.name('square'),
-			KML.Style(
-				KML.LineStyle(
-					KML.color('ff0000ff'),
-					KML.width(2)
-				)
-			),
-			KML.LineString(
-				KML.coordinates(
-					'%.04f,%.04f,0.0 ' % (from_longitude,from_latitude) +
-					'%.04f,%.04f,0.0 ' % (to_longitude,from_latitude) +
-					'%.04f,%.04f,0.0 ' % (to_longitude,to_latitude) +
-					'%.04f,%.04f,0.0 ' % (from_longitude,to_latitude) +
-					'%.04f,%.04f,0.0 ' % (from_longitude,from_latitude)
-				)
-			)
-		)
+	def show_db_info(self):
+		count, = self.sql.execute('SELECT COUNT(network) FROM geoip')
+		print(count[0])
+
+	def export_snapshot(self, path=None):
+		from georipe import snapshot
+		return snapshot.export( self.sql, path or snapshot.SNAPSHOT )
+
+	def count(self):
+		return self.sql.execute("SELECT COUNT(*) FROM geoip").fetchone()[0]
+
+	def update(self, tmpfile, url=None, lang='en', asn_url=None):
+		'''
+			imports GeoLite2 (load()) into a shadow of the database (georipe.shadow), which replaces it once
+			indexed, analyzed and verified: searches go on against the old one meanwhile; returns True when
+			the database was replaced
+		'''
+		from georipe import shadow
+		before = { 'geoip': self.count() } if self.check_db() else {}
+		path = shadow.create(self.path)
+		geo = GeoIP(path).open()
+		problems = ["nothing imported"]
+		try:
+			shadow.prepare(geo.db)
+			if geo.load(tmpfile, url=url, lang=lang, asn_url=asn_url):
+				shadow.analyze(geo.db)
+				problems = shadow.verify( before, { 'geoip': geo.count() } )
+		finally:
+			geo.close()
+			if problems:
+				shadow.discard(path)
+		if problems:
+			print( "%s kept: %s" % ( self.path, '; '.join(problems) ) )
+			return False
+		shadow.replace(path, self.path)
+		self.network_index = self.spatial_index = None
+		if self.db:
+			# the connection still reads the file which was replaced
+			self.close()
+			self.open()
+		return True
 
-	def draw_circle(latitude, longitude, radius):
-		n = 100
-		return KML.Placemark(
-			KML.name('circle'),
-			KML.Style(
-				KML.LineStyle(
-					KML.color('ff0000ff'),
-					KML.width(2)
-				)
-			),
-			KML.LineString(
-				KML.coordinates(
-					' '.join( map( lambda xy:'%.04f,%.04f,0.0 '%(xy[0],xy[1]), 
-							[ ( longitude+math.cos(2*math.pi/n*x)*radius, latitude+math.sin(2*math.pi/n*x)*radius ) for x in range(0,n+1) ]
-						)
-					)
-				)
-			)
-		)
+	def load(self, tmpfile, url=None, lang='en', asn_url=None):
+		import urllib.request
+		import resource
+		import time
+		from zipfile import ZipFile
+		from io import TextIOWrapper
+		from tempfile import NamedTemporaryFile
+		from socket import inet_aton
+		from shutil import copyfile
+		import csv
+
+		DB_ASN = "http://web.archive.org/web/20191227183143/https://geolite.maxmind.com/download/geoip/database/GeoLite2-ASN-CSV.zip"
+		DB_CITY = "http://web.archive.org/web/20191227182816if_/https://geolite.maxmind.com/download/geoip/database/GeoLite2-City-CSV.zip"
+		BATCH_SIZE = 10000
+
+		def download(uri,target):
+			print(uri)
+			resp = urllib.request.urlopen(uri)
+			size = int( resp.headers.get('content-length') or resp.headers.get('x-archive-orig-content-length') or 0 )
+			downloaded = 0
+			while True:
+				data = resp.read(4096)
+				if not data:
+					break
+				target.write(data)
+				downloaded += len(data)
+				if size:
+					done = int(50 * downloaded / size)
+					sys.stdout.write( "\r[%s%s] %d/%d bytes" % ( '=' * done, ' ' * (50-done), downloaded, size ) )
+				else:
+					sys.stdout.write( "\r%d bytes" % downloaded )
+				sys.stdout.flush()
+			target.flush()
+			print()
 
-	points = {}
-	places = []
-	for netblock in netblocks:
-		lat,lon,network,netname = netblock.get('lat'), netblock.get('long'), netblock.get('network'), netblock.get('netname','')
-		if lat and lon:
-			point = "%s/%s" % (lat, lon)
-			if points.get(point):
-				points[point].append( ' '.join( [network,netname] ) )
+		def fetch(uri,target):
+			if uri and os.path.isfile(uri):
+				copyfile(uri, target.name)
 			else:
-				points[point] = [network]
-	for point in list(points.keys()):
-		lat,lon = list(map( float, point.split("/") ))
-		places.append( kml( "\n".join( points[point] ), lat, lon ) )
-	for square in squares:
-		places.append( draw_square( *list(map( float, square ) ) ))
-	for circle in circles:
-		places.append( draw_circle( *list(map( float, circle[:3] ) ) ))
-	
-	with open(outfile, "wb") as o:
-		o.write( etree.tostring( KML.Folder( *tuple(places) ) ) )
+				download(uri=uri, target=target)
+
+		def read_csv(z, name):
+			reader = csv.reader( TextIOWrapper( z.open(name), encoding='utf-8', newline='' ) )
+			header = next(reader)
+			return dict( [(column,i) for i,column in enumerate(header)] ), reader
+
+		def network_range(cidr):
+			if cidr.find(':') != -1:
+				return ipv6.cidr_to_min_max(cidr)
+			ip, mask = cidr.split('/')
+			size = 1 << ( 32 - int(mask) )
+			_min = int.from_bytes( inet_aton(ip), 'big' ) & ~(size - 1)
+			return _min, _min + size - 1
+
+		def member(z, name):
+			for compressed_filepath in z.namelist():
+				if compressed_filepath.find(name) != -1:
+					return compressed_filepath
+
+		started = time.time()
+		fetch(url or DB_CITY, tmpfile)
+
+		asns = {}
+		try:
+			with NamedTemporaryFile() as asn_tmpfile:
+				fetch(asn_url or DB_ASN, asn_tmpfile)
+				with ZipFile( asn_tmpfile.name ) as z:
+					asn_csv = member(z, 'GeoLite2-ASN-Blocks-IPv4.csv')
+					if not asn_csv:
+						raise Exception( "'GeoLite2-ASN-Blocks-IPv4.csv' not found in %s" % (asn_url or DB_ASN) )
+					# IPv6 blocks are imported when the archive has them
+					for asn_csv in filter( None, [asn_csv, member(z, 'GeoLite2-ASN-Blocks-IPv6.csv')] ):
+						header, rows = read_csv(z, asn_csv)
+						net, num, org = header['network'], header['autonomous_system_number'], header['autonomous_system_organization']
+						for asn in rows:
+							asns[ asn[net] ] = ( asn[num], asn[org] )
+		except Exception as e:
+			print(str(e))
+
+		print( 'unpacking...' )
+		with ZipFile( tmpfile.name ) as z:
+			db_blocks = member(z, 'GeoLite2-City-Blocks-IPv4.csv')
+			db_blocks6 = member(z, 'GeoLite2-City-Blocks-IPv6.csv')
+			db_locations = member(z, 'GeoLite2-City-Locations-%s.csv' % lang)
+			if not db_blocks:
+				print( "'GeoLite2-City-Blocks-IPv4.csv' not found in %s" % (url or DB_CITY) )
+				return False
+			elif not db_locations:
+				print( "'GeoLite2-City-Locations-%s.csv' not found in %s" % (lang, url or DB_CITY) )
+				return False
+
+			locations = {}
+			header, rows = read_csv(z, db_locations)
+			geoname_id, continent, country, city = header['geoname_id'], header['continent_name'], header['country_name'], header['city_name']
+			for location in rows:
+				locations[ location[geoname_id] ] = ( location[continent].lower(), location[country].lower(), location[city].lower() )
+
+			print( 'importing...' )
+			self.network_index = self.spatial_index = None
+			self.sql.execute("DROP TABLE IF EXISTS geoip")
+			self.sql.execute("DROP TABLE IF EXISTS geoip_rtree")
+			self.sql.execute("CREATE TABLE geoip(ip_begin INT, ip_end INT, network TEXT, asn TEXT, org TEXT, continent TEXT, country TEXT, city TEXT, lat FLOAT, long FLOAT)")
+
+			unknown = ('', '', '')
+			no_asn = (None, None)
+			batch = []
+			n = 0
+			for blocks in filter( None, [db_blocks, db_blocks6] ):
+				header, rows = read_csv(z, blocks)
+				network, geoname_id, latitude, longitude = header['network'], header['geoname_id'], header['latitude'], header['longitude']
+				for block in rows:
+					_min, _max = network_range( block[network] )
+					batch.append( (_min, _max, block[network]) + asns.get( block[network], no_asn ) + locations.get( block[geoname_id], unknown ) + (block[latitude], block[longitude]) )
+					n += 1
+					if len(batch) == BATCH_SIZE:
+						self.sql.executemany( "INSERT INTO geoip VALUES(?,?,?,?,?,?,?,?,?,?)", batch )
+						batch = []
+						sys.stdout.write("\r%d networks" % n)
+						sys.stdout.flush()
+			self.sql.executemany( "INSERT INTO geoip VALUES(?,?,?,?,?,?,?,?,?,?)", batch )
+			sys.stdout.write("\r%d networks\n" % n)
+			sys.stdout.flush()
+
+		print( 'indexing...' )
+		self.sql.execute("CREATE INDEX ip_begin_index ON geoip(ip_begin)")
+		self.sql.execute("CREATE INDEX ip_end_index on geoip(ip_end)")
+		self.sql.execute("CREATE INDEX network_index ON geoip(network)")
+		self.sql.execute("CREATE INDEX lat_long_index ON geoip(lat, long)")
+		# one entry per distinct point: blocks share far fewer coordinates than there are rows
+		self.sql.execute("CREATE VIRTUAL TABLE geoip_rtree USING rtree(id, min_lat, max_lat, min_long, max_long, +lat, +long)")
+		self.sql.execute("INSERT INTO geoip_rtree(min_lat, max_lat, min_long, max_long, lat, long) SELECT lat, lat, long, long, lat, long FROM geoip WHERE lat != '' AND long != '' GROUP BY lat, long")
+		cache.stamp(self.db)
+		self.db.commit()
+
+		print( "imported %d networks (%d with ASN) in %.1fs, peak RSS %d MiB" % (
+			n, self.sql.execute("SELECT COUNT(*) FROM geoip WHERE asn IS NOT NULL").fetchone()[0],
+			time.time() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+		) )
+		return True
+
+	def bind_param(self, attr, val):
+		def _sign(l):
+			l = l.upper()
+			for piece,sign in list({'N':1, 'S':-1, 'E': 1, 'W': -1}.items()):
+				if l.find(piece) != -1:
+					return float( l.replace(piece,'') ) * sign
+			return float(l)
+		def _check_square(from_latitude,from_longitude,to_latitude,to_longitude):
+			if from_latitude > to_latitude:
+				from_latitude,to_latitude = to_latitude,from_latitude
+			if from_longitude > to_longitude:
+				from_longitude,to_longitude = to_longitude,from_longitude
+			return from_latitude,from_longitude,to_latitude,to_longitude
+
+		if attr == 'square':
+			(from_latitude,from_longitude,to_latitude,to_longitude) = _check_square( *list(map( _sign, val.split(',') ) ))
+			self.squares.append( [from_latitude, from_longitude, to_latitude, to_longitude] )
+			return { 'lat1': from_latitude, 'long1': from_longitude, 'lat2': to_latitude, 'long2': to_longitude }
+		elif attr == 'circle':
+			lat, lon, radius_km = val.split(',')
+			lat, lon = list(map( _sign, [lat, lon] ))
+			radius = float(radius_km) / KM_PER_DEGREE
+			self.circles.append( [lat, lon, radius, float(radius_km)] )
+			# bounding box of the circle, widened in longitude away from the equator
+			lat1, lat2 = lat - radius, lat + radius
+			long1, long2 = -180.0, 180.0
+			if lat1 > -90 and lat2 < 90 and math.sin( math.radians(radius) ) < math.cos( math.radians(lat) ):
+				radius_long = math.degrees( math.asin( math.sin( math.radians(radius) ) / math.cos( math.radians(lat) ) ) )
+				if lon - radius_long >= -180 and lon + radius_long <= 180:
+					long1, long2 = lon - radius_long, lon + radius_long
+			return { 'lat': lat, 'long': lon, 'km': float(radius_km), 'lat1': max(lat1, -90.0), 'long1': long1, 'lat2': min(lat2, 90.0), 'long2': long2 }
+		elif attr == 'ipaddr':
+			ip, ip = cidr_to_min_max(val)
+			return { 'ip': ip }
+		elif attr in ('network', 'networks'):
+			_min, _max = cidr_to_min_max( val )
+			return { 'lo': _min, 'hi': _max }
+		else:
+			return { 'val': val }
+
+	def param_condition(self, attr, p):
+		if attr in AREA_PARAMS:
+			statement = "(t.lat >= {p}.lat1 AND t.lat <= {p}.lat2 AND t.long >= {p}.long1 AND t.long <= {p}.long2)"
+			if self.has_spatial_index():
+				statement = "(t.rowid IN (SELECT g.rowid FROM geoip_rtree AS r JOIN geoip AS g ON g.lat = r.lat AND g.long = r.long WHERE r.max_lat >= {p}.lat1 AND r.min_lat <= {p}.lat2 AND r.max_long >= {p}.long1 AND r.min_long <= {p}.long2) ) AND " + statement
+			if attr == 'circle':
+				statement += " AND (haversine(t.lat, t.long, {p}.lat, {p}.long) <= {p}.km)"
+			return statement.format(p=p)
+		elif attr == 'ipaddr':
+			return "(t.network = (SELECT network FROM geoip WHERE {p}.ip BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )".format(p=p)
+		elif attr == 'network':
+			return "(t.network = (SELECT network FROM geoip WHERE {p}.lo BETWEEN ip_begin AND ip_end AND {p}.hi BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )".format(p=p)
+		elif attr == 'networks':
+			return "(t.ip_begin BETWEEN {p}.lo AND {p}.hi AND t.ip_end BETWEEN {p}.lo AND {p}.hi)".format(p=p)
+		elif attr.startswith('no_') and attr[3:] in COLUMNS:
+			return "(t.%s NOT LIKE %s.val)" % ( attr[3:], p )
+		elif attr in COLUMNS:
+			return "(t.%s LIKE %s.val)" % ( attr, p )
+		else:
+			# the name goes into the SQL statement
+			raise ValueError( "unknown search parameter %r" % attr )
+
+	def has_spatial_index(self):
+		if self.spatial_index is None:
+			self.spatial_index = bool( self.sql.execute("SELECT 1 FROM sqlite_master WHERE name='geoip_rtree'").fetchone() )
+		return self.spatial_index
+
+	def indexed_params(self):
+		return INDEXED_PARAMS + AREA_PARAMS if self.has_spatial_index() else INDEXED_PARAMS
+
+	def cache_key(self, search, items, params):
+		'''key of a search in self.cache, None when it is not cached'''
+		if self.cache is None:
+			return None
+		return self.cache.key( self.path, cache.generation(self.db), search, items, params )
+
+	def cached(self, key):
+		'''rows of a search in self.cache, None when they are not there; the areas of the search come back with them'''
+		found = self.cache.get(key) if key else None
+		if found is None:
+			return None
+		rows, (squares, circles) = found
+		self.squares, self.circles = list(squares), list(circles)
+		return rows
+
+	def do_search(self, items, params):
+		self.reopen()
+		self.squares, self.circles = [], []
+		key = self.cache_key('do_search', items, params)
+		rows = self.cached(key)
+		if rows is None:
+			rows = planner.search( self.sql, 'geoip', items, dict( [(attr,[val]) for attr,val in params.items()] ), self.bind_param, self.param_condition, indexed=self.indexed_params() )
+			if key:
+				self.cache.put( key, items, rows, (self.squares, self.circles) )
+		return rows
+
+	def lookup_ips(self, items, ips):
+		if self.network_index is None:
+			self.network_index = NetworkIndex(self.sql)
+		return self.network_index.lookup( self.sql, items, [cidr_to_min_max(ip)[1] for ip in ips] )
+
+	def search(self, items, params):
+		return list( self.iter_search(items, params, share=True) )
+
+	def iter_search(self, items, params, share=False):
+		self.reopen()
+		self.squares, self.circles = [], []
+		key = self.cache_key('search', items, params)
+		rows = self.cached(key)
+		if rows is not None:
+			return iter(rows)
+		if self.ip_batch(params):
+			rows = profile.rows( iter( self.lookup_ips(items, params['ipaddr']) ) )
+		else:
+			rows = planner.iter_search( self.sql, 'geoip', items, params, self.bind_param, self.param_condition, indexed=self.indexed_params(), share=share )
+		if key:
+			# the areas were read by the search already
+			return self.cache.filling( key, items, rows, (self.squares, self.circles) )
+		return rows
+
+	def geo_search(self, items, args):
+		return self.search( items, read_params(args) )
+
+	def ip_batch(self, params):
+		return list(params.keys()) == ['ipaddr'] and len(params['ipaddr']) >= self.ip_batch_threshold
+
+	def aggregate(self, columns, params, group_by=()):
+		self.reopen()
+		self.squares, self.circles = [], []
+		return planner.aggregate( self.sql, 'geoip', columns, params, self.bind_param, self.param_condition, indexed=self.indexed_params(), group_by=group_by )
+
+	def stat(self, items, params):
+		'''(number of rows, summary) of a search without keeping its rows'''
+		if self.ip_batch(params):
+			return stats.iter_stat( self.iter_search(items, params), items, 'network' )
+		return stats.query_stat( self, items, 'network', params )
+
+	def groups(self, group_by, params):
+		'''networks and IPs of a search for every combination of group_by values'''
+		if self.ip_batch(params):
+			return stats.iter_groups( self.iter_search( list(group_by) + ['network'], params ), group_by, 'network' )
+		return stats.query_groups( self, group_by, params )
+
+def default():
+	'''module-wide GeoIP instance behind search() and do_search(), opened on first use'''
+	global default_db
+	if default_db is None:
+		default_db = GeoIP().open()
+	return default_db
+
+def search(items, params):
+	return default().search(items, params)
+
+def do_search(items, params):
+	return default().do_search(items, params)
+
+def resolve_whois(netblocks, **options):
+	'''netname of every netblock through whois, None where unknown'''
+	from georipe import whois
+	return whois.resolve(netblocks, **options)
+
+def resolve_ripe(netblocks):
+	'''netname of every netblock from the local RIR database, None where unknown'''
+	from georipe import rwhois
+	netnames = [None] * len(netblocks)
+	resolved = [n for n,netblock in enumerate(netblocks) if netblock.get('network')]
+	found = rwhois.default().covering( [cidr_to_min_max( netblocks[n]['network'] ) for n in resolved] )
+	for n,network in zip(resolved, found):
+		netname = network['netname'] if network else ''
+		if netname:
+			netnames[n] = netname[:20]+'..' if len(netname) > 20 else netname
+	return netnames
+
+def save_kml(netblocks, outfile, squares=(), circles=()):
+	from georipe import kml
+	return kml.save( planner.values(netblocks, ['lat', 'long', 'network', 'netname']), outfile, squares, circles )
 
 def html_escape(text):
 	return text.replace("`", "'").replace("'", "&#x27;").replace('"', "&quot;")
 
-def save_html(netblocks, items, outfile):
+def save_html(netblocks, items, outfile, squares=(), circles=()):
 	import folium
 	folium_map = folium.Map(location=[ netblocks[0].get('lat'), netblocks[0].get('long') ], zoom_start=10, tiles="CartoDB dark_matter")
 
 	coordinates = {}
-	for netblock in netblocks:
-		about_netblock = ' | '.join( [str( netblock.get(i) or '' ) for i in items] )
-		if netblock.get('lat') and netblock.get('long'):
-			if "%.04f,%.04f" % ( netblock.get('lat'), netblock.get('long') ) in list(coordinates.keys()):
-				coordinates[ "%.04f,%.04f" % ( netblock.get('lat'), netblock.get('long') ) ] += "<br>" + html_escape(about_netblock)
+	for lat,lon,values in zip( planner.column(netblocks, 'lat'), planner.column(netblocks, 'long'), planner.values(netblocks, items) ):
+		about_netblock = ' | '.join( [str( v or '' ) for v in values] )
+		if lat and lon:
+			if "%.04f,%.04f" % ( lat, lon ) in coordinates:
+				coordinates[ "%.04f,%.04f" % ( lat, lon ) ] += "<br>" + html_escape(about_netblock)
 			else:
-				coordinates[ "%.04f,%.04f" % ( netblock.get('lat'), netblock.get('long') ) ] = html_escape(about_netblock)
+				coordinates[ "%.04f,%.04f" % ( lat, lon ) ] = html_escape(about_netblock)
 		
 	for lat_long,networks in list(coordinates.items()):
 		folium.CircleMarker(location=list(map(float, lat_long.split(','))), popup=networks, radius=1).add_to(folium_map)
@@ -402,52 +626,55 @@ def save_html(netblocks, items, outfile):
 
 
 def get_stat(netblocks, items):
-	statistics = {}
-	ips = 0
-	for item in items:
-		if item == 'network':
-			for network in [n.get('network') for n in netblocks]:
-				_min,_max = cidr_to_min_max(network)
-				ips += _max - _min
-			statistics[item] = '%d ip' % ips
-		else:
-			vals = set()
-			for val in [str(n.get(item)) or '' for n in netblocks]:
-				vals.add(val)
-			statistics[item] = '%d %s' % ( len(vals), item )
-	return statistics
+	return stats.get_stat(netblocks, items, 'network')
 
 def print_row( values, margins ):
-	row = []
-	for i in range( len(values) ):
-		row.append( values[i] + " " * ( margins[i] - len( values[i]) ) )
-	print(' | '.join(row))
+	print(' | '.join( [value.ljust(margin) for value,margin in zip(values, margins)] ))
 
 
 def main( argv=['-h'] ):
-	global items
-	args = arg_parser.parse_args(argv)
+	args = build_parser().parse_args(argv)
 
 	items = args.items
 	netblocks = []
+	params = {}
+	groups = summary = None
+	stream = ( args.format != 'table' or args.stats_only or args.group_by or args.save_to_kml or args.save_to_grid ) and not args.save_to_html
+	resolving = args.resolve_ripe or args.resolve_whois
 
 	if args.version:
 		print(__version__)
-	elif args.update != None:
+		return
+	if args.profile or args.profile_out:
+		profile.enable()
+
+	geo = GeoIP()
+	# -server and -snapshot answer searches only: -update, -info and -export-snapshot work on the database here
+	if ( not args.server and args.snapshot is None ) or args.update is not None or args.info or args.export_snapshot is not None:
+		try:
+			geo.open()
+		except Exception:
+			print("permission denied to open %s" % GEOIP_DB)
+			return
+	if args.cache:
+		geo.cache = cache.ResultCache( os.path.expanduser(args.cache_file), int(args.cache_size * 1e6) )
+
+	if args.update != None:
 		from tempfile import NamedTemporaryFile
 		tmpfile = NamedTemporaryFile()
 		try:
-			if args.update:
-				update(tmpfile, url=args.update)
-			else:
-				update(tmpfile)
+			geo.update(tmpfile, url=args.update or None, lang=args.lang)
 		except Exception as e:
 			print(str(e))
 		tmpfile.close()
 	elif args.info:
-		show_db_info()
+		geo.show_db_info()
+	elif args.export_snapshot is not None:
+		if geo.check_db():
+			print( "%d networks" % geo.export_snapshot(args.export_snapshot) )
+		else:
+			print( "update database first" )
 	else:
-		params = {}
 		if args.ipaddr:
 			params['ipaddr'] = args.ipaddr
 		if args.network:
@@ -469,49 +696,104 @@ def main( argv=['-h'] ):
 		if args.lat_long_km:
 			params['circle'] = args.lat_long_km
 
-		if args.save_to_html:
+		if args.save_to_html or args.save_to_kml:
 			if not 'lat' in items:
 				items.append('lat')
 			if not 'long' in items:
 				items.append('long')
 
+		if args.group_by:
+			items = [i for i in args.group_by if i != 'netname'] + ['network']
+		elif args.save_to_grid:
+			from georipe import grid
+			items = list(grid.ITEMS)
 		if params:
-			if check_db():
-				netblocks = geo_search( params )
+			with profile.stage('args'):
+				params = read_params(params)
+		profile.start('search')
+		if params and args.server:
+			from georipe import server
+			reply = server.query( args.server, 'geoip', items, params )
+			netblocks, geo.squares, geo.circles = reply['results'], reply['squares'], reply['circles']
+		elif params and args.snapshot is not None:
+			if list(params.keys()) != ['ipaddr']:
+				print( "-snapshot answers -ip searches only" )
+				return
+			from georipe import snapshot
+			with snapshot.Snapshot(args.snapshot or snapshot.SNAPSHOT) as snap:
+				netblocks = snap.lookup( items, params['ipaddr'] )
+		elif params:
+			if geo.check_db():
+				if args.group_by and not resolving:
+					groups = geo.groups( args.group_by, params )
+				elif args.stats_only and not resolving:
+					n, summary = geo.stat( items, params )
+				else:
+					netblocks = geo.iter_search( items, params ) if stream else geo.search( items, params )
 			else:
 				print( "update database first" )
+				geo.close()
 				return
+		profile.stop()
 
+	resolve = None
 	if args.resolve_ripe:
-		resolve_ripe( netblocks )
-		items.insert(1, "netname")
+		resolve = resolve_ripe
 	elif args.resolve_whois:
-		resolve_whois( netblocks )
+		resolve = lambda netblocks: resolve_whois( netblocks,
+			workers=args.whois_workers, rate=args.whois_rate, ttl=args.whois_ttl * 24 * 3600,
+			cache=os.path.expanduser(args.whois_cache) if args.whois_cache else None, server=args.whois_server )
+	if resolve:
+		resolve = profile.wrap('resolve', resolve)
+	if resolve and stream:
+		from georipe import output
+		netblocks = output.batched(netblocks, 'netname', resolve)
+	elif resolve:
+		netblocks = planner.add_column( netblocks, 'netname', resolve(netblocks) )
+	if resolve:
 		items.insert(1, "netname")
 
-	if netblocks and args.save_to_kml:
-		save_kml(netblocks, args.save_to_kml)
+	from georipe import output
+	netblocks = output.numbers(netblocks, items)
+	profile.start('output')
+	if args.group_by and params:
+		if groups is None:
+			groups = stats.iter_groups(netblocks, args.group_by, 'network')
+		stats.print_table( list(args.group_by) + stats.GROUP_ITEMS, groups )
+	elif args.stats_only and params:
+		if summary is None:
+			n, summary = stats.iter_stat(netblocks, items, 'network')
+		print( stats.line(n, summary, items) )
+	elif args.save_to_grid and params:
+		from georipe import grid
+		grid.save( planner.values(netblocks, grid.ITEMS), args.save_to_grid, args.grid_size, geo.squares, geo.circles )
+	elif args.save_to_kml and params:
+		save_kml(netblocks, args.save_to_kml, geo.squares, geo.circles)
+	elif stream and params:
+		from georipe import output
+		output.write(netblocks, items, args.format, 'network')
 	elif netblocks and args.save_to_html:
 		items.remove('lat')
 		items.remove('long')
-		save_html(netblocks, items, args.save_to_html)
+		save_html(netblocks, items, args.save_to_html, geo.squares, geo.circles)
 	elif netblocks:
 		summary = get_stat(netblocks, items)
-		margins = [max( [len(str(n.get(i) or '')) for n in netblocks] + [len(i), len(summary[i])] ) for i in items]
+		margins = [max( [len(str(v or '')) for v in planner.column(netblocks, i)] + [len(i), len(summary[i])] ) for i in items]
 		if len(items) > 1:
 			print_row(tuple(items), margins )
 			print_row(tuple( ['-'*m for m in margins] ), margins )
-			for netblock in netblocks:
-				print_row([str( netblock.get(i) or '' ) for i in items], margins )
+			for values in planner.values(netblocks, items):
+				print_row([str( v or '' ) for v in values], margins )
 			print_row(tuple( ['-'*m for m in margins] ), margins )
 			print_row(tuple( [str( summary.get(i) or '' ) for i in items] ), margins )
 
 		else:
-			for netblock in netblocks:
-				print_row([str( netblock.get(i) or '' ) for i in items], [0] )
+			for values in planner.values(netblocks, items):
+				print_row([str( v or '' ) for v in values], [0] )
+	profile.stop()
 
-	if db:
-		db.close()
+	profile.report(args.profile_out)
+	geo.close()
 
 if __name__ == '__main__':
 	main( sys.argv[1:] )
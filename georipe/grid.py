@@ -0,0 +1,112 @@
+'''
+	density grid of a search: networks and IPs counted per lat/long cell, read in chunks
+	of rows and counted with numpy, written as CSV, GeoJSON or a folium heatmap
+'''
+import math
+from georipe import ipv6
+
+GRID_SIZE = 1.0
+CHUNK = 65536
+ITEMS = ['lat', 'long', 'ip_begin', 'ip_end']
+
+
+def ip_count(ip_begin, ip_end):
+	if isinstance(ip_begin, bytes):
+		return float( ipv6.number(ip_end) - ipv6.number(ip_begin) + 1 )
+	return float(ip_end - ip_begin + 1)
+
+
+def bin_rows(rows, size=GRID_SIZE):
+	'''
+		rows: (lat, long, ip_begin, ip_end), a generator is fine;
+		returns arrays (lat, long) of cell centres with networks and IPs of every non-empty cell
+	'''
+	import numpy
+	from itertools import islice
+	lat_cells, long_cells = math.ceil(180 / size), math.ceil(360 / size)
+	cells = {}
+	rows = iter(rows)
+	while True:
+		chunk = list( islice(rows, CHUNK) )
+		if not chunk:
+			break
+		# blocks without coordinates are stored with '' (geoip.load), None from other sources: no cell
+		chunk = [row for row in chunk if row[0] not in ('', None) and row[1] not in ('', None)]
+		if any( [isinstance(row[3], bytes) or row[3] > 0xffffffff for row in chunk] ):
+			# IPv6 ranges (keys, numbers from a server) as (0, size - 1): the size survives as a float, the keys would not
+			chunk = [row[:2] + ( 0, ip_count(row[2], row[3]) - 1 ) for row in chunk]
+		chunk = numpy.array(chunk, dtype=numpy.float64).reshape(-1, 4)
+		lat_cell = numpy.minimum( ( (chunk[:,0] + 90) // size ).astype(numpy.int64), lat_cells - 1 )
+		long_cell = numpy.minimum( ( (chunk[:,1] + 180) // size ).astype(numpy.int64), long_cells - 1 )
+		keys, index = numpy.unique( lat_cell * long_cells + long_cell, return_inverse=True )
+		networks = numpy.bincount(index, minlength=len(keys))
+		ips = numpy.bincount(index, weights=chunk[:,3] - chunk[:,2] + 1, minlength=len(keys))
+		for key,n,ip in zip( keys.tolist(), networks.tolist(), ips.tolist() ):
+			total = cells.setdefault( key, [0, 0] )
+			total[0] += n
+			total[1] += ip
+
+	keys = numpy.array( sorted(cells), dtype=numpy.int64 )
+	counts = numpy.array( [cells[key] for key in keys.tolist()], dtype=numpy.float64 ).reshape(-1, 2)
+	lat = (keys // long_cells + 0.5) * size - 90
+	lon = (keys % long_cells + 0.5) * size - 180
+	# IPs stay floats, IPv6 cells go beyond 64 bits
+	return lat, lon, counts[:,0].astype(numpy.int64), counts[:,1]
+
+
+def save_csv(cells, outfile, size):
+	import csv
+	with open(outfile, 'w', newline='') as o:
+		writer = csv.writer(o, lineterminator='\n')
+		writer.writerow( ['lat', 'long', 'size', 'networks', 'ips'] )
+		for lat,lon,networks,ips in zip( *[c.tolist() for c in cells] ):
+			writer.writerow( ['%.4f' % lat, '%.4f' % lon, size, networks, int(ips)] )
+
+
+def save_geojson(cells, outfile, size):
+	import json
+	half = size / 2
+	features = []
+	for lat,lon,networks,ips in zip( *[c.tolist() for c in cells] ):
+		south, north, west, east = [round(v, 4) for v in (lat - half, lat + half, lon - half, lon + half)]
+		features.append( {
+			'type': 'Feature',
+			'geometry': { 'type': 'Polygon', 'coordinates': [[ [west,south], [east,south], [east,north], [west,north], [west,south] ]] },
+			'properties': { 'networks': networks, 'ips': int(ips) }
+		} )
+	with open(outfile, 'w') as o:
+		json.dump( { 'type': 'FeatureCollection', 'features': features }, o, separators=(',', ':') )
+
+
+def save_heatmap(cells, outfile, size, squares=(), circles=()):
+	import folium
+	from folium.plugins import HeatMap
+	lat, lon, networks, ips = cells
+	folium_map = folium.Map( location=[ float( lat[ networks.argmax() ] ), float( lon[ networks.argmax() ] ) ] if len(lat) else [0, 0], zoom_start=3, tiles="CartoDB dark_matter" )
+	weights = networks / max( int( networks.max() ), 1 ) if len(lat) else networks
+	HeatMap( list( zip( lat.tolist(), lon.tolist(), weights.tolist() ) ), radius=15 ).add_to(folium_map)
+
+	for circle in circles:
+		folium.Circle(location=list(map(float, circle[:2])), radius=circle[3]*1000, color="red").add_to(folium_map)
+
+	for square in squares:
+		from_latitude, from_longitude, to_latitude, to_longitude = list(map(float, square))
+		locations = [ (from_latitude,from_longitude), (from_latitude,to_longitude), (to_latitude,to_longitude), (to_latitude,from_longitude), (from_latitude,from_longitude) ]
+		folium.PolyLine(locations, weight=1, color="red").add_to(folium_map)
+
+	folium_map.save(outfile)
+
+
+def save(rows, outfile, size=GRID_SIZE, squares=(), circles=()):
+	'''format by extension of outfile: .csv, .geojson/.json or .html (heatmap); returns the number of cells'''
+	cells = bin_rows(rows, size)
+	extension = outfile.rsplit('.', 1)[-1].lower()
+	if extension == 'csv':
+		save_csv(cells, outfile, size)
+	elif extension in ('geojson', 'json'):
+		save_geojson(cells, outfile, size)
+	elif extension in ('html', 'htm'):
+		save_heatmap(cells, outfile, size, squares, circles)
+	else:
+		raise ValueError("unknown grid format '%s', use .csv, .geojson or .html" % outfile)
+	return len(cells[0])
@@ -0,0 +1,48 @@
+'''
+	IPv6 ranges as 16-byte big-endian BLOBs kept in the same ip_begin/ip_end columns as the
+	IPv4 integers: SQLite orders every INTEGER before any BLOB and BLOBs of one length like
+	the numbers they hold, so the IPv4 indexes and BETWEEN queries serve both families
+'''
+from socket import inet_pton, inet_ntop, AF_INET6
+
+BITS = 128
+KEY_BYTES = 16
+
+
+def number(key):
+	return int.from_bytes(key, 'big')
+
+
+def key(number):
+	return number.to_bytes(KEY_BYTES, 'big')
+
+
+def cidr_to_min_max(cidr):
+	ip, _, mask = cidr.partition('/')
+	mask = ( 1 << ( BITS - int(mask or BITS) ) ) - 1
+	_min = number( inet_pton( AF_INET6, ip.strip() ) ) & ~mask
+	return key(_min), key(_min | mask)
+
+
+def text(key):
+	return inet_ntop(AF_INET6, key)
+
+
+class Total:
+	'''
+		addresses of all ranges as decimal text (SQL aggregate ip6_total): SQLite integers stop
+		at 64 bits and its floats are not exact beyond 53
+	'''
+
+	def __init__(self):
+		self.total = 0
+
+	def step(self, ip_begin, ip_end):
+		self.total += number(ip_end) - number(ip_begin) + 1
+
+	def finalize(self):
+		return str(self.total)
+
+
+def register(db):
+	db.create_aggregate("ip6_total", 2, Total)
@@ -0,0 +1,134 @@
+'''
+	KML export written straight to the file. Networks are folded into one placemark per
+	coordinate as rows stream by; when there are more placemarks than TILE_PLACEMARKS the
+	world is split into quadtree tiles with <Region>/<Lod>, each tile showing clusters of
+	its points until it is big enough on screen for its children to take over
+'''
+import sys
+import math
+from xml.sax.saxutils import escape
+
+TILE_PLACEMARKS = 1000
+CLUSTER_GRID = 8
+LOD_PIXELS = 256
+MAX_DEPTH = 16
+NAME_LIMIT = 10
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document>
+<Style id="area"><LineStyle><color>ff0000ff</color><width>2</width></LineStyle></Style>
+'''
+FOOTER = '''</Document>
+</kml>
+'''
+
+
+def placemark(out, name, lat, lon):
+	out.write( '<Placemark><name>%s</name><Point><coordinates>%.04f,%.04f</coordinates></Point></Placemark>\n' % ( escape(name), lon, lat ) )
+
+
+def line(out, name, points):
+	out.write( '<Placemark><name>%s</name><styleUrl>#area</styleUrl><LineString><coordinates>%s</coordinates></LineString></Placemark>\n' % (
+		name, ' '.join( ['%.04f,%.04f,0.0' % (lon, lat) for lat,lon in points] )
+	) )
+
+
+def square(out, from_latitude, from_longitude, to_latitude, to_longitude):
+	line( out, 'square', [
+		(from_latitude, from_longitude), (from_latitude, to_longitude), (to_latitude, to_longitude),
+		(to_latitude, from_longitude), (from_latitude, from_longitude)
+	] )
+
+
+def circle(out, latitude, longitude, radius):
+	n = 100
+	line( out, 'circle', [( latitude+math.sin(2*math.pi/n*x)*radius, longitude+math.cos(2*math.pi/n*x)*radius ) for x in range(0,n+1)] )
+
+
+def region(out, box, min_lod, max_lod):
+	south, north, west, east = box
+	out.write( '<Region><LatLonAltBox><north>%f</north><south>%f</south><east>%f</east><west>%f</west></LatLonAltBox>' % (north, south, east, west) )
+	out.write( '<Lod><minLodPixels>%d</minLodPixels><maxLodPixels>%d</maxLodPixels></Lod></Region>\n' % (min_lod, max_lod) )
+
+
+def name(count, networks):
+	if count > len(networks):
+		return '\n'.join( networks + ['... %d more' % ( count - len(networks) )] )
+	return '\n'.join(networks)
+
+
+def clusters(points, box):
+	'''points of a tile merged on a CLUSTER_GRID x CLUSTER_GRID grid: (count, lat, lon) at the centre of mass'''
+	south, north, west, east = box
+	cells = {}
+	for (lat,lon),(count,networks) in points:
+		cell = ( min( int( (lat-south) / (north-south) * CLUSTER_GRID ), CLUSTER_GRID-1 ), min( int( (lon-west) / (east-west) * CLUSTER_GRID ), CLUSTER_GRID-1 ) )
+		total = cells.setdefault( cell, [0, 0.0, 0.0] )
+		total[0] += count
+		total[1] += lat * count
+		total[2] += lon * count
+	return [(count, lat/count, lon/count) for count,lat,lon in cells.values()]
+
+
+def tile(out, points, box, depth):
+	'''
+		tiles are written one after another, not nested: a nested Region would only
+		become active while its parent is, and the parent hides when its children show
+	'''
+	if len(points) <= TILE_PLACEMARKS or depth == MAX_DEPTH:
+		out.write('<Folder>\n')
+		if depth:
+			region(out, box, LOD_PIXELS, -1)
+		for (lat,lon),(count,networks) in points:
+			placemark( out, name(count, networks), lat, lon )
+		out.write('</Folder>\n')
+		return
+
+	out.write('<Folder>\n')
+	region(out, box, LOD_PIXELS if depth else 0, 2 * LOD_PIXELS)
+	for count,lat,lon in clusters(points, box):
+		placemark( out, '%d networks' % count, lat, lon )
+	out.write('</Folder>\n')
+
+	south, north, west, east = box
+	middle_lat, middle_lon = (south + north) / 2, (west + east) / 2
+	quarters = {}
+	for point in points:
+		lat, lon = point[0]
+		quarters.setdefault( (lat >= middle_lat, lon >= middle_lon), [] ).append(point)
+	for (upper,right),quarter in quarters.items():
+		tile( out, quarter, (
+			middle_lat if upper else south, north if upper else middle_lat,
+			middle_lon if right else west, east if right else middle_lon
+		), depth+1 )
+
+
+def save(rows, outfile, squares=(), circles=()):
+	'''
+		rows: (lat, long, network, netname) tuples, a generator is fine; only one entry per
+		distinct coordinate with at most NAME_LIMIT networks is kept. outfile "-" is stdout
+	'''
+	points = {}
+	for lat,lon,network,netname in rows:
+		if lat and lon:
+			point = points.get( (lat, lon) )
+			if point is None:
+				point = points[ (lat, lon) ] = [0, []]
+			point[0] += 1
+			if len(point[1]) < NAME_LIMIT:
+				point[1].append( ' '.join( [network, netname] ) if netname else network )
+
+	out = sys.stdout if outfile == '-' else open(outfile, 'w', encoding='utf-8')
+	try:
+		out.write(HEADER)
+		for s in squares:
+			square( out, *list(map( float, s[:4] )) )
+		for c in circles:
+			circle( out, *list(map( float, c[:3] )) )
+		tile( out, list(points.items()), (-90.0, 90.0, -180.0, 180.0), 0 )
+		out.write(FOOTER)
+	finally:
+		if out is not sys.stdout:
+			out.close()
+	return len(points)
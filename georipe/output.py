@@ -0,0 +1,77 @@
+'''
+	streaming output for -format tsv/csv/jsonl: rows go from the cursor to stdout one by one
+	and the summary row is kept incrementally on the side, so memory does not grow with the result
+'''
+import sys,os
+
+FORMATS = ('table', 'tsv', 'csv', 'jsonl')
+BATCH = 10000
+# IPv6 keys of these items are 16-byte BLOBs (georipe.ipv6)
+KEYS = ('ip_begin', 'ip_end')
+
+
+def batched(rows, item, resolve, size=BATCH):
+	'''rows with one more item, found by resolve() for every batch of "size" rows (resolve_ripe)'''
+	from georipe import planner
+	batch = []
+	for row in rows:
+		batch.append(row)
+		if len(batch) == size:
+			yield from planner.add_column( batch, item, resolve(batch) )
+			batch = []
+	if batch:
+		yield from planner.add_column( batch, item, resolve(batch) )
+
+
+def numbers(rows, items):
+	'''
+		rows with the IPv6 keys of KEYS as numbers, as the server sends them (default=ipv6.number):
+		bytes are no JSON and print as b'...'; a list stays a list, a generator a generator
+	'''
+	from georipe import planner, ipv6
+	if not any( [item in KEYS for item in items] ):
+		return rows
+	Row = planner.record(items)
+	number = lambda item, value: ipv6.number(value) if item in KEYS and isinstance(value, bytes) else value
+	converted = ( Row( map(number, items, row) ) for row in planner.values(rows, items) )
+	return list(converted) if isinstance(rows, list) else converted
+
+
+def text(value):
+	return str(value or '').replace('\t', ' ').replace('\r', ' ').replace('\n', ' ')
+
+
+def write(rows, items, fmt, range_item, out=None):
+	'''writes rows as they come and the summary to stderr; returns the number of rows'''
+	import csv, json
+	from georipe import planner, stats
+	out = out or sys.stdout
+	summary = stats.Summary(items, range_item) if len(items) > 1 else None
+	n = 0
+	try:
+		if fmt == 'csv':
+			writer = csv.writer(out, lineterminator='\n')
+			writer.writerow(items)
+			emit = lambda row: writer.writerow( ['' if v is None else v for v in row] )
+		elif fmt == 'jsonl':
+			emit = lambda row: out.write( json.dumps( dict( zip(items, row) ) ) + '\n' )
+		else:
+			if len(items) > 1:
+				out.write( '\t'.join(items) + '\n' )
+			emit = lambda row: out.write( '\t'.join( [text(v) for v in row] ) + '\n' )
+		for row in planner.values(rows, items):
+			emit(row)
+			if summary:
+				summary.add(row)
+			n += 1
+		out.flush()
+	except BrokenPipeError:
+		# the reader went away (| head): stop quietly, without a traceback at exit
+		os.dup2( os.open(os.devnull, os.O_WRONLY), out.fileno() )
+		return n
+	finally:
+		if hasattr(rows, 'close'):
+			rows.close()
+	if summary:
+		sys.stderr.write( stats.line( n, summary.stat(), items ) + '\n' )
+	return n
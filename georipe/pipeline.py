@@ -0,0 +1,219 @@
+'''
+	rwhois -update as a pipeline: every dump is downloaded by its own thread, parsed by a pool of
+	processes as soon as it is on disk and written by this process, the only one holding the
+	database, from a bounded queue of row batches; downloads, parsing and inserts overlap and
+	a slow writer holds the parsers back instead of piling rows up in memory
+'''
+import os
+import sys
+import time
+
+QUEUE_SIZE = 16
+READ_BUFFER = 1 << 20
+
+
+def mirrored(url, mirror):
+	'''url of a dump on a mirror, a directory or a base URL holding the dumps by their file names'''
+	name = url.rsplit('/', 1)[-1]
+	if os.path.isdir(mirror):
+		return os.path.join(mirror, name)
+	return mirror.rstrip('/') + '/' + name
+
+
+def fetch(url, progress, job):
+	'''(path, temporary) of the dump at url, a local file (a path without a scheme) is used where it is'''
+	import urllib.request
+	from tempfile import NamedTemporaryFile
+	if url.find('://') == -1:
+		progress[job] = os.path.getsize(url)
+		return url, False
+	with urllib.request.urlopen(url) as resp, NamedTemporaryFile(delete=False) as tmpfile:
+		try:
+			while True:
+				data = resp.read(1 << 16)
+				if not data:
+					break
+				tmpfile.write(data)
+				progress[job] += len(data)
+		except:
+			os.unlink(tmpfile.name)
+			raise
+	return tmpfile.name, True
+
+
+def parser(jobs, batches):
+	'''worker process: rows of the dumps read from "jobs" go to "batches", each dump ends with (job, None, seconds or error)'''
+	import io
+	import gzip
+	from georipe import rpsl
+	for job,path,keys,fields,columns,extra in iter(jobs.get, None):
+		started = time.time()
+		# time blocked on a full queue is the writer's, not parsing
+		waited = 0.0
+		try:
+			with gzip.open(path, 'rb') as gz:
+				for objects,rows in rpsl.batches( io.BufferedReader(gz, READ_BUFFER), keys, fields, columns, extra ):
+					put = time.time()
+					batches.put( (job, objects, rows) )
+					waited += time.time() - put
+			batches.put( (job, None, time.time() - started - waited) )
+		except Exception as e:
+			batches.put( (job, None, "%s: %s" % ( type(e).__name__, e )) )
+
+
+def run(rir, dumps, workers=None, incremental=False):
+	'''
+		dumps: (source, url, keys, fields) of every file to import into rir; the first batch of a source
+		resets its rows (rir.reset_db), sources which fail to download keep theirs;
+		incremental: rows are staged and merged (rir.merge) once all dumps of their source are read,
+		sources with a failed dump keep their rows;
+		returns {source: {download, bytes, parse, write, networks, rows, errors}} with seconds of every stage
+		and the errors of every failed dump of the source,
+		and the objects added, changed and removed by an incremental update
+	'''
+	import queue
+	import multiprocessing
+	from concurrent.futures import ThreadPoolExecutor
+	from georipe.rwhois import entries
+
+	columns = entries + ('hash',)
+	statement = "INSERT INTO %s(%s, source) VALUES(%s)" % ( rir.staging() if incremental else 'networks', ','.join(columns), ','.join( '?' * ( len(columns) + 1 ) ) )
+	workers = max( 1, min( workers or os.cpu_count() or 1, len(dumps) ) )
+	# the workers are forked before any download thread runs: fork copies no thread, and
+	# unlike spawn it does not run the main script (bin/rwhois) again in every worker
+	context = multiprocessing.get_context( 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None )
+	jobs, batches = context.Queue(), context.Queue(QUEUE_SIZE)
+	parsers = [context.Process( target=parser, args=(jobs, batches), daemon=True ) for _ in range(workers)]
+	for process in parsers:
+		process.start()
+
+	stats = {}
+	for source,url,keys,fields in dumps:
+		stats.setdefault( source, {'download': 0.0, 'bytes': 0, 'parse': 0.0, 'write': 0.0, 'networks': 0, 'rows': 0, 'errors': []} )
+	progress = [0] * len(dumps)
+	networks = [0] * len(dumps)
+	state = ['downloading'] * len(dumps)
+	files = [None] * len(dumps)
+	started = time.time()
+	reset = set()
+	remaining = {}
+	for source,url,keys,fields in dumps:
+		remaining[source] = remaining.get(source, 0) + 1
+
+	def download(job):
+		began = time.time()
+		try:
+			return fetch( dumps[job][1], progress, job )
+		finally:
+			stats[ dumps[job][0] ]['download'] += time.time() - began
+
+	def merge(source):
+		if stats[source]['errors']:
+			# a registry read in part would lose the objects of the rest
+			rir.sql.execute("DELETE FROM temp.staging WHERE source = ?", (source,))
+		else:
+			registry_jobs = [job for job in range( len(dumps) ) if dumps[job][0] == source]
+			for job in registry_jobs:
+				state[job] = 'merging'
+			status()
+			began = time.time()
+			stats[source].update( rir.merge(source) )
+			stats[source]['write'] += time.time() - began
+			for job in registry_jobs:
+				state[job] = 'done'
+
+	def status():
+		line = ' | '.join( [
+			"%s %s" % ( dumps[job][0], "%.1f MB" % ( progress[job] / 1e6 ) if state[job] == 'downloading' else state[job] )
+			for job in range( len(dumps) )
+		] )
+		sys.stdout.write( "\r%s %.0fs " % ( line, time.time() - started ) )
+		sys.stdout.flush()
+
+	pending = len(dumps)
+	try:
+		with ThreadPoolExecutor( max_workers=len(dumps) or 1 ) as downloads:
+			futures = dict( [(downloads.submit(download, job), job) for job in range( len(dumps) )] )
+			last = 0
+			while pending:
+				for future in [future for future in futures if future.done()]:
+					job = futures.pop(future)
+					source, url, keys, fields = dumps[job]
+					stats[source]['bytes'] += progress[job]
+					if future.exception():
+						stats[source]['errors'].append( "download %s: %s" % ( url, future.exception() ) )
+						state[job] = 'failed'
+						pending -= 1
+						remaining[source] -= 1
+						if incremental and not remaining[source]:
+							merge(source)
+					else:
+						files[job] = future.result()
+						state[job] = 'parsing'
+						jobs.put( ( job, files[job][0], keys, fields, columns, (source,) ) )
+				try:
+					job, objects, rows = batches.get( timeout=0.2 )
+				except queue.Empty:
+					if not all( [process.is_alive() for process in parsers] ):
+						raise Exception("a parser process exited")
+					if time.time() - last > 1:
+						status()
+						last = time.time()
+					continue
+				source = dumps[job][0]
+				if objects is None:
+					# the end of a dump: seconds spent parsing it, or the error which stopped it
+					if isinstance(rows, str):
+						stats[source]['errors'].append( "parse %s: %s" % ( dumps[job][1], rows ) )
+						state[job] = 'failed'
+					else:
+						stats[source]['parse'] += rows
+						state[job] = 'done'
+					pending -= 1
+					remaining[source] -= 1
+					if incremental and not remaining[source]:
+						merge(source)
+					rir.db.commit()
+					path, temporary = files[job]
+					if temporary:
+						os.unlink(path)
+						files[job] = None
+					continue
+				if source not in reset and not incremental:
+					rir.reset_db(source)
+					reset.add(source)
+				began = time.time()
+				rir.sql.executemany(statement, rows)
+				stats[source]['write'] += time.time() - began
+				stats[source]['networks'] += objects
+				stats[source]['rows'] += len(rows)
+				networks[job] += objects
+				state[job] = "%d networks" % networks[job]
+				if time.time() - last > 1:
+					status()
+					last = time.time()
+		status()
+		sys.stdout.write("\n")
+	finally:
+		for process in parsers:
+			jobs.put(None)
+		for process in parsers:
+			process.join(1)
+			if process.is_alive():
+				process.terminate()
+		for path,temporary in filter(None, files):
+			if temporary:
+				os.unlink(path)
+		rir.db.commit()
+	return stats
+
+
+def report(stats):
+	for source,stat in stats.items():
+		if stat['errors']:
+			print( "%s: %s" % ( source, '; '.join(stat['errors']) ) )
+		else:
+			line = "%s: download %.1fs (%.1f MB), parse %.1fs, write %.1fs, %d networks" % ( source, stat['download'], stat['bytes'] / 1e6, stat['parse'], stat['write'], stat['networks'] )
+			if 'changed' in stat:
+				line += ": %d added, %d changed, %d removed" % ( stat['added'], stat['changed'], stat['removed'] )
+			print(line)
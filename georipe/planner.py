@@ -0,0 +1,181 @@
+'''
+	set-based search: every multi-valued parameter is loaded into a temp table
+	and joined against the searched table, so one SQL statement answers all
+	combinations of values instead of one round trip per combination
+'''
+from georipe import profile
+
+SHARED_LIMIT = 65536
+records = {}
+
+def record(items):
+	'''
+		tuple type for rows of "items", read like a dict: row['city'], row.get('city'), dict(row);
+		without a dict per row a result takes a fraction of the memory
+	'''
+	names = tuple(items)
+	if names not in records:
+		index = dict( [(name,n) for n,name in reversed( list(enumerate(names)) )] )
+
+		class Row(tuple):
+			__slots__ = ()
+			fields = names
+
+			def __getitem__(self, key):
+				return tuple.__getitem__( self, index[key] if key.__class__ is str else key )
+
+			def get(self, key, default=None):
+				n = index.get(key)
+				return default if n is None else tuple.__getitem__(self, n)
+
+			def keys(self):
+				return names
+
+			def items(self):
+				return list( zip(names, self) )
+
+			def __repr__(self):
+				return repr( dict( zip(names, self) ) )
+
+		records[names] = Row
+	return records[names]
+
+
+def add_column(rows, item, values):
+	'''rows with one more item, e.g. a netname found by a resolver'''
+	rows = list(rows)
+	if not rows:
+		return rows
+	Row = record( rows[0].fields + (item,) )
+	return [Row( row + (value,) ) for row,value in zip(rows, values)]
+
+
+def column(rows, item):
+	'''one item of every row in a list of rows, None if rows do not have it'''
+	from itertools import repeat
+	if not rows or item not in rows[0].fields:
+		return [None] * len(rows)
+	# tuple.__getitem__ skips the item name lookup of Row.__getitem__
+	return map( tuple.__getitem__, rows, repeat( rows[0].fields.index(item) ) )
+
+
+def values(rows, items):
+	'''tuple of items for every row in a list or a generator of rows, None for items rows do not have'''
+	from itertools import repeat
+	index = None
+	for row in rows:
+		if index is None:
+			index = [row.fields.index(item) if item in row.fields else None for item in items]
+			same = index == list( range( len(row.fields) ) )
+			missing = None in index
+		if same:
+			yield row
+		elif missing:
+			yield tuple( [None if n is None else tuple.__getitem__(row, n) for n in index] )
+		else:
+			yield tuple( map( tuple.__getitem__, repeat(row, len(index)), index ) )
+
+
+def search(db, table, items, params, bind, predicate, indexed=()):
+	return list( iter_search(db, table, items, params, bind, predicate, indexed, share=True) )
+
+
+def iter_search(db, table, items, params, bind, predicate, indexed=(), share=False):
+	'''
+		bind(attr, val) -> dict of columns stored for one value of a parameter
+		predicate(attr, p) -> SQL condition between row "t" and value row "p"
+		indexed -> parameters which narrow "t" through an index, joined as outer loops
+		share -> rows refer to one copy of each repeated value (city, country, lat...),
+		worth it when the rows are kept rather than streamed
+
+		the query runs at once, its rows are generated one by one straight from the cursor
+		and the temp tables are dropped when the generator is exhausted or closed
+	'''
+	items = list(items)
+	tables = []
+	try:
+		source, order = prepare(db, table, params, bind, predicate, indexed, tables)
+		query = "SELECT %s %s %s" % ( ','.join(['t.'+i for i in items]), source, order )
+		profile.explain(db, query)
+		with profile.stage('query'):
+			cursor = db.execute(query)
+	except:
+		drop(db, tables)
+		raise
+	return profile.rows( fetch(db, cursor, items, tables, share) )
+
+
+def aggregate(db, table, columns, params, bind, predicate, indexed=(), group_by=()):
+	'''
+		rows of SQL aggregates "columns" over the rows a search would return,
+		one row or one per group of "group_by" columns, without fetching those rows
+	'''
+	tables = []
+	try:
+		source, order = prepare(db, table, params, bind, predicate, indexed, tables)
+		query = "SELECT %s %s" % ( ','.join(columns), source )
+		if group_by:
+			query += " GROUP BY " + ','.join(group_by)
+		profile.explain(db, query)
+		with profile.stage('query'):
+			return db.execute(query).fetchall()
+	finally:
+		drop(db, tables)
+
+
+def prepare(db, table, params, bind, predicate, indexed, tables):
+	'''loads params into temp tables (appended to "tables"); returns the FROM..WHERE and ORDER BY clauses'''
+	outer = []
+	inner = []
+	# rows grouped by value in the order of the values, for every parameter with more than one
+	ordered = []
+	for n,(attr,vals) in enumerate(params.items()):
+		name = "_search_param_%d" % n
+		values = [bind(attr, val) for val in vals]
+		columns = list(values[0].keys()) if values else ['val']
+		db.execute("DROP TABLE IF EXISTS temp.%s" % name)
+		db.execute("CREATE TEMP TABLE %s(seq INTEGER PRIMARY KEY, %s)" % ( name, ','.join(columns) ))
+		tables.append(name)
+		db.executemany(
+			"INSERT INTO temp.%s(%s) VALUES(%s)" % ( name, ','.join(columns), ','.join('?'*len(columns)) ),
+			[[value[c] for c in columns] for value in values]
+		)
+		alias = "p%d" % n
+		# no values, no rows: the table has none of the columns the predicate reads
+		( outer if attr in indexed else inner ).append( (alias, name, predicate(attr, alias) if values else "0") )
+		if len(values) > 1:
+			ordered.append(alias)
+
+	# CROSS JOIN keeps this order: indexed values drive lookups into "t",
+	# while pattern values are checked against each row during one scan
+	joins = ["temp.%s AS %s" % (name, alias) for alias,name,_ in outer] + ["%s AS t" % table] + ["temp.%s AS %s" % (name, alias) for alias,name,_ in inner]
+	source = "FROM " + ' CROSS JOIN '.join(joins)
+	conditions = [condition for _,_,condition in outer + inner]
+	if conditions:
+		source += " WHERE " + ' AND '.join(conditions)
+	order = "ORDER BY " + ','.join([alias+'.seq' for alias in ordered]) if ordered else ""
+	return source, order
+
+
+def fetch(db, cursor, items, tables, share=False):
+	Row = record(items)
+	try:
+		if share:
+			# columns with mostly distinct values (network) are forgotten every SHARED_LIMIT rows
+			values = [{} for item in items]
+			for n,result in enumerate(cursor, 1):
+				yield Row( map(dict.setdefault, values, result, result) )
+				if not n % SHARED_LIMIT:
+					for column in values:
+						if len(column) >= SHARED_LIMIT:
+							column.clear()
+		else:
+			for result in cursor:
+				yield Row(result)
+	finally:
+		drop(db, tables)
+
+
+def drop(db, tables):
+	for name in tables:
+		db.execute("DROP TABLE IF EXISTS temp.%s" % name)
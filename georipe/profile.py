@@ -0,0 +1,205 @@
+'''
+	-profile: wall time and rows of every stage of a search (args, search, query, rows, resolve, output),
+	the SQL statements run by every connection opened meanwhile and the query plan of each distinct one;
+	a stage entered inside another stops the clock of the outer one, so the times add up to the total.
+	Rows streamed to the output are fetched while writing them: their time is "rows", not "output"
+'''
+import re
+import sys
+import time
+
+active = None
+STRINGS = re.compile( r"\b[xX]'[0-9a-fA-F]*'|'(?:[^']|'')*'" )
+NUMBERS = re.compile( r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b" )
+LISTS = re.compile( r"\?(?:\s*,\s*\?)+" )
+QUERIES = ('SELECT', 'WITH')
+
+
+def shape(statement):
+	'''statement with its values as "?" and lists of values as "?,...": one shape for every query made the same way'''
+	statement = NUMBERS.sub( '?', ' '.join( statement.split() ) )
+	# those SQLite runs for virtual tables ("-- ...", e.g. FTS5 reading its content table) quote names as strings
+	if not statement.startswith('--'):
+		statement = STRINGS.sub('?', statement)
+	return LISTS.sub('?,...', statement)
+
+
+class Profile:
+
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.since = self.started
+		self.stack = []
+		# name -> [seconds, rows], in the order the stages first ran
+		self.stages = {}
+		self.statements = 0
+		# shape -> {'sql', 'count', 'plan'} and the connection it ran on
+		self.queries = {}
+		self.connections = {}
+		self.explaining = False
+
+	def attach(self, db):
+		db.set_trace_callback( lambda statement: self.trace(db, statement) )
+
+	def trace(self, db, statement):
+		if self.explaining:
+			return
+		self.statements += 1
+		key = shape(statement)
+		if key not in self.queries:
+			self.queries[key] = {'sql': key, 'count': 0, 'plan': None}
+			self.connections[key] = (db, statement)
+		self.queries[key]['count'] += 1
+
+	def start(self, name):
+		now = time.perf_counter()
+		if self.stack:
+			self.stages[ self.stack[-1] ][0] += now - self.since
+		self.stages.setdefault( name, [0.0, None] )
+		self.stack.append(name)
+		self.since = now
+
+	def stop(self, rows=None):
+		now = time.perf_counter()
+		name = self.stack.pop()
+		self.stages[name][0] += now - self.since
+		if rows is not None:
+			self.stages[name][1] = ( self.stages[name][1] or 0 ) + rows
+		self.since = now
+
+	def rows(self, rows):
+		'''rows of a generator, the time taken to make them goes to the "rows" stage'''
+		rows = iter(rows)
+		try:
+			while True:
+				self.start('rows')
+				try:
+					row = next(rows)
+				except StopIteration:
+					self.stop(0)
+					return
+				except:
+					self.stop()
+					raise
+				self.stop(1)
+				yield row
+		finally:
+			# a search generator drops its temp tables once closed
+			if hasattr(rows, 'close'):
+				rows.close()
+
+	def explain(self, db, statement):
+		'''query plan of a statement which is about to run, while the temp tables it reads still exist'''
+		key = shape(statement)
+		if key in self.queries and self.queries[key]['plan'] is not None:
+			return
+		self.queries.setdefault( key, {'sql': key, 'count': 0, 'plan': None} )
+		self.queries[key]['plan'] = plan(db, statement, self)
+
+	def document(self):
+		'''the profile as a dict: seconds, stages, statements and queries (the busiest first)'''
+		for key,(db,statement) in self.connections.items():
+			if self.queries[key]['plan'] is None and statement.lstrip().upper().startswith(QUERIES):
+				self.queries[key]['plan'] = plan(db, statement, self)
+		return {
+			'seconds': round( time.perf_counter() - self.started, 6 ),
+			'stages': [{'stage': name, 'seconds': round(seconds, 6), 'rows': rows} for name,(seconds,rows) in self.stages.items()],
+			'statements': self.statements,
+			'queries': sorted( self.queries.values(), key=lambda query: -query['count'] )
+		}
+
+	def write(self, out=None):
+		doc = self.document()
+		out = out or sys.stderr
+		out.write( "profile: %.3fs, %d SQL statements\n" % ( doc['seconds'], doc['statements'] ) )
+		for stage in doc['stages']:
+			out.write( "  %-8s %10.4fs%s\n" % ( stage['stage'], stage['seconds'], '' if stage['rows'] is None else " %10d rows" % stage['rows'] ) )
+		for query in doc['queries']:
+			out.write( "%6d  %s\n" % ( query['count'], query['sql'] ) )
+			for line in query['plan'] or ():
+				out.write( "        %s\n" % line )
+		out.flush()
+
+
+def plan(db, statement, profile=None):
+	'''EXPLAIN QUERY PLAN of a statement as lines indented by their depth in the plan'''
+	import sqlite3
+	if profile:
+		profile.explaining = True
+	try:
+		depth = {0: -1}
+		lines = []
+		for node,parent,_,detail in db.execute( "EXPLAIN QUERY PLAN " + statement ).fetchall():
+			depth[node] = depth.get(parent, -1) + 1
+			lines.append( "  " * depth[node] + detail )
+		return lines
+	except sqlite3.Error as e:
+		return ["unavailable: %s" % e]
+	finally:
+		if profile:
+			profile.explaining = False
+
+
+def enable():
+	'''profile of what runs from now on, also what the module functions below record'''
+	global active
+	active = Profile()
+	return active
+
+
+def attach(db):
+	if active:
+		active.attach(db)
+
+
+def start(name):
+	if active:
+		active.start(name)
+
+
+def stop(rows=None):
+	if active:
+		active.stop(rows)
+
+
+class stage:
+	'''with stage(name): ... time of the block goes to a stage of the active profile, if any'''
+
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		start(self.name)
+
+	def __exit__(self, *exc):
+		stop()
+
+
+def rows(iterable):
+	return active.rows(iterable) if active else iterable
+
+
+def explain(db, statement):
+	if active:
+		active.explain(db, statement)
+
+
+def wrap(name, fn):
+	'''fn which runs as a stage of the active profile'''
+	def profiled(*args, **kwargs):
+		with stage(name):
+			return fn(*args, **kwargs)
+	return profiled if active else fn
+
+
+def report(path=''):
+	'''writes the active profile to stderr, or as JSON to the file at path'''
+	import json
+	if not active:
+		return
+	if path:
+		with open(path, 'w') as out:
+			json.dump( active.document(), out, indent=1 )
+			out.write('\n')
+	else:
+		active.write()
@@ -0,0 +1,128 @@
+'''
+	streaming parser of RPSL dumps (ripe.db.gz, arin.db...) straight from the bytes: one dict
+	lookup per attribute line, inetnum ranges split into CIDRs with integer arithmetic and rows
+	handed out in batches for executemany
+'''
+from socket import inet_aton, inet_pton, AF_INET6
+from hashlib import blake2b
+from georipe import ipv6
+
+BATCH_SIZE = 10000
+# objects of these netnames are not networks of the registry
+SKIPPED_NETNAMES = ('NON-RIPE-NCC-MANAGED-ADDRESS-BLOCK',)
+
+
+def ipv4_number(ip):
+	'''number of a dotted IPv4 address, missing octets are zeros: 10/8 is 10.0.0.0/8'''
+	octets = ip.split('.')
+	if len(octets) == 4:
+		return int.from_bytes( inet_aton(ip), 'big' )
+	octets = ( octets + ['0', '0', '0'] )[:4]
+	return int(octets[0]) << 24 | int(octets[1]) << 16 | int(octets[2]) << 8 | int(octets[3])
+
+
+def ipv4_text(number, prefix):
+	return '%d.%d.%d.%d/%d' % ( number >> 24, number >> 16 & 255, number >> 8 & 255, number & 255, prefix )
+
+
+def range_to_cidrs(first, last, bits=32):
+	'''(ip_begin, ip_end, prefix) of the fewest CIDRs covering first..last'''
+	while first <= last:
+		# the largest block aligned at first which does not pass last
+		size = min( ( first & -first ).bit_length() - 1 if first else bits, ( last - first + 1 ).bit_length() - 1 )
+		yield first, first + (1 << size) - 1, bits - size
+		first += 1 << size
+
+
+def networks(value):
+	'''(ip_begin, ip_end, inetnum) of the CIDRs of an inetnum/route value, a CIDR or a range "a - b"'''
+	if value.find('/') != -1:
+		# 198.148.174.0/24, kept as written
+		ip, _, prefix = value.partition('/')
+		if ip.find(':') != -1:
+			_min, _max = ipv6.cidr_to_min_max(value)
+			return [(_min, _max, value)]
+		size = 1 << ( 32 - int(prefix) )
+		_min = ipv4_number( ip.strip() ) & ~(size - 1)
+		return [(_min, _min + size - 1, value)]
+	# 82.129.219.120 - 82.129.219.127
+	first, last = value.split('-')
+	ipv6_range = first.find(':') != -1
+	if ipv6_range:
+		first, last = [ipv6.number( inet_pton( AF_INET6, ip.strip() ) ) for ip in (first, last)]
+	else:
+		first, last = ipv4_number( first.strip() ), ipv4_number( last.strip() )
+	if first > last:
+		raise ValueError("lower bound IP greater than upper bound: %s" % value)
+	if ipv6_range:
+		return [( ipv6.key(b), ipv6.key(e), '%s/%d' % ( ipv6.text( ipv6.key(b) ), prefix ) ) for b,e,prefix in range_to_cidrs(first, last, ipv6.BITS)]
+	return [(b, e, ipv4_text(b, prefix)) for b,e,prefix in range_to_cidrs(first, last)]
+
+
+def objects(lines, keys, fields):
+	'''
+		dict of fields of every object with one of keys (attributes holding its range) in lines of bytes,
+		its CIDRs under 'networks'; repeated attributes are joined by '; ', attributes before the key,
+		continuation lines and empty values are skipped, and so are objects with a malformed range
+	'''
+	# attribute name -> True for keys, name of the field otherwise
+	names = dict( [(key.encode(), True) for key in keys] + [(field.encode(), field) for field in fields] )
+	obj = None
+	for line in lines:
+		name, colon, value = line.partition(b':')
+		entry = names.get(name) if colon else None
+		if entry is True:
+			try:
+				ranges = networks( value.strip().decode() )
+			except (ValueError, OSError):
+				# no object from a range we can not read, the rest of the dump goes on
+				obj = {}
+				continue
+			if obj is None:
+				obj = {}
+			obj['networks'] = ranges
+		elif entry is not None:
+			if obj:
+				value = value.strip()
+				if value:
+					value = value.decode(errors='ignore')
+					obj[entry] = obj[entry] + '; ' + value if entry in obj else value
+		elif obj is not None and not line.strip():
+			if obj:
+				yield obj
+			obj = None
+	if obj:
+		yield obj
+
+
+def fingerprint(networks, values):
+	'''signed 64-bit hash of what is kept of an object, the same from one dump to the next while it does not change'''
+	return int.from_bytes( blake2b( repr( (networks, values) ).encode(), digest_size=8 ).digest(), 'big', signed=True )
+
+
+def batches(lines, keys, fields, columns, extra=(), size=BATCH_SIZE):
+	'''
+		(number of objects, rows) lists of about "size" rows: a tuple of columns plus extra for every
+		CIDR of every object, ip_begin/ip_end/inetnum from its range, the fingerprint of the object
+		for a column 'hash' and '' for missing fields
+	'''
+	ranges = [columns.index(column) for column in ('ip_begin', 'ip_end', 'inetnum')]
+	digest = columns.index('hash') if 'hash' in columns else None
+	rows = []
+	n = 0
+	for obj in objects(lines, keys, fields):
+		if obj.get('netname') in SKIPPED_NETNAMES:
+			continue
+		values = [obj.get(column, '') for column in columns]
+		if digest is not None:
+			values[digest] = fingerprint( obj['networks'], values )
+		for network in obj['networks']:
+			values[ ranges[0] ], values[ ranges[1] ], values[ ranges[2] ] = network
+			rows.append( tuple(values) + extra )
+		n += 1
+		if len(rows) >= size:
+			yield n, rows
+			rows = []
+			n = 0
+	if rows or n:
+		yield n, rows
@@ -1,45 +1,86 @@
 #!/usr/bin/python3
-import sqlite3
-import netaddr
-import argparse
 import sys,os
-import itertools
+from georipe import planner, stats, ipv6, profile, cache
 
 __version__ = '2.0.1'
 entries = ('ip_begin', 'ip_end', 'inetnum', 'netname', 'descr', 'city', 'country', 'notify', 'address', 'phone')
 RIR_DB = os.path.join( os.path.dirname(__file__), 'rir.db' )
 
-try:
-	db = sqlite3.connect(RIR_DB, check_same_thread=False)
-except:
-	print("permission denied to open %s" % RIR_DB)
-	exit()
-
-db.text_factory = lambda b: b.decode(errors='ignore')
-sql = db.cursor()
-
-items = ['inetnum', 'netname']
-
-arg_parser = argparse.ArgumentParser(description="RIR search (ARIN, RIPE, APNIC, LACNIC, AfriNIC)")
-arg_parser.add_argument("-update", dest='update', nargs="*", help='update local database from remote GZ-archive')
-arg_parser.add_argument("-info", dest='info', action="store_true", help='show total amount netblocks')
-
-arg_parser.add_argument("-ip", dest='ipaddr', action="append", help='search network by IP')
-arg_parser.add_argument("-inetnum", dest='inetnum', action="append", help='search network by CIDR (parent)')
-arg_parser.add_argument("-inetnums", dest='inetnums', action="append", help='search networks by CIDR (nested)')
-arg_parser.add_argument("-netname", dest='netname', action="append", help='search networks by netname')
-arg_parser.add_argument("-descr", dest='descr', action="append", help='search networks by descr')
-arg_parser.add_argument("-city", dest='city', action="append", help='search networks by city')
-arg_parser.add_argument("-country", dest='country', action="append", help='search networks by country')
-arg_parser.add_argument("-notify", dest='notify', action="append", help='search networks by notify')
-arg_parser.add_argument("-address", dest='address', action="append", help='search networks by address')
-arg_parser.add_argument("-phone", dest='phone', action="append", help='search networks by phone')
-arg_parser.add_argument("-source", dest='source', action="append", help='search networks by source')
-
-arg_parser.add_argument("-tree", dest='tree', action="store_true", help='show tree of parents networks')
-arg_parser.add_argument("-version", dest="version", action="store_true", help="show version")
-
-arg_parser.add_argument("items", nargs='*', default=['inetnum', 'netname', 'descr', 'country', 'notify', 'address', 'phone'], help="one or more: inetnum,netname,descr,city,country,notify,address,phone")
+INDEXED_PARAMS = ('ipaddr', 'inetnum', 'inetnums', '_range')
+# columns of networks: the items a search returns, and the parameters it takes, as the options of build_parser()
+COLUMNS = entries + ('source',)
+PARAMS = ('ipaddr', 'inetnum', 'inetnums', 'netname', 'descr', 'city', 'country', 'notify', 'address', 'phone', 'source')
+# columns of the trigram index networks_text (rebuild_text_index)
+TEXT_PARAMS = ('netname', 'descr', 'address', 'notify', 'phone', 'city')
+SWEEP_THRESHOLD = 256
+# a walk up the tree for one IP costs about as much as reading this many networks in a sweep
+SWEEP_RATIO = 3
+
+# indexes of networks as (name, columns)
+INDEXES = (
+	# (ip_begin, depth): the deepest network starting before an IP is one seek
+	('ip_begin_index', 'networks(ip_begin, depth)'),
+	('ip_end_index', 'networks(ip_end)'),
+	('inetnum_index', 'networks(inetnum)')
+)
+
+# registry -> its dumps as (url, attributes with the range of an object, fields), imported by update()
+REGISTRIES = {
+	# inetnum:        197.254.108.104 - 197.254.108.107
+	'afrinic': [ ("https://ftp.afrinic.net/dbase/afrinic.db.gz", ('inetnum', 'inet6num'), ('netname', 'descr', 'country', 'notify', 'address', 'phone')) ],
+	# inetnum:    189.108.202.160/29
+	'lacnic': [ ("https://ftp.lacnic.net/lacnic/dbase/lacnic.db.gz", ('inetnum', 'inet6num'), ('country', 'city')) ],
+	# inetnum:        218.7.99.128 - 218.7.99.159
+	'apnic': [
+		("https://ftp.apnic.net/apnic/whois/apnic.db.inetnum.gz", ('inetnum',), ('netname', 'descr', 'country')),
+		("https://ftp.apnic.net/apnic/whois/apnic.db.inet6num.gz", ('inet6num',), ('netname', 'descr', 'country'))
+	],
+	# route:          198.148.174.0/24
+	'arin': [ ("https://ftp.arin.net/pub/rr/arin.db.gz", ('route', 'route6'), ('descr', 'notify')) ],
+	# inetnum:        212.140.128.192 - 212.140.128.255
+	'ripe': [ ("ftp://ftp.ripe.net/ripe/dbase/ripe.db.gz", ('inetnum', 'inet6num'), ('netname', 'descr', 'country', 'notify', 'address', 'phone')) ]
+}
+
+default_db = None
+
+def build_parser():
+	import argparse
+	from georipe import output
+	arg_parser = argparse.ArgumentParser(description="RIR search (ARIN, RIPE, APNIC, LACNIC, AfriNIC)")
+	arg_parser.add_argument("-update", dest='update', nargs="*", help='update local database from remote GZ-archive')
+	arg_parser.add_argument("-mirror", dest='mirror', help='directory or base URL with the dumps (ripe.db.gz, apnic.db.inetnum.gz...) to -update from instead of the registries')
+	arg_parser.add_argument("-update-workers", dest='update_workers', type=int, help='processes parsing the dumps of -update, the number of CPUs by default')
+	arg_parser.add_argument("-incremental", dest='incremental', action="store_true", help='-update only the networks which were added, changed or removed since the last update')
+	arg_parser.add_argument("-info", dest='info', action="store_true", help='show total amount netblocks')
+
+	arg_parser.add_argument("-ip", dest='ipaddr', action="append", help='search network by IP')
+	arg_parser.add_argument("-inetnum", dest='inetnum', action="append", help='search network by CIDR (parent)')
+	arg_parser.add_argument("-inetnums", dest='inetnums', action="append", help='search networks by CIDR (nested)')
+	arg_parser.add_argument("-netname", dest='netname', action="append", help='search networks by netname')
+	arg_parser.add_argument("-descr", dest='descr', action="append", help='search networks by descr')
+	arg_parser.add_argument("-city", dest='city', action="append", help='search networks by city')
+	arg_parser.add_argument("-country", dest='country', action="append", help='search networks by country')
+	arg_parser.add_argument("-notify", dest='notify', action="append", help='search networks by notify')
+	arg_parser.add_argument("-address", dest='address', action="append", help='search networks by address')
+	arg_parser.add_argument("-phone", dest='phone', action="append", help='search networks by phone')
+	arg_parser.add_argument("-source", dest='source', action="append", help='search networks by source')
+
+	arg_parser.add_argument("-stats-only", dest="stats_only", action="store_true", help="print only the summary row, counted without fetching the rows")
+	arg_parser.add_argument("-group-by", dest="group_by", type=lambda v: v.split(','), help="networks and IPs per value of these comma separated items, e.g. country")
+	arg_parser.add_argument("-format", dest="format", choices=output.FORMATS, default='table', help="table (default) or stream rows as tsv/csv/jsonl with the summary on stderr")
+	arg_parser.add_argument("-chain", dest='chain', action="store_true", help='show every network around the -ip addresses, from the outermost to the most specific')
+	arg_parser.add_argument("-tree", dest='tree', action="store_true", help='show tree of parents networks')
+	arg_parser.add_argument("-subtree", dest='subtree', action="store_true", help='show networks nested in the -inetnum networks as a tree')
+	arg_parser.add_argument("-server", dest="server", help="query a running 'georipe serve' at this socket path or localhost:port")
+	arg_parser.add_argument("-cache", dest="cache", action="store_true", help="reuse results of the same searches run before against the same database, kept in the -cache-file")
+	arg_parser.add_argument("-cache-file", dest="cache_file", default=cache.RESULT_CACHE, help="file of the -cache results (default ~/.cache/georipe/results.db)")
+	arg_parser.add_argument("-cache-size", dest="cache_size", type=float, default=256, help="MB of results the -cache file keeps (default 256)")
+	arg_parser.add_argument("-profile", dest="profile", action="store_true", help="report time and rows of every stage, SQL statements and their query plans on stderr")
+	arg_parser.add_argument("-profile-out", dest="profile_out", default='', help="write that report as JSON to this file instead")
+	arg_parser.add_argument("-version", dest="version", action="store_true", help="show version")
+
+	arg_parser.add_argument("items", nargs='*', default=['inetnum', 'netname', 'descr', 'country', 'notify', 'address', 'phone'], help="one or more: inetnum,netname,descr,city,country,notify,address,phone")
+	return arg_parser
 
 '''
 	RIPE: netname, descr, country, notify, address, phone
@@ -49,216 +90,71 @@ arg_parser.add_argument("items", nargs='*', default=['inetnum', 'netname', 'desc
 	ARIN: descr, notify
 '''
 
-def check_db():
-	try:
-		sql.execute("select 1 from networks limit 1")
-		return True
-	except:
-		sql.execute('CREATE TABLE networks(%s, source TEXT)' % ','.join( list(map(lambda e:"%s INT"%e if e.startswith('ip_') else "%s TEXT"%e, entries)) ))
-		return False
-
-def show_db_info():
-	for source in ('RIPE', 'AFRINIC', 'APNIC', 'LACNIC', 'ARIN'):
-		print(source + ': ', end="")
-		count, = sql.execute('SELECT COUNT(inetnum) FROM networks WHERE source=?', (source.lower(),))
-		print(count[0])
-
 def cidr_to_min_max(cidr):
-	if len( cidr.split('/') ) == 2:
-		ip_begin,mask = cidr.split('/')
-	else:
-		ip_begin = cidr
-		mask = 32
-	octets = ip_begin.split('.')
-	all_octets = []
-	for i in range(4):
-		i = octets.pop(0) if octets != [] else 0
-		all_octets.append(i)
-	a,b,c,d = all_octets
-	mask = 2**(32-int(mask)) -1
+	if cidr.find(':') != -1:
+		return ipv6.cidr_to_min_max(cidr)
+	ip_begin, _, mask = cidr.partition('/')
+	# missing octets are zeros: 10/8 is 10.0.0.0/8
+	a,b,c,d = ( ip_begin.split('.') + ['0', '0', '0'] )[:4]
+	mask = ( 1 << ( 32 - int(mask or 32) ) ) - 1
 	_min = ( (int(a)<<24) + (int(b)<<16) + (int(c)<<8) + int(d) ) & ~mask
-	_max = _min + mask
-	return _min,_max
-
-
-def reset_db(source):
-	sql.execute("DELETE FROM networks WHERE source=?", (source,))
-	db.commit()
-
-
-def download(url):
-	import urllib.request
-	from tempfile import NamedTemporaryFile
-
-	try:
-		print(url)
-		resp = urllib.request.urlopen(url)
-		size = int( resp.headers.get('content-length') or 0 )
-		downloaded = 0
-		tmpfile = NamedTemporaryFile(delete=False)
-		while True:
-			data = resp.read(4096)
-			if not data:
-				break
-			tmpfile.write(data)
-			downloaded += len(data)
-			if size:
-				done = int(50 * downloaded / size)
-				sys.stdout.write( "\r[%s%s] %d/%d bytes" % ( '=' * done, ' ' * (50-done), downloaded, size ) )
-			else:
-				sys.stdout.write( "\r%d bytes" % downloaded )
-			sys.stdout.flush()
-		return tmpfile
-	except Exception as e:
-		print(str(e))
-
-def parse(tmpfile, key, fields, source):
-	import gzip
-
-	print("\nunpacking...")
-	fields = ('ip_begin', 'ip_end') + (key,) + fields
-	try:
-		with gzip.open(tmpfile.name, 'rb') as gz:
-			gz._read_eof = lambda :False
-			sys.stdout.write('\rimporting...            ')
-			sys.stdout.flush()
-			nets = {}
-			n = 1
-			for line in gz:
-				line = line.decode(errors='ignore')
-				for entry in fields:
-					if line.startswith(entry+':'):
-						if entry == key:
-							if line.find('/') != -1: # 198.148.174.0/24
-								cidr = line[ len(entry)+1: ].strip()
-								nets['inetnum'] = [cidr]
-								nets['ip_begin'] = []
-								nets['ip_end'] = []
-								_min,_max = cidr_to_min_max(cidr)
-								nets['ip_begin'].append(_min)
-								nets['ip_end'].append(_max)
-							else: # 82.129.219.120 - 82.129.219.127
-								(ip_from, ip_to) = line[ len(entry)+1: ].strip().split('-')
-								nets['inetnum'] = []
-								nets['ip_begin'] = []
-								nets['ip_end'] = []
-								for cidr in netaddr.IPRange( ip_from.strip(), ip_to.strip() ).cidrs():
-									nets['inetnum'].append( str(cidr) )
-									_min,_max = cidr_to_min_max( str(cidr) )
-									nets['ip_begin'].append( _min )
-									nets['ip_end'].append( _max )
-						elif nets.get('inetnum'):
-							content = line[ len(entry)+1: ].strip()
-							if not content:
-								break
-							if entry in nets:
-								nets[entry] += '; ' + content
-							else:	
-								nets[entry] = content
-					elif line.strip() == '' and nets and nets.get('inetnum'):
-						if nets.get('netname') != 'NON-RIPE-NCC-MANAGED-ADDRESS-BLOCK':
-							statement = "INSERT INTO networks VALUES({values}, '{source}')".format(values=','.join( list(map(lambda e:'?', entries)) ), source=source)
-							for i in range( len( nets.get('inetnum') ) ):
-								sql.execute( statement, list(map(lambda e:nets.get(e)[i] if type(nets.get(e))==list else nets.get(e,''), entries)) )
-							n += 1
-							if n % 25000 == 0:
-								db.commit()
-								sys.stdout.write("\r%d networks" % n)
-								sys.stdout.flush()
-						nets = {}
-
-		sys.stdout.write("\r%d networks\n" % n)
-		sys.stdout.flush()
-		db.commit()
-		tmpfile.close()
-
-	except Exception as e:
-		print(str(e))
-
-
-def update_ripe():
-	'inetnum:        212.140.128.192 - 212.140.128.255'
-	with download("ftp://ftp.ripe.net/ripe/dbase/ripe.db.gz") as tmpfile:
-		parse(tmpfile, key='inetnum', fields=('netname', 'descr', 'country', 'notify', 'address', 'phone'), source='ripe')
-		os.unlink(tmpfile.name)
-	
-def update_apnic():
-	'inetnum:        218.7.99.128 - 218.7.99.159'
-	with download("https://ftp.apnic.net/apnic/whois/apnic.db.inetnum.gz") as tmpfile:
-		parse(tmpfile, key='inetnum', fields=('netname', 'descr', 'country'), source='apnic')
-		os.unlink(tmpfile.name)
-	
-def update_afrinic():
-	'inetnum:        197.254.108.104 - 197.254.108.107'
-	with download("https://ftp.afrinic.net/dbase/afrinic.db.gz") as tmpfile:
-		parse(tmpfile, key='inetnum', fields=('netname', 'descr', 'country', 'notify', 'address', 'phone'), source='afrinic')
-		os.unlink(tmpfile.name)
-
-def update_lacnic():
-	'inetnum:    189.108.202.160/29'
-	with download("https://ftp.lacnic.net/lacnic/dbase/lacnic.db.gz") as tmpfile:
-		parse(tmpfile, key='inetnum', fields=('country', 'city'), source='lacnic')
-		os.unlink(tmpfile.name)
-
-def update_arin():
-	'route:          198.148.174.0/24'
-	with download("https://ftp.arin.net/pub/rr/arin.db.gz") as tmpfile:
-		parse(tmpfile, key='route', fields=('descr', 'notify'), source='arin')
-		os.unlink(tmpfile.name)
-	
-
-def rebuild_indexes():
-	sql.execute("DROP INDEX IF EXISTS ip_begin_index")
-	sql.execute("DROP INDEX IF EXISTS ip_end_index")
-	sql.execute("DROP INDEX IF EXISTS inetnum_index")
-	sql.execute("CREATE INDEX ip_begin_index ON networks(ip_begin)")
-	sql.execute("CREATE INDEX ip_end_index ON networks(ip_end)")
-	sql.execute("CREATE INDEX inetnum_index ON networks(inetnum)")
-	db.commit()
-
-
-def do_search(items, params):
-	statement = []
-	args = []
-	for attr,val in list(params.items()):
-		if attr == 'ipaddr':
-			ip, ip = cidr_to_min_max(val)
-			statement.append( "(inetnum = (SELECT inetnum FROM networks WHERE ? BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )" )
-			args.append( ip )
-		elif attr == 'inetnum':
-			_min, _max = cidr_to_min_max( val )
-			statement.append( "(inetnum = (SELECT inetnum FROM networks WHERE ? BETWEEN ip_begin AND ip_end AND ? BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )" )
-			args.extend( [_min, _max] )
-		elif attr == 'inetnums':
-			_min, _max = cidr_to_min_max( val )
-			statement.append( "(inetnum in (SELECT inetnum FROM networks WHERE ip_begin BETWEEN ? AND ? AND ip_end BETWEEN ? AND ?) )" )
-			args.extend( [_min, _max, _min, _max] )
-		elif attr.find('no_') != -1:
-			statement.append( "(%s NOT LIKE ?)" % attr[3:] )
-			args.append( val )
-		elif attr.find('_range') != -1:
-			_min, _max = val.split('|')
-			statement.append( "(inetnum = (SELECT inetnum FROM networks WHERE ? BETWEEN ip_begin AND ip_end AND ? BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )" )
-			args.extend( [_min, _max] )
-		else:
-			statement.append( "(%s LIKE ?)" % attr )
-			args.append( val )
-
-	results = []
-	query = ( "SELECT %s FROM networks WHERE " % ','.join(items) ) + ' AND '.join(statement)
-	for result in sql.execute( query, args ):
-		results.append( dict( list(zip(items,result)) ) )
-	return results
+	return _min, _min + mask
+
+
+def bind_param(attr, val):
+	if attr == 'ipaddr':
+		ip, ip = cidr_to_min_max(val)
+		return { 'ip': ip }
+	elif attr in ('inetnum', 'inetnums'):
+		_min, _max = cidr_to_min_max( val )
+		return { 'lo': _min, 'hi': _max }
+	elif attr.startswith('no_'):
+		return { 'val': val }
+	elif attr.endswith('_range'):
+		# numbers, or hex of the 16-byte keys for IPv6
+		_min, _max = [bytes.fromhex(v) if len(v) == 2*ipv6.KEY_BYTES else int(v) for v in val.split('|')]
+		return { 'lo': _min, 'hi': _max }
+	else:
+		return { 'val': val }
+
+
+# most specific network around {lo}..{hi}: the deepest of the networks starting last at or
+# before {lo}, then up its parents until one reaches {hi} (rebuild_tree)
+PARENT_WALK = '''(WITH RECURSIVE up(id, parent, ip_end) AS (
+	SELECT * FROM (SELECT rowid, parent, ip_end FROM networks WHERE ip_begin <= {lo} ORDER BY ip_begin DESC, depth DESC LIMIT 1)
+	UNION ALL SELECT n.rowid, n.parent, n.ip_end FROM up JOIN networks AS n ON n.rowid = up.parent WHERE up.ip_end < {hi}
+) SELECT id FROM up WHERE ip_end >= {hi} LIMIT 1)'''
+
+
+def param_condition(attr, p, tree=False):
+	if tree and attr == 'ipaddr':
+		return "(t.inetnum = (SELECT inetnum FROM networks WHERE rowid = %s) )" % PARENT_WALK.format( lo=p+'.ip', hi=p+'.ip' )
+	elif tree and (attr == 'inetnum' or attr.endswith('_range')):
+		return "(t.inetnum = (SELECT inetnum FROM networks WHERE rowid = %s) )" % PARENT_WALK.format( lo=p+'.lo', hi=p+'.hi' )
+	elif attr == 'ipaddr':
+		return "(t.inetnum = (SELECT inetnum FROM networks WHERE {p}.ip BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )".format(p=p)
+	elif attr == 'inetnum':
+		return "(t.inetnum = (SELECT inetnum FROM networks WHERE {p}.lo BETWEEN ip_begin AND ip_end AND {p}.hi BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )".format(p=p)
+	elif attr == 'inetnums':
+		return "(t.ip_begin BETWEEN {p}.lo AND {p}.hi AND t.ip_end BETWEEN {p}.lo AND {p}.hi)".format(p=p)
+	elif attr.startswith('no_') and attr[3:] in COLUMNS:
+		return "(t.%s NOT LIKE %s.val)" % ( attr[3:], p )
+	elif attr.endswith('_range'):
+		return "(t.inetnum = (SELECT inetnum FROM networks WHERE {p}.lo BETWEEN ip_begin AND ip_end AND {p}.hi BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) )".format(p=p)
+	elif attr in COLUMNS:
+		return "(t.%s LIKE %s.val)" % ( attr, p )
+	else:
+		# the name goes into the SQL statement
+		raise ValueError( "unknown search parameter %r" % attr )
 
 
-def search(items, params):
-	results = []
-	for attrs in itertools.product( *params.values() ):
-		results += do_search( items, dict( list(zip(params.keys(), attrs)) ) )
-	return results
+def has_trigram(pattern):
+	'''LIKE pattern with three characters in a row between the wildcards, which the trigram index can narrow'''
+	import re
+	return re.search('[^%_]{3}', pattern) is not None
 
 
-def rir_search(args):
+def read_params(args):
 	params = {}
 	for attr,vals in list(args.items()):
 		params[attr] = []
@@ -279,86 +175,701 @@ def rir_search(args):
 				break
 			else:
 				params[attr].append(val)
-	return search(items, params)
+	return params
+
+
+class RIRDatabase:
+	'''
+		RIR networks database behind its own connection, opened by open() and released by close();
+		use one instance per thread
+	'''
+
+	def __init__(self, path=RIR_DB, readonly=False, cache=None):
+		self.path = path
+		self.readonly = readonly
+		# georipe.cache.ResultCache of search(), iter_search() and do_search()
+		self.cache = cache
+		self.db = None
+		self.sql = None
+		# file_id() of the file the connection reads
+		self.inode = None
+		self.tree = None
+		self.text_index = None
+		self.ip_batch_threshold = SWEEP_THRESHOLD
+
+	def open(self):
+		import sqlite3
+		from georipe import shadow
+		# before the file is opened: a replacement in between only costs one more open (reopen())
+		self.inode = shadow.file_id(self.path)
+		if self.readonly:
+			self.db = sqlite3.connect('file:%s?mode=ro' % self.path, uri=True, check_same_thread=False)
+		else:
+			self.db = sqlite3.connect(self.path, check_same_thread=False)
+			# a new database
+			self.inode = self.inode or shadow.file_id(self.path)
+		self.db.text_factory = lambda b: b.decode(errors='ignore')
+		ipv6.register(self.db)
+		profile.attach(self.db)
+		self.sql = self.db.cursor()
+		return self
+
+	def close(self):
+		if self.db:
+			self.db.close()
+		self.db = self.sql = None
+
+	def reopen(self):
+		'''
+			opens the database again if an update in another process or instance replaced its file (georipe.shadow):
+			the connection would go on reading the old one; searches call it first
+		'''
+		from georipe import shadow
+		if self.db and shadow.file_id(self.path) != self.inode:
+			self.close()
+			self.open()
+			self.tree = self.text_index = None
+
+	def __enter__(self):
+		return self.open()
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def check_db(self):
+		try:
+			self.sql.execute("select 1 from networks limit 1")
+			return True
+		except:
+			self.sql.execute('CREATE TABLE networks(%s, source TEXT, parent INT, depth INT, hash INT)' % ','.join( list(map(lambda e:"%s INT"%e if e.startswith('ip_') else "%s TEXT"%e, entries)) ))
+			return False
+
+	def show_db_info(self):
+		for source in ('RIPE', 'AFRINIC', 'APNIC', 'LACNIC', 'ARIN'):
+			print(source + ': ', end="")
+			count, = self.sql.execute('SELECT COUNT(inetnum) FROM networks WHERE source=?', (source.lower(),))
+			print(count[0])
+
+	def reset_db(self, source):
+		# rebuild_indexes() makes them again once all rows are in: the delete and the inserts
+		# skip their upkeep, and the text index would miss the new rows until then
+		for index,_ in INDEXES:
+			self.sql.execute("DROP INDEX IF EXISTS %s" % index)
+		self.sql.execute("DROP TABLE IF EXISTS networks_text")
+		self.sql.execute("DELETE FROM networks WHERE source=?", (source,))
+		self.text_index = False
+		self.db.commit()
+
+	def counts(self):
+		'''{source: rows} of networks, empty before the first update'''
+		if not self.sql.execute("SELECT 1 FROM sqlite_master WHERE name='networks'").fetchone():
+			return {}
+		return dict( self.sql.execute("SELECT source, COUNT(*) FROM networks GROUP BY source").fetchall() )
+
+	def update(self, registries=None, mirror=None, workers=None, incremental=False):
+		'''
+			imports the dumps of registries (load()) into a shadow of the database (georipe.shadow) and indexes
+			it there, it replaces the database once analyzed and verified: searches go on against the old one
+			meanwhile; incremental: the shadow starts as a copy of the database (the whole file is read and
+			written once, as the price of leaving the database untouched until the rename) and only the objects
+			which changed are written, otherwise it starts empty and the registries which are not imported, or fail
+			to, keep their rows (keep()); returns the statistics of every registry (pipeline.run)
+		'''
+		from georipe import shadow
+		before = self.counts()
+		path = shadow.create(self.path, copy=incremental)
+		rir = RIRDatabase(path).open()
+		problems = ["nothing imported"]
+		try:
+			shadow.prepare(rir.db)
+			stats = rir.load(registries, mirror, workers, incremental)
+			imported = [source for source,stat in stats.items() if stat['rows'] and not stat['errors']]
+			if not imported:
+				# the database as it is
+				return stats
+			if incremental:
+				rir.update_indexes()
+			else:
+				rir.keep( self.path, [source for source in before if source not in imported] )
+				rir.rebuild_indexes()
+			shadow.analyze(rir.db)
+			problems = shadow.verify( before, rir.counts() )
+		finally:
+			rir.close()
+			if problems:
+				shadow.discard(path)
+		if problems:
+			print( "%s kept: %s" % ( self.path, '; '.join(problems) ) )
+			return stats
+		shadow.replace(path, self.path)
+		self.tree = self.text_index = None
+		if self.db:
+			# the connection still reads the file which was replaced
+			self.close()
+			self.open()
+		return stats
+
+	def load(self, registries=None, mirror=None, workers=None, incremental=False):
+		'''
+			downloads and imports the dumps of registries (all by default) through the pipeline,
+			from mirror (a directory or a base URL) instead of the registries when given;
+			incremental: only the objects which changed are written (merge), then update_indexes()
+			rather than rebuild_indexes() is due; returns the statistics of every registry (pipeline.run)
+		'''
+		from georipe import pipeline
+		dumps = []
+		for registry in registries or REGISTRIES:
+			registry = registry.lower()
+			if registry not in REGISTRIES:
+				print( "unknown registry '%s', use %s" % ( registry, ','.join(REGISTRIES) ) )
+				continue
+			for url,keys,fields in REGISTRIES[registry]:
+				dumps.append( ( registry, pipeline.mirrored(url, mirror) if mirror else url, keys, fields ) )
+		self.check_db()
+		if not self.has_column('hash'):
+			self.sql.execute("ALTER TABLE networks ADD COLUMN hash INT")
+		stats = pipeline.run(self, dumps, workers, incremental)
+		pipeline.report(stats)
+		return stats
+
+	def keep(self, path, sources):
+		'''the rows of sources in the database at path, in place of any imported for them'''
+		if not sources:
+			return
+		self.db.commit()
+		self.sql.execute("ATTACH DATABASE ? AS live", (path,))
+		try:
+			columns = ','.join( list(entries) + ['source'] + ( ['hash'] if 'hash' in [row[1] for row in self.sql.execute("PRAGMA live.table_info(networks)")] else [] ) )
+			for source in sources:
+				self.sql.execute("DELETE FROM networks WHERE source = ?", (source,))
+				self.sql.execute( "INSERT INTO networks(%s) SELECT %s FROM live.networks WHERE source = ?" % (columns, columns), (source,) )
+			self.db.commit()
+		finally:
+			self.sql.execute("DETACH DATABASE live")
+
+	def update_ripe(self):
+		return self.update(['ripe'])
+
+	def update_apnic(self):
+		return self.update(['apnic'])
+
+	def update_afrinic(self):
+		return self.update(['afrinic'])
+
+	def update_lacnic(self):
+		return self.update(['lacnic'])
+
+	def update_arin(self):
+		return self.update(['arin'])
+
+	def rebuild_indexes(self):
+		for index,_ in INDEXES:
+			self.sql.execute("DROP INDEX IF EXISTS %s" % index)
+		self.rebuild_tree()
+		for index,columns in INDEXES:
+			self.sql.execute("CREATE INDEX %s ON %s" % (index, columns))
+		self.rebuild_text_index()
+		cache.stamp(self.db)
+		self.db.commit()
+
+	def update_indexes(self):
+		'''indexes after merge(), which keeps them up to date: the missing ones are made and the tree follows the rows'''
+		for index,columns in INDEXES:
+			self.sql.execute("CREATE INDEX IF NOT EXISTS %s ON %s" % (index, columns))
+		self.rebuild_tree()
+		if not self.has_text_index():
+			self.rebuild_text_index()
+		cache.stamp(self.db)
+		self.db.commit()
+
+	def staging(self):
+		'''temp table of the rows of an incremental update, the columns of networks; merge() applies them'''
+		self.sql.execute( "CREATE TEMP TABLE IF NOT EXISTS staging(%s, hash INT, source TEXT)" % ','.join(entries) )
+		return 'temp.staging'
+
+	def merge(self, source):
+		'''
+			applies the rows of source in temp.staging to networks: the rows of objects which came, changed or
+			went are inserted or deleted, the others stay as they are and so do their entries in the indexes;
+			returns the numbers of objects added, changed (the same range) and removed
+		'''
+		columns = ','.join(entries)
+		text = ','.join(TEXT_PARAMS)
+		for table in ('stored', 'diff', 'gone'):
+			self.sql.execute("DROP TABLE IF EXISTS temp.%s" % table)
+		# fingerprints (rpsl.fingerprint) of the stored rows by one scan, an index of random
+		# hashes would have most of its pages written by every update
+		self.sql.execute("CREATE TEMP TABLE stored AS SELECT rowid AS id, hash FROM networks WHERE source = ?", (source,))
+		# a fingerprint with as many staged rows as stored ones is unchanged, duplicate objects included;
+		# rows stored before fingerprints were (hash NULL) all go
+		self.sql.execute("CREATE TEMP TABLE diff(hash INT PRIMARY KEY)")
+		self.sql.execute( "INSERT INTO temp.diff SELECT hash FROM (SELECT hash, 1 AS n FROM temp.staging WHERE source = ? UNION ALL SELECT hash, -1 FROM temp.stored WHERE hash IS NOT NULL) GROUP BY hash HAVING SUM(n) != 0", (source,) )
+		self.sql.execute("CREATE TEMP TABLE gone(id INTEGER PRIMARY KEY)")
+		self.sql.execute("INSERT INTO temp.gone SELECT id FROM temp.stored WHERE hash IS NULL OR hash IN temp.diff")
+
+		# objects on both sides by range: on both it changed
+		objects, added, removed = self.sql.execute( '''SELECT COUNT(*), TOTAL(new AND NOT old), TOTAL(old AND NOT new) FROM (
+			SELECT lo, hi, MAX(new) AS new, MAX(old) AS old FROM (
+				SELECT MIN(ip_begin) AS lo, MAX(ip_end) AS hi, 1 AS new, 0 AS old FROM temp.staging WHERE source = ? AND hash IN temp.diff GROUP BY hash
+				UNION ALL SELECT MIN(ip_begin), MAX(ip_end), 0, 1 FROM networks WHERE rowid IN temp.gone GROUP BY IFNULL(hash, rowid)
+			) GROUP BY lo, hi
+		)''', (source,) ).fetchone()
+
+		if self.has_text_index():
+			# external content: the text index is told the values it indexed
+			self.sql.execute( "INSERT INTO networks_text(networks_text, rowid, %s) SELECT 'delete', rowid, %s FROM networks WHERE rowid IN temp.gone" % (text, text) )
+		self.sql.execute("DELETE FROM networks WHERE rowid IN temp.gone")
+		# new rowids follow the largest one left
+		last, = self.sql.execute("SELECT IFNULL(MAX(rowid), 0) FROM networks").fetchone()
+		self.sql.execute( "INSERT INTO networks(%s, hash, source) SELECT %s, hash, source FROM temp.staging WHERE source = ? AND hash IN temp.diff" % (columns, columns), (source,) )
+		if self.has_text_index():
+			self.sql.execute( "INSERT INTO networks_text(rowid, %s) SELECT rowid, %s FROM networks WHERE rowid > ?" % (text, text), (last,) )
+		self.sql.execute("DELETE FROM temp.staging WHERE source = ?", (source,))
+		for table in ('stored', 'diff', 'gone'):
+			self.sql.execute("DROP TABLE temp.%s" % table)
+		return { 'added': int(added), 'changed': int(objects - added - removed), 'removed': int(removed) }
+
+	def rebuild_text_index(self):
+		'''
+			FTS5 index of TEXT_PARAMS over the rows of networks (external content), tokenized into trigrams:
+			LIKE patterns with three characters in a row between the wildcards are answered by the index,
+			with the case insensitive LIKE semantics; only rowids are kept (detail=none), FTS5 checks
+			the candidates against the text of the rows
+		'''
+		import sqlite3
+		self.sql.execute("DROP TABLE IF EXISTS networks_text")
+		try:
+			self.sql.execute("CREATE VIRTUAL TABLE networks_text USING fts5(%s, content='networks', tokenize='trigram', detail=none)" % ','.join(TEXT_PARAMS))
+		except sqlite3.OperationalError:
+			# sqlite before 3.34 or without FTS5: text stays searched by scans
+			self.text_index = False
+			return
+		self.sql.execute("INSERT INTO networks_text(networks_text) VALUES('rebuild')")
+		self.text_index = True
+
+	def rebuild_tree(self):
+		'''
+			parent (rowid of the smallest network around it) and depth of every network,
+			by one pass in ip_begin order; of equal ranges the later inserted is the child;
+			only the rows whose parent or depth changes are written
+		'''
+		if not self.has_tree():
+			self.sql.execute("ALTER TABLE networks ADD COLUMN parent INT")
+			self.sql.execute("ALTER TABLE networks ADD COLUMN depth INT")
+			self.tree = True
+		self.sql.execute("CREATE TEMP TABLE IF NOT EXISTS tree(id INTEGER PRIMARY KEY, parent INT, depth INT)")
+		self.sql.execute("DELETE FROM temp.tree")
+		# networks which may still hold the next ones, as (ip_end, rowid, depth)
+		stack = []
+		family = None
+		batch = []
+		for rowid,ip_begin,ip_end,old_parent,old_depth in self.db.execute("SELECT rowid, ip_begin, ip_end, parent, depth FROM networks ORDER BY ip_begin, ip_end DESC, rowid"):
+			if type(ip_begin) is not family:
+				# IPv4 numbers, then IPv6 keys
+				stack, family = [], type(ip_begin)
+			while stack and stack[-1][0] < ip_begin:
+				stack.pop()
+			parent, depth = None, 0
+			for end,id,level in reversed(stack):
+				if end >= ip_end:
+					parent, depth = id, level + 1
+					break
+			stack.append( (ip_end, rowid, depth) )
+			if parent != old_parent or depth != old_depth:
+				batch.append( (rowid, parent, depth) )
+			if len(batch) == 10000:
+				self.sql.executemany("INSERT INTO temp.tree VALUES(?,?,?)", batch)
+				batch = []
+		self.sql.executemany("INSERT INTO temp.tree VALUES(?,?,?)", batch)
+		self.sql.execute("UPDATE networks SET (parent, depth) = (SELECT parent, depth FROM temp.tree WHERE id = networks.rowid) WHERE rowid IN (SELECT id FROM temp.tree)")
+		self.sql.execute("DROP TABLE temp.tree")
+
+	def has_column(self, name):
+		return bool( self.sql.execute("SELECT 1 FROM pragma_table_info('networks') WHERE name = ?", (name,)).fetchone() )
+
+	def has_tree(self):
+		if self.tree is None:
+			self.tree = self.has_column('depth')
+		return self.tree
+
+	def has_text_index(self):
+		if self.text_index is None:
+			self.text_index = bool( self.sql.execute("SELECT 1 FROM sqlite_master WHERE name='networks_text'").fetchone() )
+		return self.text_index
+
+	def text_params(self, params):
+		'''text params searched through networks_text: those with a trigram in every value, the others are scanned faster'''
+		if not self.has_text_index():
+			return ()
+		return tuple( [attr for attr,vals in params.items() if attr in TEXT_PARAMS and all( [has_trigram(val) for val in vals] )] )
+
+	def param_condition(self, attr, p, text=()):
+		if attr in text:
+			return "(t.rowid IN (SELECT rowid FROM networks_text WHERE networks_text.{attr} LIKE {p}.val) )".format(attr=attr, p=p)
+		return param_condition( attr, p, self.has_tree() )
+
+	def plan(self, params):
+		'''(predicate, indexed) of planner calls for params'''
+		from functools import partial
+		text = self.text_params(params)
+		return partial(self.param_condition, text=text), INDEXED_PARAMS + text
+
+	def cache_key(self, search, items, params):
+		'''key of a search in self.cache, None when it is not cached'''
+		if self.cache is None:
+			return None
+		return self.cache.key( self.path, cache.generation(self.db), search, items, params )
+
+	def cached(self, key):
+		'''rows of a search in self.cache, None when they are not there'''
+		found = self.cache.get(key) if key else None
+		return None if found is None else found[0]
+
+	def do_search(self, items, params):
+		self.reopen()
+		key = self.cache_key('do_search', items, params)
+		rows = self.cached(key)
+		if rows is None:
+			params = dict( [(attr,[val]) for attr,val in params.items()] )
+			rows = planner.search( self.sql, 'networks', items, params, bind_param, *self.plan(params) )
+			if key:
+				self.cache.put(key, items, rows)
+		return rows
+
+	def search(self, items, params):
+		self.reopen()
+		key = self.cache_key('search', items, params)
+		rows = self.cached(key)
+		if rows is None:
+			if self.ip_batch(params):
+				rows = self.lookup_ips( items, params['ipaddr'] )
+			else:
+				rows = planner.search( self.sql, 'networks', items, params, bind_param, *self.plan(params) )
+			if key:
+				self.cache.put(key, items, rows)
+		return rows
+
+	def iter_search(self, items, params):
+		self.reopen()
+		key = self.cache_key('search', items, params)
+		rows = self.cached(key)
+		if rows is not None:
+			return iter(rows)
+		if self.ip_batch(params):
+			rows = profile.rows( iter( self.lookup_ips( items, params['ipaddr'] ) ) )
+		else:
+			rows = planner.iter_search( self.sql, 'networks', items, params, bind_param, *self.plan(params) )
+		if key:
+			return self.cache.filling(key, items, rows)
+		return rows
+
+	def ip_batch(self, params):
+		'''-ip searches with enough IPs for one sweep (lookup_ips) to beat a walk up the tree per IP'''
+		if list(params.keys()) != ['ipaddr'] or len(params['ipaddr']) < self.ip_batch_threshold:
+			return False
+		return not self.has_tree() or len( set(params['ipaddr']) ) * SWEEP_RATIO >= self.size()
+
+	def size(self):
+		'''about the number of networks: the largest rowid'''
+		return self.sql.execute("SELECT IFNULL(MAX(rowid), 0) FROM networks").fetchone()[0]
+
+	def aggregate(self, columns, params, group_by=()):
+		self.reopen()
+		return planner.aggregate( self.sql, 'networks', columns, params, bind_param, *self.plan(params), group_by=group_by )
+
+	def stat(self, items, params):
+		'''(number of rows, summary) of a search without keeping its rows'''
+		return stats.query_stat( self, items, 'inetnum', params )
+
+	def groups(self, group_by, params):
+		'''networks and IPs of a search for every combination of group_by values'''
+		return stats.query_groups( self, group_by, params )
+
+	def covering(self, ranges, items=('netname',)):
+		'''
+			most specific network around every (ip_begin, ip_end) of ranges, as a dict of items or None;
+			many ranges are answered by one merge pass over networks ordered by ip_begin
+		'''
+		self.reopen()
+		found = [None] * len(ranges)
+		families = {}
+		for n,(_min,_max) in enumerate(ranges):
+			families.setdefault( type(_min), [] ).append(n)
+		if len(families) > 1:
+			# IPv4 numbers and IPv6 keys do not compare in Python: one pass per family
+			for positions in families.values():
+				for n,network in zip( positions, self.covering( [ranges[n] for n in positions], items ) ):
+					found[n] = network
+			return found
+
+		columns = ','.join(items)
+		if len(ranges) < SWEEP_THRESHOLD:
+			if self.has_tree():
+				query = "SELECT %s FROM networks WHERE rowid = %s" % ( columns, PARENT_WALK.format(lo='?1', hi='?2') )
+			else:
+				query = "SELECT %s FROM networks WHERE ip_begin = (SELECT ip_begin FROM networks WHERE ?1 BETWEEN ip_begin AND ip_end AND ?2 BETWEEN ip_begin AND ip_end ORDER BY ip_begin DESC LIMIT 1) AND ip_end >= ?2 ORDER BY ip_end, rowid DESC LIMIT 1" % columns
+			for n,(_min,_max) in enumerate(ranges):
+				network = self.db.execute( query, (_min, _max) ).fetchone()
+				if network:
+					found[n] = dict( zip(items, network) )
+			return found
+
+		order = sorted( range(len(ranges)), key=lambda n: ranges[n] )
+		networks = self.nested( ranges[order[0]][0], max([_max for _min,_max in ranges]), items )
+		# networks opened so far which still may cover something, outermost at the bottom;
+		# of equal ranges the last inserted ends up on top, as in the per-row query
+		stack = []
+		network = next(networks, None)
+		for n in order:
+			_min, _max = ranges[n]
+			while network is not None and network[0] <= _min:
+				while stack and stack[-1][1] < network[0]:
+					stack.pop()
+				stack.append(network)
+				network = next(networks, None)
+			while stack and stack[-1][1] < _min:
+				stack.pop()
+			for candidate in reversed(stack):
+				if candidate[1] >= _max:
+					found[n] = dict( zip(items, candidate[3:]) )
+					break
+		return found
+
+	def nested(self, lo, hi, items=()):
+		'''
+			cursor of (ip_begin, ip_end, rowid, *items) of the networks overlapping lo..hi, every one before
+			the networks it holds; of equal ranges the later inserted comes later, as in rebuild_tree()
+		'''
+		# the depths of the tree give that order straight from ip_begin_index, without a sort
+		order = "ip_begin, depth" if self.has_tree() else "ip_begin, ip_end DESC, rowid"
+		return self.db.execute( "SELECT ip_begin, ip_end, rowid%s FROM networks WHERE ip_end >= ? AND ip_begin <= ? ORDER BY %s" % ( ''.join([','+item for item in items]), order ), (lo, hi) )
+
+	def enclosing(self, keys):
+		'''
+			(ip_begin, ip_end, rowid) of the networks around every IP of keys (numbers or IPv6 keys), outermost
+			first; few IPs walk up the tree from the deepest network, many (more than a SWEEP_RATIO-th of
+			the networks) are sorted and answered by one sweep over the networks in ip_begin order
+		'''
+		families = {}
+		for key in set(keys):
+			families.setdefault( type(key), [] ).append(key)
+		networks = self.size()
+		chains = {}
+		# IPv4 numbers and IPv6 keys do not compare in Python: one pass per family
+		for family in families.values():
+			family.sort()
+			if self.has_tree() and len(family) * SWEEP_RATIO < networks:
+				chains.update( self.walk(family) )
+			else:
+				chains.update( self.sweep(family) )
+		return [chains.get(key, ()) for key in keys]
+
+	def walk(self, ips):
+		'''{ip: chain} of enclosing() by the deepest network of every IP (PARENT_WALK) and the parents above it'''
+		self.db.execute("DROP TABLE IF EXISTS temp.walk")
+		self.db.execute("CREATE TEMP TABLE walk(ip)")
+		try:
+			self.db.executemany( "INSERT INTO temp.walk VALUES(?)", [(ip,) for ip in ips] )
+			query = "SELECT ip, %s AS id FROM temp.walk WHERE id IS NOT NULL" % PARENT_WALK.format(lo='walk.ip', hi='walk.ip')
+			profile.explain(self.db, query)
+			deepest = dict( self.db.execute(query) )
+		finally:
+			self.db.execute("DROP TABLE temp.walk")
+		# (ip_begin, ip_end, rowid, parent) of the networks on the way up, shared by the IPs below them
+		networks = {}
+		wanted = set( deepest.values() )
+		while wanted:
+			wanted = list(wanted)
+			for i in range(0, len(wanted), 500):
+				chunk = wanted[i:i+500]
+				for network in self.db.execute( "SELECT ip_begin, ip_end, rowid, parent FROM networks WHERE rowid IN (%s)" % ','.join( '?' * len(chunk) ), chunk ):
+					networks[ network[2] ] = network
+			wanted = set( [network[3] for network in networks.values() if network[3] is not None and network[3] not in networks] )
+		chains = {}
+		for ip,rowid in deepest.items():
+			chain = []
+			while rowid is not None:
+				chain.append( networks[rowid][:3] )
+				rowid = networks[rowid][3]
+			chains[ip] = tuple( reversed(chain) )
+		return chains
+
+	def sweep(self, ips):
+		'''{ip: chain} of enclosing() for sorted ips by one merge pass over nested()'''
+		chains = {}
+		networks = self.nested( ips[0], ips[-1] )
+		# networks opened so far which still may hold the next IPs, outermost at the bottom
+		stack = []
+		# chain of the last IP and the end of its first network to end, the next IPs before it share the chain
+		chain, until = None, None
+		network = next(networks, None)
+		for ip in ips:
+			while network is not None and network[0] <= ip:
+				while stack and stack[-1][1] < network[0]:
+					stack.pop()
+				stack.append(network)
+				chain = None
+				network = next(networks, None)
+			while stack and stack[-1][1] < ip:
+				stack.pop()
+				chain = None
+			if stack:
+				if chain is None or until < ip:
+					# ranges overlapping without nesting may leave an ended one below the top
+					chain = tuple( [network for network in stack if network[1] >= ip] )
+					until = min( [network[1] for network in chain] )
+				chains[ip] = chain
+		return chains
+
+	def rows(self, items, rowids):
+		'''{rowid: row of items} of the networks of rowids'''
+		Row = planner.record(items)
+		# in table order
+		rowids = sorted(rowids)
+		rows = {}
+		for i in range(0, len(rowids), 500):
+			chunk = rowids[i:i+500]
+			for result in self.db.execute( "SELECT rowid,%s FROM networks WHERE rowid IN (%s)" % ( ','.join(items), ','.join( '?' * len(chunk) ) ), chunk ):
+				rows[ result[0] ] = Row( result[1:] )
+		return rows
+
+	def lookup_ips(self, items, ips):
+		'''rows of the most specific network of every IP in the order of ips, as -ip searches give them: all networks of that range'''
+		chains = self.enclosing( [cidr_to_min_max(ip)[1] for ip in ips] )
+		# {deepest network: rowids of its range, the equal ones above it included}
+		found = {}
+		for chain in chains:
+			if chain and chain[-1][2] not in found:
+				ip_begin, ip_end, rowid = chain[-1]
+				found[rowid] = [network[2] for network in chain if network[0] == ip_begin and network[1] == ip_end]
+		rows = self.rows( items, set( [rowid for rowids in found.values() for rowid in rowids] ) )
+		return [rows[rowid] for chain in chains if chain for rowid in found[ chain[-1][2] ]]
+
+	def chains(self, items, ips):
+		'''(ip, rows) of every IP: the networks around it from the outermost to the most specific'''
+		self.reopen()
+		chains = self.enclosing( [cidr_to_min_max(ip)[1] for ip in ips] )
+		rows = self.rows( items, set( [network[2] for chain in chains for network in chain] ) )
+		return [( ip, [rows[ network[2] ] for network in chain] ) for ip,chain in zip(ips, chains)]
+
+	def rir_search(self, items, args):
+		return self.search( items, read_params(args) )
+
+	def discover_tree(self, items, netblocks):
+		if self.has_tree():
+			# parent pointers up from the deepest network of that inetnum; equal ranges once
+			network = self.sql.execute("SELECT inetnum, parent FROM networks WHERE inetnum = ? ORDER BY depth DESC LIMIT 1", (netblocks[0]['inetnum'],)).fetchone()
+			deep = 0
+			last = None
+			while network:
+				inetnum, parent = network
+				if inetnum != last:
+					print(" "*deep + inetnum)
+					deep += 1
+					last = inetnum
+				network = self.sql.execute("SELECT inetnum, parent FROM networks WHERE rowid = ?", (parent,)).fetchone() if parent is not None else None
+			return
+		deep = 0
+		while netblocks:
+			inetnum = netblocks[0]['inetnum']
+			print(" "*deep + inetnum)
+			ip_from, ip_to = cidr_to_min_max(inetnum)
+			if isinstance(ip_from, bytes):
+				ip_from, ip_to = max( ipv6.number(ip_from) - 1, 0 ), min( ipv6.number(ip_to) + 1, (1 << ipv6.BITS) - 1 )
+				params = { '_range': [ "%s|%s" % ( ipv6.key(ip_from).hex(), ipv6.key(ip_to).hex() ) ] }
+			else:
+				ip_from -= 1
+				ip_to += 1
+				params = { '_range': [ "%d|%d" % (ip_from, ip_to) ] }
+			netblocks = self.rir_search(items, params)
+			deep += 1
+
+	def subtree(self, items, inetnum):
+		'''
+			networks inside inetnum, each before the ones it holds, as (level, row);
+			one range scan of ip_begin_index, levels come from the depth of rebuild_tree()
+		'''
+		_min, _max = cidr_to_min_max(inetnum)
+		Row = planner.record(items)
+		top = None
+		for result in self.db.execute( "SELECT depth, %s FROM networks WHERE ip_begin BETWEEN ?1 AND ?2 AND ip_end <= ?2 ORDER BY ip_begin, depth" % ','.join(items), (_min, _max) ):
+			if top is None:
+				top = result[0]
+			yield max( result[0] - top, 0 ), Row( result[1:] )
+
+
+def default():
+	'''module-wide RIRDatabase instance behind search() and do_search(), opened on first use'''
+	global default_db
+	if default_db is None:
+		default_db = RIRDatabase().open()
+	return default_db
 
 
-def discover_tree(netblocks):
-	deep = 0
-	while netblocks:
-		inetnum = netblocks[0]['inetnum']
-		print(" "*deep + inetnum)
-		ip_from, ip_to = cidr_to_min_max(inetnum)
-		ip_from -= 1
-		ip_to += 1
-		params = { '_range': [ "%d|%d" % (ip_from, ip_to) ] }
-		netblocks = rir_search(params)
-		deep += 1
+def search(items, params):
+	return default().search(items, params)
 
 
-def print_results(netblocks):
+def do_search(items, params):
+	return default().do_search(items, params)
+
+
+def print_results(netblocks, items):
 	summary = get_stat(netblocks, items)
-	margins = list(map( lambda i: max( list(map( lambda n: len(str(n.get(i) or '')), netblocks )) + [len(i), len(summary[i])] ), items ))
+	margins = list(map( lambda i: max( list(map( lambda v: len(str(v or '')), planner.column(netblocks, i) )) + [len(i), len(summary[i])] ), items ))
 	if len(items) > 1:
 		print_row( tuple(items), margins )
 		print_row( tuple( map( lambda m: '-'*m, margins ) ), margins )
-		for netblock in netblocks:
-			print_row( list(map( lambda i: str( netblock.get(i) or '' ), items )), margins )
+		for values in planner.values(netblocks, items):
+			print_row( list(map( lambda v: str( v or '' ), values )), margins )
 		print_row( tuple( map( lambda m: '-'*m, margins ) ), margins )
 		print_row( tuple( map( lambda i: str( summary.get(i) or '' ), items ) ), margins )
 	else:
-		for netblock in netblocks:
-			print_row( list(map( lambda i: str( netblock.get(i) or '' ), items )), [0] )
+		for values in planner.values(netblocks, items):
+			print_row( list(map( lambda v: str( v or '' ), values )), [0] )
 
 
 def get_stat(netblocks, items):
-	statistics = {}
-	for item in items:
-		if item == 'inetnum':
-			ips = 0
-			for network in [n.get('inetnum') for n in netblocks]:
-				_min,_max = cidr_to_min_max(network)
-				ips += _max - _min
-			statistics[item] = '%d ip' % ips
-		else:
-			vals = set()
-			for val in [str(n.get(item)) or '' for n in netblocks]:
-				vals.add(val)
-			statistics[item] = '%d %s' % ( len(vals), item )
-	return statistics
+	return stats.get_stat(netblocks, items, 'inetnum')
 
 
 def print_row( values, margins ):
-	row = []
-	for i in range( len(values) ):
-		row.append( values[i] + " " * ( margins[i] - len( values[i] ) ) )
-	print(' | '.join(row))
+	print(' | '.join( [value.ljust(margin) for value,margin in zip(values, margins)] ))
 
 
 def main( argv=["-h"] ):
-	global items
-	args = arg_parser.parse_args(argv)
+	args = build_parser().parse_args(argv)
 
 	items = args.items
 	netblocks = []
+	params = {}
+	groups = summary = None
+	subtrees = []
+	chains = []
+	stream = ( args.format != 'table' or args.stats_only or args.group_by ) and not args.tree and not args.subtree and not args.chain
 
 	if args.version:
 		print(__version__)
-	elif args.update != None:
-		if not args.update:
-			args.update = ["afrinic", "lacnic", "apnic", "arin", "ripe"]
-		check_db()
-		for continent in args.update:
-			try:
-				update = globals()['update_'+continent.lower()]
-				reset_db(continent)
-				update()
-			except Exception as e:
-				print("\n{update} error: {error}".format( update=update.__name__, error=str(e) ))
-		rebuild_indexes()
+		return
+	if args.profile or args.profile_out:
+		profile.enable()
+
+	rir = RIRDatabase()
+	# -server answers searches only: -update and -info work on the database here
+	if not args.server or args.update is not None or args.info or args.tree or args.subtree or args.chain:
+		try:
+			rir.open()
+		except Exception:
+			print("permission denied to open %s" % RIR_DB)
+			return
+	if args.cache:
+		rir.cache = cache.ResultCache( os.path.expanduser(args.cache_file), int(args.cache_size * 1e6) )
+
+	if args.update != None:
+		rir.update( args.update, mirror=args.mirror, workers=args.update_workers, incremental=args.incremental )
 	elif args.info:
-		show_db_info()
+		rir.show_db_info()
 	else:
-		params = {}
 		if args.ipaddr:
 			params['ipaddr'] = args.ipaddr
 		if args.inetnum:
@@ -381,21 +892,66 @@ def main( argv=["-h"] ):
 			params['phone'] = args.phone
 		if args.source:
 			params['source'] = args.source
+		if args.group_by:
+			items = list(args.group_by) + ['inetnum']
 		if params:
-			if check_db():
-				netblocks = rir_search( params )
+			with profile.stage('args'):
+				params = read_params(params)
+		profile.start('search')
+		if params and args.server and not args.subtree and not args.chain:
+			from georipe import server
+			netblocks = server.query( args.server, 'rwhois', items, params )['results']
+		elif params:
+			if rir.check_db():
+				if args.subtree:
+					subtrees = [rir.subtree(items, inetnum) for inetnum in params.get('inetnum', [])]
+				elif args.chain:
+					chains = rir.chains( items, params.get('ipaddr', []) )
+				elif args.group_by:
+					groups = rir.groups( args.group_by, params )
+				elif args.stats_only:
+					n, summary = rir.stat( items, params )
+				else:
+					netblocks = rir.iter_search( items, params ) if stream else rir.search( items, params )
 			else:
 				print("please update database")
+				rir.close()
 				return
-
-	if netblocks:
+		profile.stop()
+
+	from georipe import output
+	netblocks = output.numbers(netblocks, items)
+	profile.start('output')
+	if args.subtree and params:
+		for subtree in subtrees:
+			subtree = list(subtree)
+			for (level,_),row in zip( subtree, output.numbers([row for level,row in subtree], items) ):
+				print( " "*level + ' | '.join( [str( v or '' ) for v in row] ) )
+	elif args.chain and params:
+		for ip,rows in chains:
+			print(ip)
+			for level,row in enumerate(output.numbers(rows, items), 1):
+				print( " "*level + ' | '.join( [str( v or '' ) for v in row] ) )
+	elif args.group_by and params:
+		if groups is None:
+			groups = stats.iter_groups(netblocks, args.group_by, 'inetnum')
+		stats.print_table( list(args.group_by) + stats.GROUP_ITEMS, groups )
+	elif args.stats_only and params:
+		if summary is None:
+			n, summary = stats.iter_stat(netblocks, items, 'inetnum')
+		print( stats.line(n, summary, items) )
+	elif stream and params:
+		from georipe import output
+		output.write(netblocks, items, args.format, 'inetnum')
+	elif netblocks:
 		if args.tree and len(netblocks) == 1:
-			discover_tree(netblocks)
+			rir.discover_tree(items, netblocks)
 		else:
-			print_results(netblocks)
+			print_results(netblocks, items)
+	profile.stop()
 
-	if db:
-		db.close()
+	profile.report(args.profile_out)
+	rir.close()
 
 if __name__ == '__main__':
 	main( sys.argv[1:] )
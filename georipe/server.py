@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+import sys,os
+import json
+
+DEFAULT_SOCKET = os.path.join( '/tmp', 'georipe.sock' )
+
+'''
+	one JSON document per line in both directions:
+	-> {"db": "geoip", "items": ["network", "city"], "params": {"ipaddr": ["8.8.8.8"]}}
+	<- {"results": [["8.8.8.0/24", "..."]], "squares": [], "circles": []}
+	every result is an array of the requested items in their order
+	<- {"error": "..."}
+'''
+
+def build_parser():
+	import argparse
+	arg_parser = argparse.ArgumentParser(prog="georipe", description="resident geoip/rwhois query server")
+	commands = arg_parser.add_subparsers(dest='command')
+	serve = commands.add_parser('serve', help='keep databases open and answer queries over a local socket')
+	serve.add_argument("-listen", dest='listen', default=DEFAULT_SOCKET, help='unix socket path or localhost:port (default %s)' % DEFAULT_SOCKET)
+	serve.add_argument("-workers", dest='workers', type=int, default=4, help='read-only connections per database')
+	serve.add_argument("-geoip-db", dest='geoip_db', help='path of geoip.db')
+	serve.add_argument("-rir-db", dest='rir_db', help='path of rir.db')
+	return arg_parser
+
+
+def tcp_address(address):
+	host, _, port = address.rpartition(':')
+	if host and port.isdigit() and not os.path.exists(address):
+		return (host, int(port))
+
+
+class Pool:
+	'''
+		read-only GeoIP/RIRDatabase instances shared by the server threads; an instance whose database
+		was replaced by an update (georipe.shadow) since it was opened is opened again before its query
+	'''
+
+	def __init__(self, workers, geoip_db=None, rir_db=None):
+		import queue
+		import threading
+		from georipe import geoip, rwhois
+		self.paths = { 'geoip': geoip_db or geoip.GEOIP_DB, 'rwhois': rir_db or rwhois.RIR_DB }
+		self.geoip = queue.Queue()
+		self.rwhois = queue.Queue()
+		self.lock = threading.Lock()
+		# (inode, NetworkIndex) shared by the geoip instances of one file
+		self.network_index = None
+		for n in range(workers):
+			self.geoip.put( self.open('geoip') )
+			self.rwhois.put( self.open('rwhois') )
+
+	def open(self, db):
+		from georipe import geoip, rwhois
+		if db == 'geoip':
+			instance = geoip.GeoIP( self.paths[db], readonly=True ).open()
+			if instance.check_db():
+				with self.lock:
+					if self.network_index is None or self.network_index[0] != instance.inode:
+						self.network_index = ( instance.inode, geoip.NetworkIndex(instance.sql) )
+					instance.network_index = self.network_index[1]
+				instance.ip_batch_threshold = 1
+		else:
+			instance = rwhois.RIRDatabase( self.paths[db], readonly=True ).open()
+		return instance
+
+	def query(self, request):
+		if request.get('db') not in ('geoip', 'rwhois'):
+			raise ValueError("unknown db %r" % request.get('db'))
+		from georipe import geoip, rwhois, shadow
+		module = geoip if request['db'] == 'geoip' else rwhois
+		if not isinstance(request.get('items'), list) or not isinstance(request.get('params'), dict):
+			raise ValueError("items must be a list and params an object")
+		# both go into the SQL statements: only the columns and the options of the command line
+		for item in request['items']:
+			if item not in module.COLUMNS:
+				raise ValueError("unknown item %r" % item)
+		for attr,vals in request['params'].items():
+			if attr not in module.PARAMS:
+				raise ValueError("unknown search parameter %r" % attr)
+			# a string would be searched character by character
+			if not isinstance(vals, list) or not all( [isinstance(val, str) for val in vals] ):
+				raise ValueError("values of %r must be a list of strings" % attr)
+		pool = getattr(self, request['db'])
+		instance = pool.get()
+		try:
+			# GeoIP.reopen() would too, without the NetworkIndex shared by the pool
+			if shadow.file_id(instance.path) != instance.inode:
+				instance.close()
+				instance = self.open( request['db'] )
+			results = instance.search( request['items'], request['params'] )
+			return {
+				'results': results,
+				'squares': getattr(instance, 'squares', []),
+				'circles': getattr(instance, 'circles', [])
+			}
+		finally:
+			pool.put(instance)
+
+	def close(self):
+		for pool in (self.geoip, self.rwhois):
+			while not pool.empty():
+				pool.get().close()
+
+
+def serve(listen=DEFAULT_SOCKET, workers=4, geoip_db=None, rir_db=None):
+	import socketserver
+	from georipe import ipv6
+
+	pool = Pool(workers, geoip_db, rir_db)
+
+	class Handler(socketserver.StreamRequestHandler):
+		def handle(self):
+			for line in self.rfile:
+				try:
+					reply = pool.query( json.loads(line) )
+				except Exception as e:
+					reply = { 'error': str(e) }
+				# IPv6 ip_begin/ip_end (16-byte keys) are sent as numbers
+				self.wfile.write( json.dumps(reply, default=ipv6.number).encode() + b'\n' )
+				self.wfile.flush()
+
+	address = tcp_address(listen)
+	if address:
+		socketserver.ThreadingTCPServer.allow_reuse_address = True
+		server = socketserver.ThreadingTCPServer(address, Handler)
+	else:
+		if os.path.exists(listen):
+			os.unlink(listen)
+		server = socketserver.ThreadingUnixStreamServer(listen, Handler)
+	server.daemon_threads = True
+	print("listening on %s" % listen)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		pool.close()
+		if not address and os.path.exists(listen):
+			os.unlink(listen)
+
+
+class Client:
+	'''connection to a running "georipe serve", reused across queries'''
+
+	def __init__(self, address=DEFAULT_SOCKET):
+		import socket
+		tcp = tcp_address(address)
+		if tcp:
+			self.sock = socket.create_connection(tcp)
+		else:
+			self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.sock.connect(address)
+		self.stream = self.sock.makefile('rwb')
+
+	def query(self, db, items, params):
+		self.stream.write( json.dumps({ 'db': db, 'items': items, 'params': params }).encode() + b'\n' )
+		self.stream.flush()
+		from georipe import planner
+		reply = json.loads( self.stream.readline() )
+		if 'error' in reply:
+			raise Exception(reply['error'])
+		Row = planner.record(items)
+		reply['results'] = [Row(result) for result in reply['results']]
+		return reply
+
+	def close(self):
+		self.stream.close()
+		self.sock.close()
+
+
+def query(address, db, items, params):
+	client = Client(address)
+	try:
+		return client.query(db, items, params)
+	finally:
+		client.close()
+
+
+def main( argv=['-h'] ):
+	args = build_parser().parse_args(argv)
+	if args.command == 'serve':
+		serve(args.listen, args.workers, args.geoip_db, args.rir_db)
+	else:
+		build_parser().print_help()
+
+if __name__ == '__main__':
+	main( sys.argv[1:] )
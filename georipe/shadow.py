@@ -0,0 +1,85 @@
+'''
+	updates build a shadow of the database next to it (geoip.db.new, rir.db.new), index, analyze and
+	verify it there and put it in place with one rename: queries go on against the old file the
+	whole time, connections opened before the rename keep reading it, and an import which fails or
+	comes out short leaves the database as it was
+'''
+import os
+
+SUFFIX = '.new'
+# rows ANALYZE samples per index: the planner needs the shape, not exact counts
+ANALYSIS_LIMIT = 1000
+# a table (or registry) left with fewer rows than this part of the old ones is a broken import
+MIN_RATIO = 0.5
+
+
+def file_id(path):
+	'''(device, inode) of the file at path, None when there is none: another one once replace() put a shadow there'''
+	try:
+		st = os.stat(path)
+	except OSError:
+		return None
+	return (st.st_dev, st.st_ino)
+
+
+def create(path, copy=False):
+	'''path of a new shadow of the database at path, empty or a copy of it (copy) taken while it is read'''
+	import sqlite3
+	shadow = path + SUFFIX
+	# left by an update which was killed
+	discard(shadow)
+	if copy and os.path.exists(path):
+		source = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+		target = sqlite3.connect(shadow)
+		try:
+			source.backup(target)
+		finally:
+			target.close()
+			source.close()
+	return shadow
+
+
+def prepare(db):
+	'''no journal on disk nor syncs while building: the shadow is thrown away, not recovered, if it breaks'''
+	db.execute("PRAGMA synchronous=OFF")
+	db.execute("PRAGMA journal_mode=MEMORY")
+	db.execute("PRAGMA cache_size=-65536")
+
+
+def analyze(db):
+	'''planner statistics (sqlite_stat1) of the finished shadow'''
+	db.execute("PRAGMA analysis_limit=%d" % ANALYSIS_LIMIT)
+	db.execute("ANALYZE")
+	db.commit()
+
+
+def verify(before, after):
+	'''problems of the counts of rows "after" an import against those "before" it, {name: rows}'''
+	problems = []
+	if not sum( after.values() ):
+		problems.append("no rows imported")
+	for name,rows in before.items():
+		if after.get(name, 0) < rows * MIN_RATIO:
+			problems.append( "%s: %d rows instead of %d" % ( name, after.get(name, 0), rows ) )
+	return problems
+
+
+def replace(shadow, path):
+	'''puts the closed shadow in place of the database at path, on disk before the rename is'''
+	fd = os.open(shadow, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+	os.replace(shadow, path)
+	fd = os.open( os.path.dirname( os.path.abspath(path) ), os.O_RDONLY )
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+def discard(shadow):
+	for name in (shadow, shadow + '-journal'):
+		if os.path.exists(name):
+			os.unlink(name)
@@ -0,0 +1,209 @@
+'''
+	geoip table as one binary file for IP lookups without sqlite: sorted begin/end arrays
+	(uint32 for IPv4, 16-byte keys for IPv6), per-row indexes into a table of distinct
+	locations and a table of distinct strings, float32 coordinates. The reader maps the file
+	and wraps numpy arrays around it, so opening costs nothing and processes share its pages
+'''
+import os
+import struct
+
+SNAPSHOT = os.path.join( os.path.dirname(__file__), 'geoip.snapshot' )
+MAGIC = b'GEOSNAP1'
+HEADER = struct.Struct('<8s5I')
+NONE = 0xffffffff
+ITEMS = ('network', 'asn', 'org', 'continent', 'country', 'city', 'lat', 'long', 'ip_begin', 'ip_end')
+
+
+def layout(ipv4, ipv6, locations, strings, text):
+	'''(name, dtype, count) of every section in file order'''
+	rows = ipv4 + ipv6
+	return [
+		('begin4', '<u4', ipv4), ('end4', '<u4', ipv4),
+		('begin6', 'S16', ipv6), ('end6', 'S16', ipv6),
+		('location', '<u4', rows), ('asn', '<u4', rows), ('org', '<u4', rows),
+		('continent', '<u4', locations), ('country', '<u4', locations), ('city', '<u4', locations),
+		('lat', '<f4', locations), ('long', '<f4', locations),
+		('offsets', '<u4', strings + 1), ('text', 'u1', text)
+	]
+
+
+def align(offset):
+	return (offset + 7) & ~7
+
+
+def export(sql, path=SNAPSHOT):
+	'''writes the geoip table of cursor "sql"; the file is replaced at once, readers keep the old one'''
+	import numpy
+
+	strings = {}
+	def string(value):
+		if value is None:
+			return NONE
+		n = strings.get(value)
+		if n is None:
+			n = strings[value] = len(strings)
+		return n
+
+	def coordinate(value):
+		# None rather than NaN in the keys of locations: NaN never equals itself
+		return None if value in (None, '') else value
+
+	locations = {}
+	begin4, end4, begin6, end6, rows = [], [], [], [], []
+	# integers sort before BLOBs: all IPv4 rows come first
+	for ip_begin,ip_end,asn,org,continent,country,city,lat,lon in sql.execute("SELECT ip_begin, ip_end, asn, org, continent, country, city, lat, long FROM geoip ORDER BY ip_begin"):
+		if isinstance(ip_begin, bytes):
+			begin6.append(ip_begin)
+			end6.append(ip_end)
+		else:
+			begin4.append(ip_begin)
+			end4.append(ip_end)
+		location = ( string(continent), string(country), string(city), coordinate(lat), coordinate(lon) )
+		rows.append( ( locations.setdefault( location, len(locations) ), string(asn), string(org) ) )
+
+	text = [s.encode() for s in strings]
+	offsets = numpy.cumsum( [0] + [len(s) for s in text], dtype='<u4' )
+	rows = numpy.array(rows, dtype='<u4').reshape(-1, 3)
+	places = list(locations)
+	sections = {
+		'begin4': numpy.array(begin4, dtype='<u4'), 'end4': numpy.array(end4, dtype='<u4'),
+		'begin6': numpy.array(begin6, dtype='S16'), 'end6': numpy.array(end6, dtype='S16'),
+		'location': rows[:,0], 'asn': rows[:,1], 'org': rows[:,2],
+		'continent': numpy.array( [p[0] for p in places], dtype='<u4' ),
+		'country': numpy.array( [p[1] for p in places], dtype='<u4' ),
+		'city': numpy.array( [p[2] for p in places], dtype='<u4' ),
+		'lat': numpy.array( [numpy.nan if p[3] is None else p[3] for p in places], dtype='<f4' ),
+		'long': numpy.array( [numpy.nan if p[4] is None else p[4] for p in places], dtype='<f4' ),
+		'offsets': offsets, 'text': numpy.frombuffer( b''.join(text), dtype='u1' )
+	}
+
+	counts = ( len(begin4), len(begin6), len(places), len(text), int(offsets[-1]) )
+	tmp = path + '.tmp'
+	with open(tmp, 'wb') as f:
+		f.write( HEADER.pack(MAGIC, *counts) )
+		for name,dtype,count in layout(*counts):
+			f.write( b'\0' * ( align( f.tell() ) - f.tell() ) )
+			f.write( numpy.ascontiguousarray( sections[name], dtype=dtype ).tobytes() )
+	os.replace(tmp, path)
+	return len(rows)
+
+
+class Snapshot:
+	'''read-only view of a snapshot file; lookup() gives the rows GeoIP.search() gives for -ip'''
+
+	def __init__(self, path=SNAPSHOT):
+		import mmap
+		import numpy
+		with open(path, 'rb') as f:
+			self.map = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+		magic, *counts = HEADER.unpack_from(self.map)
+		if magic != MAGIC:
+			self.map.close()
+			raise ValueError( "%s is not a geoip snapshot" % path )
+		self.ipv4, self.ipv6 = counts[:2]
+		self.sections = {}
+		offset = HEADER.size
+		for name,dtype,count in layout(*counts):
+			offset = align(offset)
+			self.sections[name] = numpy.frombuffer(self.map, dtype=dtype, count=count, offset=offset)
+			offset += count * numpy.dtype(dtype).itemsize
+
+	def close(self):
+		# the arrays point into the map, which can not close while they exist
+		self.sections = {}
+		self.map.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def find(self, ips):
+		'''row of the network containing each IP (text), -1 where there is none'''
+		import numpy
+		from georipe.geoip import cidr_to_min_max, find_ranges
+		keys = numpy.array( [cidr_to_min_max(ip)[1] for ip in ips], dtype=object )
+		is_ipv6 = numpy.array( [isinstance(key, bytes) for key in keys.tolist()], dtype=bool )
+		rows = numpy.full( len(keys), -1, dtype='i8' )
+		for begin,end,first,where in ( ('begin4', 'end4', 0, ~is_ipv6), ('begin6', 'end6', self.ipv4, is_ipv6) ):
+			ip_begin, ip_end = self.sections[begin], self.sections[end]
+			if len(ip_begin) and where.any():
+				pos = find_ranges( ip_begin, ip_end, keys[where].astype(ip_begin.dtype) )
+				rows[where] = numpy.where(pos >= 0, pos + first, -1)
+		return rows
+
+	def string(self, n, cache):
+		if n == NONE:
+			return None
+		value = cache.get(n)
+		if value is None:
+			offsets = self.sections['offsets']
+			value = cache[n] = self.sections['text'][ offsets[n] : offsets[n+1] ].tobytes().decode()
+		return value
+
+	def keys(self, side, rows):
+		'''ip_begin ("begin") or ip_end ("end") of rows: numbers for IPv4, 16-byte keys for IPv6'''
+		import numpy
+		from georipe import ipv6
+		is_ipv4 = rows < self.ipv4
+		if is_ipv4.all():
+			return self.sections[side + '4'][rows].tolist()
+		keys = numpy.empty( len(rows), dtype=object )
+		keys[is_ipv4] = self.sections[side + '4'][ rows[is_ipv4] ].tolist()
+		# numpy drops trailing zero bytes of S16 values
+		keys[~is_ipv4] = [key.ljust(ipv6.KEY_BYTES, b'\0') for key in self.sections[side + '6'][ rows[~is_ipv4] - self.ipv4 ].tolist()]
+		return keys.tolist()
+
+	def networks(self, rows):
+		'''CIDR text of rows, computed from the ranges: GeoLite blocks are CIDRs'''
+		import numpy
+		is_ipv4 = rows < self.ipv4
+		begin, end = self.sections['begin4'][ rows[is_ipv4] ].astype('i8'), self.sections['end4'][ rows[is_ipv4] ].astype('i8')
+		# mask bits from the size, a power of two
+		prefix = 33 - numpy.frexp( (end - begin + 1).astype('f8') )[1]
+		ipv4_networks = list( map( '%d.%d.%d.%d/%d'.__mod__, zip( (begin >> 24).tolist(), (begin >> 16 & 255).tolist(), (begin >> 8 & 255).tolist(), (begin & 255).tolist(), prefix.tolist() ) ) )
+		if is_ipv4.all():
+			return ipv4_networks
+		networks = numpy.empty( len(rows), dtype=object )
+		networks[is_ipv4] = ipv4_networks
+		ipv6_rows = rows[~is_ipv4]
+		networks[~is_ipv4] = [network(b, e) for b,e in zip( self.keys('begin', ipv6_rows), self.keys('end', ipv6_rows) )]
+		return networks.tolist()
+
+	def column(self, item, rows):
+		'''values of item for an array of rows'''
+		import numpy
+		sections = self.sections
+		if item == 'ip_begin':
+			return self.keys('begin', rows)
+		elif item == 'ip_end':
+			return self.keys('end', rows)
+		elif item == 'network':
+			return self.networks(rows)
+		elif item in ('asn', 'org'):
+			cache = {}
+			return [self.string(n, cache) for n in sections[item][rows].tolist()]
+		elif item in ('continent', 'country', 'city'):
+			cache = {}
+			return [self.string(n, cache) for n in sections[item][ sections['location'][rows] ].tolist()]
+		elif item in ('lat', 'long'):
+			# float32 keeps the 4 decimals of GeoLite coordinates
+			return ['' if v != v else v for v in numpy.round( sections[item][ sections['location'][rows] ].astype('f8'), 4 ).tolist()]
+		raise ValueError( "unknown item '%s', use %s" % ( item, ','.join(ITEMS) ) )
+
+	def lookup(self, items, ips):
+		'''rows of items for every IP with a network, in the order of ips; one row per network'''
+		import numpy
+		from georipe import planner
+		Row = planner.record(items)
+		rows = self.find(ips)
+		found, inverse = numpy.unique( rows[rows >= 0], return_inverse=True )
+		records = [Row(values) for values in zip( *[self.column(item, found) for item in items] )]
+		return [records[n] for n in inverse.tolist()]
+
+
+def network(ip_begin, ip_end):
+	'''CIDR text of an IPv6 range'''
+	from georipe import ipv6
+	return '%s/%d' % ( ipv6.text(ip_begin), ipv6.BITS + 1 - ( ipv6.number(ip_end) - ipv6.number(ip_begin) + 1 ).bit_length() )
@@ -0,0 +1,138 @@
+'''
+	summary of a search: number of rows, IPs of the range column ("network", "inetnum")
+	and distinct values of every other column; computed by SQL aggregates when the
+	rows are not needed, otherwise in one pass over the rows
+'''
+from georipe import planner
+
+DISTINCT_LIMIT = 100000
+# IPs of the rows as two columns, added up by ip_count(): IPv4 by SQLite and IPv6, whose keys are
+# BLOBs, by ip6_total() (georipe.ipv6.register) as text, exact where a 64-bit integer or a float is not
+IP_COUNT = [
+	"IFNULL( SUM(t.ip_end - t.ip_begin + 1) FILTER (WHERE typeof(t.ip_end) = 'integer'), 0 )",
+	"IFNULL( ip6_total(t.ip_begin, t.ip_end) FILTER (WHERE typeof(t.ip_end) = 'blob'), '0' )"
+]
+
+
+def block_size(cidr):
+	network, _, mask = cidr.partition('/')
+	bits = 128 if network.find(':') != -1 else 32
+	return 1 << ( bits - int( mask or bits ) )
+
+
+def ip_count(ipv4, ipv6):
+	return int(ipv4) + int(ipv6)
+
+
+def format_stat(items, range_item, counts, full=()):
+	statistics = {}
+	for item,count in zip(items, counts):
+		if item == range_item:
+			statistics[item] = '%d ip' % count
+		else:
+			statistics[item] = '%d%s %s' % ( count, '+' if item in full else '', item )
+	return statistics
+
+
+def line(n, statistics, items):
+	return "%d rows: %s" % ( n, ' | '.join( [statistics[i] for i in items] ) )
+
+
+class Summary:
+	'''
+		summary built row by row for streamed rows; distinct values are counted
+		exactly up to "limit" per item and shown as "N+" beyond it
+	'''
+
+	def __init__(self, items, range_item, limit=DISTINCT_LIMIT):
+		self.items = items
+		self.range_item = range_item
+		self.limit = limit
+		self.rows = 0
+		self.ips = 0
+		self.values = dict( [(item, set()) for item in items] )
+		self.full = set()
+
+	def add(self, row):
+		'''row: values of the items, in their order'''
+		self.rows += 1
+		for item,value in zip(self.items, row):
+			if item == self.range_item:
+				self.ips += block_size(value)
+			elif item not in self.full:
+				values = self.values[item]
+				values.add(value)
+				if len(values) >= self.limit:
+					self.full.add(item)
+					values.clear()
+
+	def stat(self):
+		counts = [self.ips if item == self.range_item else self.limit if item in self.full else len(self.values[item]) for item in self.items]
+		return format_stat(self.items, self.range_item, counts, self.full)
+
+
+def get_stat(rows, items, range_item):
+	'''summary of a list of rows, one column at a time'''
+	counts = []
+	for item in items:
+		if item == range_item:
+			counts.append( sum( map( block_size, planner.column(rows, item) ) ) )
+		else:
+			counts.append( len( set( planner.column(rows, item) ) ) )
+	return format_stat(items, range_item, counts)
+
+
+def iter_stat(rows, items, range_item):
+	'''(number of rows, summary) of a list or a generator of rows, which are not kept'''
+	summary = Summary(items, range_item)
+	for row in planner.values(rows, items):
+		summary.add(row)
+	return summary.rows, summary.stat()
+
+
+def stat_columns(items, range_item):
+	'''SQL aggregates giving the counts of get_stat(): rows, then one per item and two (IP_COUNT) for range_item'''
+	columns = ["COUNT(*)"]
+	for item in items:
+		if item == range_item:
+			columns += IP_COUNT
+		else:
+			# NULL counts as a value of its own, like None in get_stat()
+			columns.append("COUNT(DISTINCT t.{item}) + (COUNT(*) > COUNT(t.{item}))".format(item=item))
+	return columns
+
+
+def query_stat(database, items, range_item, params):
+	'''(number of rows, summary) by SQL aggregates over the rows database.search() would return'''
+	result = database.aggregate( stat_columns(items, range_item), params )[0]
+	columns = iter( result[1:] )
+	counts = [ip_count( next(columns), next(columns) ) if item == range_item else int( next(columns) ) for item in items]
+	return result[0], format_stat(items, range_item, counts)
+
+
+GROUP_ITEMS = ['count', 'ip']
+
+def query_groups(database, group_by, params):
+	'''rows of group_by values with the number of rows and IPs, most rows first'''
+	groups = database.aggregate( ['t.'+i for i in group_by] + ["COUNT(*)"] + IP_COUNT, params, ['t.'+i for i in group_by] )
+	Row = planner.record( list(group_by) + GROUP_ITEMS )
+	return sorted( [Row( group[:-2] + ( ip_count( group[-2], group[-1] ), ) ) for group in groups], key=lambda group: -group[-2] )
+
+
+def iter_groups(rows, group_by, range_item):
+	'''query_groups() over rows of group_by and range_item'''
+	groups = {}
+	for row in planner.values( rows, list(group_by) + [range_item] ):
+		count = groups.setdefault( row[:-1], [0, 0] )
+		count[0] += 1
+		count[1] += block_size( row[-1] )
+	Row = planner.record( list(group_by) + GROUP_ITEMS )
+	return sorted( [Row( key + tuple(count) ) for key,count in groups.items()], key=lambda group: -group[-2] )
+
+
+def print_table(items, rows):
+	margins = [max( [len(str(v if v is not None else '')) for v in planner.column(rows, item)] + [len(item)] ) for item in items]
+	print( ' | '.join( [item.ljust(margin) for item,margin in zip(items, margins)] ) )
+	print( ' | '.join( ['-'*margin for margin in margins] ) )
+	for values in planner.values(rows, items):
+		print( ' | '.join( [str(v if v is not None else '').ljust(margin) for v,margin in zip(values, margins)] ) )
@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+import sys,os
+import time
+import threading
+from georipe import ipv6
+from georipe.geoip import cidr_to_min_max
+
+WHOIS_CACHE = os.path.join( os.path.expanduser('~'), '.cache', 'georipe', 'whois.db' )
+WHOIS_TTL = 7 * 24 * 3600
+WHOIS_WORKERS = 8
+WHOIS_RATE = 1.0
+
+'''
+	netname resolution through whois for netblocks which are not in the local RIR database:
+	sorted netblocks are split between worker threads, every answer covers a whole
+	netblock of the registry and is kept in an on-disk cache until its TTL expires
+'''
+
+def range_to_min_max(text):
+	'''"1.2.3.0 - 1.2.3.255" or "1.2.3.0/24" as integers, IPv6 as 16-byte keys'''
+	if '-' in text:
+		ip_from, ip_to = text.split('-')
+		return cidr_to_min_max( ip_from.strip() )[0], cidr_to_min_max( ip_to.strip() )[0]
+	return cidr_to_min_max( text.split(',')[0].strip() )
+
+
+class RateLimiter:
+	'''at most "rate" queries per second for every registry'''
+
+	def __init__(self, rate):
+		self.interval = 1.0 / rate if rate > 0 else 0
+		self.next = {}
+		self.lock = threading.Lock()
+
+	def wait(self, registry):
+		with self.lock:
+			now = time.time()
+			slot = max( now, self.next.get(registry, now) )
+			self.next[registry] = slot + self.interval
+		if slot > now:
+			time.sleep(slot - now)
+
+
+class WhoisCache:
+	'''answered netblocks, most specific first; path None keeps them in memory only'''
+
+	def __init__(self, path=WHOIS_CACHE, ttl=WHOIS_TTL):
+		import sqlite3
+		if path:
+			os.makedirs( os.path.dirname( os.path.abspath(path) ), exist_ok=True )
+		self.db = sqlite3.connect(path or ':memory:')
+		self.ttl = ttl
+		self.db.execute("CREATE TABLE IF NOT EXISTS whois(ip_begin INT, ip_end INT, netname TEXT, registry TEXT, fetched REAL, PRIMARY KEY(ip_begin, ip_end))")
+
+	def find(self, _min, _max):
+		result = self.db.execute(
+			"SELECT netname FROM whois WHERE ip_begin <= ? AND ip_end >= ? AND fetched >= ? ORDER BY ip_begin DESC, ip_end LIMIT 1",
+			(_min, _max, time.time() - self.ttl)
+		).fetchone()
+		return result[0] if result else None
+
+	def add(self, answers):
+		self.db.executemany( "INSERT OR REPLACE INTO whois VALUES(?,?,?,?,?)", answers )
+		self.db.commit()
+
+	def close(self):
+		self.db.close()
+
+
+def ipwhois_lookup(ip, limiter):
+	'''(registry, netname, ip_begin, ip_end) through ipwhois, throttled per registry'''
+	from ipwhois import IPWhois
+	from ipwhois.whois import Whois
+	obj = IPWhois(ip)
+	# the registry is only known from the ASN lookup, which has its own rate
+	limiter.wait('asn')
+	asn = obj.ipasn.lookup()
+	registry = asn.get('asn_registry') or 'unknown'
+	limiter.wait(registry)
+	net = Whois(obj.net).lookup(asn_data=asn)['nets'][0]
+	_min, _max = range_to_min_max( net.get('range') or net['cidr'] )
+	return registry, net['name'], _min, _max
+
+
+def server_lookup(server):
+	'''raw whois protocol against one server, e.g. a registry mirror or a local stand-in'''
+	import socket
+	host, _, port = server.partition(':')
+	port = int(port or 43)
+
+	def lookup(ip, limiter):
+		limiter.wait(server)
+		with socket.create_connection( (host, port), timeout=30 ) as s:
+			s.sendall( ip.encode() + b'\r\n' )
+			response = b''
+			while True:
+				data = s.recv(4096)
+				if not data:
+					break
+				response += data
+		netname = block = None
+		for line in response.decode(errors='ignore').splitlines():
+			attr, _, value = line.partition(':')
+			attr = attr.strip().lower()
+			if attr in ('inetnum', 'netrange', 'route', 'cidr') and block is None:
+				block = value.strip()
+			elif attr == 'netname' and netname is None:
+				netname = value.strip()
+		if not block or not netname:
+			raise Exception("no netblock for %s at %s" % (ip, server))
+		_min, _max = range_to_min_max(block)
+		return server, netname, _min, _max
+	return lookup
+
+
+def outermost(ranges):
+	'''ranges which are not inside another one, IPv4 first and by their first address'''
+	kept = []
+	for r in sorted( ranges, key=lambda r: ( isinstance(r[0], bytes), r[0], -ipv6.number(r[1]) if isinstance(r[1], bytes) else -r[1] ) ):
+		if kept and type(kept[-1][0]) is type(r[0]) and r[1] <= kept[-1][1]:
+			continue
+		kept.append(r)
+	return kept
+
+
+def resolve(netblocks, workers=WHOIS_WORKERS, rate=WHOIS_RATE, cache=WHOIS_CACHE, ttl=WHOIS_TTL, server=None):
+	'''netname of every netblock with a "network", None where unknown; failed lookups are reported on stderr'''
+	from concurrent.futures import ThreadPoolExecutor
+
+	lookup = server_lookup(server) if server else ipwhois_lookup
+	limiter = RateLimiter(rate)
+	store = WhoisCache(cache, ttl)
+
+	ranges = {}
+	for n,netblock in enumerate(netblocks):
+		if netblock.get('network'):
+			ranges.setdefault( cidr_to_min_max( netblock['network'] ), [] ).append(n)
+	# IPv4 before IPv6, as SQLite orders integers before BLOBs
+	pending = sorted( [r for r in ranges if store.find(*r) is None], key=lambda r: ( isinstance(r[0], bytes), r ) )
+
+	def worker(chunk):
+		answers = []
+		errors = []
+		covering = None
+		for _min,_max in chunk:
+			if covering and type(covering[0]) is type(_min) and covering[0] <= _min and _max <= covering[1]:
+				continue
+			if isinstance(_min, bytes):
+				ip = ipv6.text(_min)
+			else:
+				ip = '%d.%d.%d.%d' % ( _min>>24, (_min>>16)&255, (_min>>8)&255, _min&255 )
+			try:
+				registry, netname, ip_begin, ip_end = lookup(ip, limiter)
+			except Exception as e:
+				errors.append( "%s: %s" % (ip, e) )
+				continue
+			covering = (ip_begin, ip_end)
+			answers.append( (ip_begin, ip_end, netname, registry, time.time()) )
+		return answers, errors
+
+	errors = []
+	lookups = 0
+	while pending:
+		# netblocks inside others wait for the answers to those, which mostly cover them too:
+		# no two workers look up the same network
+		batch = outermost(pending)
+		lookups += len(batch)
+		workers = max( 1, min(workers, len(batch)) )
+		size = ( len(batch) + workers - 1 ) // workers
+		with ThreadPoolExecutor(workers) as executor:
+			for answers, failed in executor.map( worker, [batch[i:i+size] for i in range(0, len(batch), size)] ):
+				store.add(answers)
+				errors += failed
+		batch = set(batch)
+		pending = [r for r in pending if r not in batch and store.find(*r) is None]
+	if errors:
+		sys.stderr.write( "whois: %d of %d lookups failed, first: %s\n" % ( len(errors), lookups, errors[0] ) )
+
+	netnames = [None] * len(netblocks)
+	for r,indexes in ranges.items():
+		netname = store.find(*r)
+		if netname:
+			for n in indexes:
+				netnames[n] = netname[:20]+'..' if len(netname) > 20 else netname
+	store.close()
+	return netnames
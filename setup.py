@@ -11,12 +11,9 @@ setup(
   bugtrack_url = 'https://github.com/USSCltd/georipe/issues',
   keywords = ['geo2ip', 'reverse whois', 'geoip', 'ripe', 'apnic', 'afrinic', 'lacnic', 'arin', 'whois', 'reverse', 'ip2geo', 'networks', 'recon', 'reconnaissance', 'world'],
   classifiers = [],
-  scripts=['bin/geoip', 'bin/rwhois'],
+  scripts=['bin/geoip', 'bin/rwhois', 'bin/georipe'],
   install_requires=[
     'argparse',
-    'netaddr',
-    'pykml',
-    'lxml',
     'ipwhois',
     'folium',
     'numpy'
@@ -0,0 +1,28 @@
+import unittest
+
+from georipe import rwhois
+
+
+class EmptyParamsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.rir = rwhois.RIRDatabase(':memory:').open()
+		self.rir.check_db()
+		self.rir.sql.execute("INSERT INTO networks(ip_begin, ip_end, inetnum, netname, country, source) VALUES(16777216, 16777471, '1.0.0.0/24', 'TEST-NET', 'DE', 'ripe')")
+
+	def tearDown(self):
+		self.rir.close()
+
+	def test_search(self):
+		# e.g. "-ip -" fed by a grep which matched nothing
+		self.assertEqual( self.rir.search( ['inetnum'], {'ipaddr': []} ), [] )
+		self.assertEqual( self.rir.search( ['inetnum'], {'netname': []} ), [] )
+		self.assertEqual( self.rir.search( ['inetnum'], {'ipaddr': [], 'netname': ['test%']} ), [] )
+		self.assertEqual( [row['inetnum'] for row in self.rir.search( ['inetnum'], {'ipaddr': ['1.0.0.1']} )], ['1.0.0.0/24'] )
+
+	def test_stat(self):
+		self.assertEqual( self.rir.stat( ['inetnum', 'netname'], {'ipaddr': []} ), (0, {'inetnum': '0 ip', 'netname': '0 netname'}) )
+
+
+if __name__ == '__main__':
+	unittest.main()